@@ -4,15 +4,32 @@ import pandas as pd
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
+from email.header import Header
 from email import encoders
 import os
 from datetime import datetime
 import logging
+import logging.handlers
 import json
 from typing import List, Dict, Optional
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
 import hashlib
+import hmac
+import secrets
 import threading
 import time
+import re
+import io
+import base64
+import mimetypes
+from email.policy import compat32
+import html
+from html.parser import HTMLParser
+from collections import OrderedDict, Counter
+import atexit
+import queue
+import random
 
 def adapt_datetime(dt):
     return dt.isoformat()
@@ -23,36 +40,244 @@ def convert_datetime(s):
     except:
         return None
 
-class NewsletterManager:
-    def __init__(self, db_path: str = "newsletter.db", config_file: str = "config.json", service_mode: bool = False):
-        self.db_path = db_path
-        self.config_file = config_file
-        self.setup_logging()
-        self.setup_database()
-        self.load_config()
-        # Ne démarrer le thread que si on n'est pas en mode service
-        if not service_mode:
-            self.check_thread = threading.Thread(target=self._check_scheduled_newsletters, daemon=True)
-            self.check_thread.start()
+# Enregistrer les adaptateurs pour les dates (une seule fois par processus)
+sqlite3.register_adapter(datetime, adapt_datetime)
+sqlite3.register_converter("TIMESTAMP", convert_datetime)
+
+# Pragmas appliqués à chaque nouvelle connexion
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=20000",
+)
+
+# Bases dont le schéma a déjà été vérifié dans ce processus
+_schemas_initialises = set()
+_schemas_lock = threading.Lock()
+
+# --- Journalisation ------------------------------------------------------------
+
+class HandlerAsynchrone(logging.handlers.QueueHandler):
+    """Handler qui ne fait que déposer les enregistrements dans une file.
+
+    Un QueueListener les écrit depuis son propre thread dans le fichier (et sur la console) :
+    les boucles d'envoi ne paient ni les écritures disque ni les flush. Le message est formaté
+    ici (formatter du handler), les handlers cibles l'écrivent tel quel.
+
+    Plusieurs processus (workers web, scheduler) écrivent dans le même fichier : la rotation
+    n'est pas faite ici (RotatingFileHandler renommerait le fichier sous les autres processus)
+    mais confiée à un outil externe (logrotate) ; WatchedFileHandler rouvre le fichier dès
+    qu'il a été déplacé.
+    """
     
-    def setup_logging(self):
-        """Configuration des logs"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('newsletter.log'),
-                logging.StreamHandler()
-            ]
+    def __init__(self, fichier: str, console: bool = True):
+        super().__init__(queue.SimpleQueue())
+        cibles = [logging.handlers.WatchedFileHandler(fichier, encoding='utf-8', delay=True)]
+        if console:
+            cibles.append(logging.StreamHandler())
+        self.listener = logging.handlers.QueueListener(self.queue, *cibles)
+        self.listener.start()
+        # Vider la file avant la sortie du processus
+        atexit.register(self.listener.stop)
+
+class JournalLot:
+    """Résumé d'une boucle d'envoi ou d'import : une ligne INFO par lot au lieu d'une par destinataire.
+
+    Les lignes individuelles ne sont gardées que pour une fraction taux_detail des éléments ;
+    les erreurs restent journalisées à part par l'appelant.
+    """
+    
+    def __init__(self, logger: logging.Logger, libelle: str, taille_lot: int = 1000, taux_detail: float = 0.0):
+        self.logger = logger
+        self.libelle = libelle
+        self.taille_lot = taille_lot
+        self.taux_detail = taux_detail
+        self.compteurs = Counter()
+        self.lots = 0
+        self._dans_lot = 0
+        self._debut = time.perf_counter()
+    
+    def compter(self, resultat: str, detail: str = None, *args):
+        """Compte un élément traité (resultat : 'envoye', 'importe'...).
+
+        detail est le format de la ligne échantillonnée et args ses arguments, à la manière de
+        logger.info : la ligne n'est construite que pour les éléments retenus.
+        """
+        self.compteurs[resultat] += 1
+        if detail and self.taux_detail and random.random() < self.taux_detail:
+            self.logger.info(detail, *args)
+        self._dans_lot += 1
+        if self._dans_lot >= self.taille_lot:
+            self._resumer()
+    
+    def terminer(self):
+        """Résume le dernier lot, incomplet"""
+        if self._dans_lot:
+            self._resumer()
+    
+    def _resumer(self):
+        self.lots += 1
+        total = sum(self.compteurs.values())
+        duree = time.perf_counter() - self._debut
+        detail = ', '.join(f"{resultat}: {nombre}" for resultat, nombre in sorted(self.compteurs.items()))
+        self.logger.info(
+            f"{self.libelle} : lot {self.lots} ({self._dans_lot} éléments), {total} au total ({detail}), "
+            f"{total / duree if duree else 0:.0f}/s"
         )
+        self._dans_lot = 0
+
+# --- Tokens de désabonnement signés ---------------------------------------------
+
+class SignataireDesabonnement:
+    """Tokens de désabonnement auto-vérifiables '<id>.<version>.<hmac>' : ni stockage ni index.
+
+    `cles` associe un numéro de version à un secret ; les tokens sont signés avec la version la
+    plus récente et restent vérifiables tant que leur version figure dans `cles` (rotation).
+    `usage` entre dans la dérivation des clés : un token signé pour un usage (suivi des
+    ouvertures et des clics, par exemple) n'est pas accepté pour un autre (désabonnement).
+    """
+    
+    def __init__(self, cles: Dict[int, str], usage: str = 'desabonnement'):
+        self.cles = {
+            int(version): hashlib.sha256(f"newsletter.{usage}:{secret}".encode('utf-8')).digest()
+            for version, secret in cles.items()
+        }
+        self.version = max(self.cles)
+    
+    def _signature(self, subscriber_id: int, version: int) -> str:
+        mac = hmac.new(self.cles[version], f"{subscriber_id}.{version}".encode('ascii'), hashlib.sha256)
+        return base64.urlsafe_b64encode(mac.digest()[:12]).decode('ascii')
+    
+    def signer(self, subscriber_id: int) -> str:
+        return f"{subscriber_id}.{self.version}.{self._signature(subscriber_id, self.version)}"
+    
+    def verifier(self, token: str) -> Optional[int]:
+        """Retourne l'id de l'abonné si le token est valide, None sinon (token historique compris)"""
+        morceaux = token.split('.')
+        if len(morceaux) != 3 or not morceaux[0].isdigit() or not morceaux[1].isdigit():
+            return None
+        subscriber_id, version = int(morceaux[0]), int(morceaux[1])
+        if version not in self.cles:
+            return None
+        if not hmac.compare_digest(morceaux[2], self._signature(subscriber_id, version)):
+            return None
+        return subscriber_id
+
+class NewsletterStorage(ABC):
+    """Interface de stockage utilisée par NewsletterManager"""
+    
+    # Vérifie les tokens signés ; les tokens historiques passent par la colonne token_desabonnement
+    signataire: Optional[SignataireDesabonnement] = None
+    
+    def setup(self):
+        """Prépare le stockage (schéma, migrations éventuelles)"""
+    
+    @abstractmethod
+    def add_subscriber(self, email: str, nom: str, prenom: str, token: Optional[str]) -> bool:
+        """Ajoute un abonné (token historique éventuel), retourne False si l'email existe déjà"""
+    
+    @abstractmethod
+    def add_subscribers_bulk(self, subscribers: List[Dict]) -> int:
+        """Ajoute des abonnés en masse en ignorant les emails existants, retourne le nombre d'ajouts"""
+    
+    @abstractmethod
+    def unsubscribe_by_token(self, token: str) -> bool:
+        """Désabonne l'abonné correspondant au token"""
+    
+    @abstractmethod
+    def unsubscribe_by_email(self, email: str) -> bool:
+        """Désabonne l'abonné correspondant à l'email"""
+    
+    @abstractmethod
+    def create_newsletter(self, titre: str, objet: str, contenu_html: str, contenu_text: str,
+                          police: str, destinataires_cc: Optional[str],
+                          date_envoi_planifie: Optional[datetime]) -> int:
+        """Crée une newsletter et retourne son identifiant"""
+    
+    @abstractmethod
+    def get_newsletter(self, newsletter_id: int) -> Optional[Dict]:
+        """Retourne titre, objet, contenus, police et destinataires_cc d'une newsletter"""
+    
+    @abstractmethod
+    def list_newsletters(self, statut: str = None) -> List[Dict]:
+        """Liste les newsletters (id, titre, statut, date_envoi_planifie), les plus récentes d'abord"""
+    
+    @abstractmethod
+    def get_due_newsletters(self, now: datetime) -> List[Dict]:
+        """Liste les newsletters planifiées dont la date d'envoi est passée"""
+    
+    @abstractmethod
+    def get_active_subscribers(self) -> List[Dict]:
+        """Retourne les abonnés actifs (id, email, nom, prenom, token)"""
+    
+    @abstractmethod
+    def record_envois(self, newsletter_id: int, envois: List[tuple]):
+        """Enregistre les envois [(subscriber_id, statut), ...] en une transaction"""
+    
+    @abstractmethod
+    def mark_newsletter_sent(self, newsletter_id: int):
+        """Marque la newsletter comme envoyée"""
+    
+    @abstractmethod
+    def schedule_newsletter(self, newsletter_id: int, date_envoi: datetime):
+        """Planifie l'envoi d'une newsletter"""
+    
+    @abstractmethod
+    def get_statistics(self) -> Dict:
+        """Retourne abonnes_actifs, total_abonnes, newsletters_envoyees et derniere_newsletter
+        (DjangoStorage y ajoute emails_envoyes et erreurs, lus dans les compteurs globaux)"""
+
+class SQLiteStorage(NewsletterStorage):
+    """Stockage historique dans le fichier newsletter.db (schéma subscribers/newsletters/envois)"""
+    
+    def __init__(self, db_path: str = "newsletter.db"):
+        self.db_path = db_path
         self.logger = logging.getLogger(__name__)
+        # Une connexion persistante par thread (les connexions sqlite3 ne se partagent pas entre threads)
+        self._local = threading.local()
     
-    def setup_database(self):
-        """Initialise la base de données"""
-        conn = sqlite3.connect(self.db_path)
-        # Enregistrer les adaptateurs pour les dates
-        sqlite3.register_adapter(datetime, adapt_datetime)
-        sqlite3.register_converter("TIMESTAMP", convert_datetime)
+    def get_connection(self) -> sqlite3.Connection:
+        """Retourne la connexion persistante du thread courant (créée au premier appel)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # cached_statements : les requêtes répétées réutilisent leur statement préparé
+            conn = sqlite3.connect(self.db_path, cached_statements=256)
+            for pragma in SQLITE_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+        return conn
+    
+    def close(self):
+        """Ferme la connexion du thread courant"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+    
+    @contextmanager
+    def _transaction(self):
+        """Fournit un curseur et valide à la sortie, ou annule pour ne pas laisser
+        de transaction ouverte sur la connexion persistante"""
+        conn = self.get_connection()
+        try:
+            yield conn.cursor()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    
+    def setup(self):
+        """Initialise la base de données (une seule fois par processus et par fichier)"""
+        cle = os.path.abspath(self.db_path)
+        with _schemas_lock:
+            if cle in _schemas_initialises:
+                return
+            self._create_schema()
+            _schemas_initialises.add(cle)
+    
+    def _create_schema(self):
+        """Crée les tables, colonnes et triggers manquants"""
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         # Table des abonnés
@@ -102,8 +327,10 @@ class NewsletterManager:
         # Mettre à jour la structure de la base de données si nécessaire
         self._update_database_structure(cursor)
         
+        # Compteurs pré-agrégés pour les statistiques
+        self._setup_statistiques(cursor)
+        
         conn.commit()
-        conn.close()
         self.logger.info("Base de données initialisée")
     
     def _update_database_structure(self, cursor):
@@ -140,6 +367,396 @@ class NewsletterManager:
             self.logger.error(f"Erreur lors de la mise à jour de la structure: {e}")
             raise
     
+    def _setup_statistiques(self, cursor):
+        """Crée la table des compteurs et les triggers qui la maintiennent à jour"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS statistiques (
+                cle TEXT PRIMARY KEY,
+                valeur INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        # Initialisation à partir des données existantes (une seule fois)
+        cursor.execute("INSERT OR IGNORE INTO statistiques SELECT 'total_abonnes', COUNT(*) FROM subscribers")
+        cursor.execute("INSERT OR IGNORE INTO statistiques SELECT 'abonnes_actifs', COUNT(*) FROM subscribers WHERE statut = 'actif'")
+        cursor.execute("INSERT OR IGNORE INTO statistiques SELECT 'newsletters_envoyees', COUNT(*) FROM newsletters WHERE statut = 'envoye'")
+        
+        triggers = {
+            'stats_subscribers_insert': '''
+                AFTER INSERT ON subscribers BEGIN
+                    UPDATE statistiques SET valeur = valeur + 1 WHERE cle = 'total_abonnes';
+                    UPDATE statistiques SET valeur = valeur + (NEW.statut = 'actif') WHERE cle = 'abonnes_actifs';
+                END
+            ''',
+            'stats_subscribers_update': '''
+                AFTER UPDATE OF statut ON subscribers BEGIN
+                    UPDATE statistiques SET valeur = valeur + (NEW.statut = 'actif') - (OLD.statut = 'actif')
+                    WHERE cle = 'abonnes_actifs';
+                END
+            ''',
+            'stats_subscribers_delete': '''
+                AFTER DELETE ON subscribers BEGIN
+                    UPDATE statistiques SET valeur = valeur - 1 WHERE cle = 'total_abonnes';
+                    UPDATE statistiques SET valeur = valeur - (OLD.statut = 'actif') WHERE cle = 'abonnes_actifs';
+                END
+            ''',
+            'stats_newsletters_insert': '''
+                AFTER INSERT ON newsletters BEGIN
+                    UPDATE statistiques SET valeur = valeur + (NEW.statut = 'envoye') WHERE cle = 'newsletters_envoyees';
+                END
+            ''',
+            'stats_newsletters_update': '''
+                AFTER UPDATE OF statut ON newsletters BEGIN
+                    UPDATE statistiques SET valeur = valeur + (NEW.statut = 'envoye') - (OLD.statut = 'envoye')
+                    WHERE cle = 'newsletters_envoyees';
+                END
+            ''',
+            'stats_newsletters_delete': '''
+                AFTER DELETE ON newsletters BEGIN
+                    UPDATE statistiques SET valeur = valeur - (OLD.statut = 'envoye') WHERE cle = 'newsletters_envoyees';
+                END
+            ''',
+        }
+        for nom, definition in triggers.items():
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {nom} {definition}")
+    
+    def add_subscriber(self, email, nom, prenom, token):
+        try:
+            with self._transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO subscribers (email, nom, prenom, token_desabonnement)
+                    VALUES (?, ?, ?, ?)
+                ''', (email, nom, prenom, token))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+    
+    def add_subscribers_bulk(self, subscribers):
+        imported = 0
+        with self._transaction() as cursor:
+            for sub in subscribers:
+                cursor.execute('''
+                    INSERT OR IGNORE INTO subscribers (email, nom, prenom, token_desabonnement)
+                    VALUES (?, ?, ?, ?)
+                ''', (sub['email'], sub['nom'], sub['prenom'], sub['token']))
+                imported += cursor.rowcount
+        return imported
+    
+    def unsubscribe_by_token(self, token):
+        subscriber_id = self.signataire.verifier(token) if self.signataire else None
+        with self._transaction() as cursor:
+            if subscriber_id is not None:
+                cursor.execute("UPDATE subscribers SET statut = 'desabonne' WHERE id = ?", (subscriber_id,))
+            else:
+                # Token historique (aléatoire, stocké)
+                cursor.execute('''
+                    UPDATE subscribers 
+                    SET statut = 'desabonne' 
+                    WHERE token_desabonnement = ?
+                ''', (token,))
+            return cursor.rowcount > 0
+    
+    def unsubscribe_by_email(self, email):
+        with self._transaction() as cursor:
+            cursor.execute('''
+                UPDATE subscribers 
+                SET statut = 'desabonne' 
+                WHERE email = ?
+            ''', (email,))
+            return cursor.rowcount > 0
+    
+    def create_newsletter(self, titre, objet, contenu_html, contenu_text, police,
+                          destinataires_cc, date_envoi_planifie):
+        with self._transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO newsletters (
+                    titre, objet, contenu_html, contenu_text, 
+                    police, destinataires_cc, date_envoi_planifie
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (titre, objet, contenu_html, contenu_text, police, destinataires_cc, date_envoi_planifie))
+            return cursor.lastrowid
+    
+    def get_newsletter(self, newsletter_id):
+        cursor = self.get_connection().cursor()
+        cursor.execute('''
+            SELECT titre, objet, contenu_html, contenu_text, police, destinataires_cc 
+            FROM newsletters WHERE id = ?
+        ''', (newsletter_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return dict(zip(('titre', 'objet', 'contenu_html', 'contenu_text', 'police', 'destinataires_cc'), row))
+    
+    def list_newsletters(self, statut=None):
+        cursor = self.get_connection().cursor()
+        query = "SELECT id, titre, statut, date_envoi_planifie FROM newsletters"
+        params = ()
+        if statut:
+            query += " WHERE statut = ?"
+            params = (statut,)
+        cursor.execute(query + " ORDER BY date_creation DESC", params)
+        return [
+            {'id': row[0], 'titre': row[1], 'statut': row[2], 'date_envoi_planifie': row[3]}
+            for row in cursor.fetchall()
+        ]
+    
+    def get_due_newsletters(self, now):
+        cursor = self.get_connection().cursor()
+        cursor.execute('''
+            SELECT id, titre, date_envoi_planifie 
+            FROM newsletters 
+            WHERE statut = 'planifie' 
+            AND datetime(date_envoi_planifie) <= datetime(?)
+        ''', (now.strftime('%Y-%m-%d %H:%M:%S'),))
+        return [
+            {'id': row[0], 'titre': row[1], 'date_envoi_planifie': row[2]}
+            for row in cursor.fetchall()
+        ]
+    
+    def get_active_subscribers(self):
+        cursor = self.get_connection().cursor()
+        cursor.execute('''
+            SELECT id, email, nom, prenom, token_desabonnement
+            FROM subscribers 
+            WHERE statut = 'actif'
+        ''')
+        return [
+            {'id': row[0], 'email': row[1], 'nom': row[2], 'prenom': row[3], 'token': row[4]}
+            for row in cursor.fetchall()
+        ]
+    
+    def record_envois(self, newsletter_id, envois):
+        with self._transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO envois (newsletter_id, subscriber_id, statut)
+                VALUES (?, ?, ?)
+            ''', [(newsletter_id, subscriber_id, statut) for subscriber_id, statut in envois])
+    
+    def mark_newsletter_sent(self, newsletter_id):
+        with self._transaction() as cursor:
+            cursor.execute('''
+                UPDATE newsletters 
+                SET statut = 'envoye', date_envoi = CURRENT_TIMESTAMP 
+                WHERE id = ?
+            ''', (newsletter_id,))
+    
+    def schedule_newsletter(self, newsletter_id, date_envoi):
+        with self._transaction() as cursor:
+            cursor.execute('''
+                UPDATE newsletters 
+                SET date_envoi_planifie = ?, statut = 'planifie'
+                WHERE id = ?
+            ''', (date_envoi, newsletter_id))
+    
+    def get_statistics(self):
+        cursor = self.get_connection().cursor()
+        
+        # Compteurs maintenus par les triggers (voir _setup_statistiques)
+        cursor.execute("SELECT cle, valeur FROM statistiques")
+        compteurs = dict(cursor.fetchall())
+        
+        # Dernière newsletter
+        cursor.execute("""
+            SELECT titre, date_envoi 
+            FROM newsletters 
+            WHERE statut = 'envoye' 
+            ORDER BY date_envoi DESC 
+            LIMIT 1
+        """)
+        derniere = cursor.fetchone()
+        
+        return {
+            'abonnes_actifs': compteurs.get('abonnes_actifs', 0),
+            'total_abonnes': compteurs.get('total_abonnes', 0),
+            'newsletters_envoyees': compteurs.get('newsletters_envoyees', 0),
+            'derniere_newsletter': derniere
+        }
+
+class DjangoStorage(NewsletterStorage):
+    """Stockage dans les tables Django (application newsletters), sans second fichier de base"""
+    
+    def __init__(self):
+        # Import différé : new.py reste utilisable sans Django
+        from newsletters.models import Newsletter, Subscriber, Envoi, signataire_desabonnement
+        self.Newsletter = Newsletter
+        self.Subscriber = Subscriber
+        self.Envoi = Envoi
+        self.signataire = signataire_desabonnement()
+    
+    def add_subscriber(self, email, nom, prenom, token):
+        from django.db import IntegrityError, transaction
+        try:
+            with transaction.atomic():
+                self.Subscriber.objects.create(email=email, nom=nom, prenom=prenom, token_desabonnement=token)
+            return True
+        except IntegrityError:
+            return False
+    
+    def add_subscribers_bulk(self, subscribers):
+        from django.db import transaction
+        from newsletters.caches import invalider
+        # Dédoublonner le fichier puis écarter les emails déjà présents
+        par_email = {}
+        for sub in subscribers:
+            par_email.setdefault(sub['email'], sub)
+        existants = set(self.Subscriber.objects.filter(
+            email__in=list(par_email)
+        ).values_list('email', flat=True))
+        nouveaux = [
+            self.Subscriber(email=sub['email'], nom=sub['nom'], prenom=sub['prenom'],
+                            token_desabonnement=sub['token'])
+            for email, sub in par_email.items() if email not in existants
+        ]
+        with transaction.atomic():
+            self.Subscriber.objects.bulk_create(nouveaux, batch_size=500, ignore_conflicts=True)
+        if nouveaux:
+            invalider('abonnes')
+        return len(nouveaux)
+    
+    def unsubscribe_by_token(self, token):
+        from newsletters.caches import invalider
+        from newsletters.stats import enregistrer_desabonnement
+        subscriber_id = self.signataire.verifier(token)
+        filtre = {'pk': subscriber_id} if subscriber_id is not None else {'token_desabonnement': token}
+        nombre = self.Subscriber.objects.filter(**filtre).exclude(statut='desabonne').update(statut='desabonne')
+        if nombre:
+            invalider('abonnes')
+            enregistrer_desabonnement()
+        return nombre > 0
+    
+    def unsubscribe_by_email(self, email):
+        from newsletters.caches import invalider
+        from newsletters.stats import enregistrer_desabonnement
+        nombre = self.Subscriber.objects.filter(email=email).exclude(statut='desabonne').update(statut='desabonne')
+        if nombre:
+            invalider('abonnes')
+            enregistrer_desabonnement()
+        return nombre > 0
+    
+    def create_newsletter(self, titre, objet, contenu_html, contenu_text, police,
+                          destinataires_cc, date_envoi_planifie):
+        newsletter = self.Newsletter.objects.create(
+            titre=titre,
+            objet=objet,
+            contenu_html=contenu_html,
+            contenu_text=contenu_text,
+            police=police,
+            destinataires_cc=destinataires_cc,
+            date_envoi_planifie=date_envoi_planifie,
+        )
+        return newsletter.pk
+    
+    def get_newsletter(self, newsletter_id):
+        return self.Newsletter.objects.filter(pk=newsletter_id).values(
+            'titre', 'objet', 'contenu_html', 'contenu_text', 'police', 'destinataires_cc'
+        ).first()
+    
+    def list_newsletters(self, statut=None):
+        newsletters = self.Newsletter.objects.all()
+        if statut:
+            newsletters = newsletters.filter(statut=statut)
+        return list(newsletters.order_by('-date_creation').values('id', 'titre', 'statut', 'date_envoi_planifie'))
+    
+    def get_due_newsletters(self, now):
+        from django.utils import timezone
+        if timezone.is_naive(now):
+            now = timezone.make_aware(now)
+        return list(self.Newsletter.objects.filter(
+            statut='planifie', date_envoi_planifie__lte=now
+        ).values('id', 'titre', 'date_envoi_planifie'))
+    
+    def get_active_subscribers(self):
+        return [
+            {'id': sub['id'], 'email': sub['email'], 'nom': sub['nom'], 'prenom': sub['prenom'],
+             'token': sub['token_desabonnement']}
+            for sub in self.Subscriber.objects.filter(statut='actif').values(
+                'id', 'email', 'nom', 'prenom', 'token_desabonnement'
+            )
+        ]
+    
+    def record_envois(self, newsletter_id, envois):
+        from collections import defaultdict
+        from django.db import transaction
+        from newsletters.stats import creer_envois, changer_statut_envois
+        statuts = dict(envois)
+        with transaction.atomic():
+            # Un renvoi met à jour l'Envoi existant (contrainte newsletter/abonné unique) :
+            # un UPDATE groupé par couple ancien / nouveau statut
+            transitions = defaultdict(list)
+            ids = list(statuts)
+            for debut in range(0, len(ids), 500):
+                for subscriber_id, ancien in self.Envoi.objects.filter(
+                    newsletter_id=newsletter_id, subscriber_id__in=ids[debut:debut + 500]
+                ).values_list('subscriber_id', 'statut'):
+                    transitions[ancien, statuts.pop(subscriber_id)].append(subscriber_id)
+            for (ancien, nouveau), subscriber_ids in transitions.items():
+                if ancien != nouveau:
+                    changer_statut_envois(newsletter_id, ancien, nouveau, subscriber_ids)
+            # Nouveaux Envois : une insertion groupée par statut, compteurs mis à jour en une fois
+            par_statut = defaultdict(list)
+            for subscriber_id, statut in statuts.items():
+                par_statut[statut].append(subscriber_id)
+            for statut, subscriber_ids in par_statut.items():
+                creer_envois(newsletter_id, subscriber_ids, statut)
+    
+    def mark_newsletter_sent(self, newsletter_id):
+        from django.utils import timezone
+        from newsletters.invalidation import invalider_newsletter
+        self.Newsletter.objects.filter(pk=newsletter_id).update(
+            statut='envoye', date_envoi=timezone.now(), date_modification=timezone.now()
+        )
+        invalider_newsletter(newsletter_id)
+    
+    def schedule_newsletter(self, newsletter_id, date_envoi):
+        from django.utils import timezone
+        from newsletters.invalidation import invalider_newsletter
+        if timezone.is_naive(date_envoi):
+            date_envoi = timezone.make_aware(date_envoi)
+        self.Newsletter.objects.filter(pk=newsletter_id).update(
+            date_envoi_planifie=date_envoi, statut='planifie', date_modification=timezone.now()
+        )
+        invalider_newsletter(newsletter_id)
+    
+    def get_statistics(self):
+        # Compteurs pré-agrégés de stats.py (StatistiquesGlobales) et totaux en cache, sans COUNT à chaque appel
+        from newsletters.stats import get_totaux
+        return get_totaux()
+
+class NewsletterManager:
+    def __init__(self, db_path: str = "newsletter.db", config_file: str = "config.json", service_mode: bool = False,
+                 storage: NewsletterStorage = None):
+        self.db_path = db_path
+        self.config_file = config_file
+        self.setup_logging()
+        # Par défaut, le schéma historique newsletter.db ; DjangoStorage pour partager les tables de l'application web
+        self.storage = storage or SQLiteStorage(db_path)
+        self.setup_database()
+        self.load_config()
+        if self.storage.signataire is None:
+            self.storage.signataire = SignataireDesabonnement({1: self.get_unsubscribe_secret()})
+        # Ne démarrer le thread que si on n'est pas en mode service
+        if not service_mode:
+            self.check_thread = threading.Thread(target=self._check_scheduled_newsletters, daemon=True)
+            self.check_thread.start()
+    
+    def setup_logging(self):
+        """Configuration des logs : fichier tournant et console, écrits hors du thread appelant.
+
+        Seul le logger de ce module est configuré (pas la racine) ; sous Django, la
+        configuration LOGGING du projet lui fournit déjà ses handlers.
+        """
+        self.logger = logging.getLogger(__name__)
+        if not self.logger.handlers:
+            handler = HandlerAsynchrone('newsletter.log')
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+    
+    def setup_database(self):
+        """Initialise le stockage"""
+        self.storage.setup()
+    
     def load_config(self):
         """Charge la configuration email"""
         default_config = {
@@ -164,42 +781,47 @@ class NewsletterManager:
             self.config = default_config
             self.logger.warning(f"Fichier de configuration créé: {self.config_file}. Veuillez le modifier avec vos paramètres SMTP.")
     
-    def generate_unsubscribe_token(self, email: str) -> str:
-        """Génère un token unique pour le désabonnement"""
-        return hashlib.sha256(f"{email}_{datetime.now().isoformat()}".encode()).hexdigest()[:32]
+    def resoudre_static(self, chemin: str) -> Optional[str]:
+        """Retourne le fichier local d'un chemin statique (dossier 'static_dir' de la config)"""
+        dossier = self.config.get('static_dir') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+        fichier = os.path.join(dossier, chemin)
+        return fichier if os.path.isfile(fichier) else None
+    
+    def get_unsubscribe_secret(self) -> str:
+        """Secret de signature des tokens de désabonnement, généré et enregistré au premier usage"""
+        if not self.config.get('unsubscribe_secret'):
+            self.config['unsubscribe_secret'] = secrets.token_hex(32)
+            with open(self.config_file, 'w', encoding='utf-8') as f:
+                json.dump(self.config, f, indent=4, ensure_ascii=False)
+        return self.config['unsubscribe_secret']
+    
+    def generate_unsubscribe_token(self, subscriber_id: int) -> str:
+        """Génère le token signé de désabonnement d'un abonné (aucun stockage nécessaire)"""
+        return self.storage.signataire.signer(subscriber_id)
     
     def import_subscribers_from_excel(self, file_path: str, email_column: str = "email", 
                                     nom_column: str = None, prenom_column: str = None):
         """Importe les abonnés depuis un fichier Excel"""
         try:
             df = pd.read_excel(file_path)
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
             
-            imported = 0
+            subscribers = []
             errors = 0
             
             for _, row in df.iterrows():
                 try:
                     email = row[email_column].strip().lower()
-                    nom = row[nom_column] if nom_column and nom_column in row else None
-                    prenom = row[prenom_column] if prenom_column and prenom_column in row else None
-                    token = self.generate_unsubscribe_token(email)
-                    
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO subscribers (email, nom, prenom, token_desabonnement)
-                        VALUES (?, ?, ?, ?)
-                    ''', (email, nom, prenom, token))
-                    
-                    if cursor.rowcount > 0:
-                        imported += 1
-                    
+                    subscribers.append({
+                        'email': email,
+                        'nom': row[nom_column] if nom_column and nom_column in row else None,
+                        'prenom': row[prenom_column] if prenom_column and prenom_column in row else None,
+                        'token': None,
+                    })
                 except Exception as e:
                     self.logger.error(f"Erreur lors de l'import de {row}: {e}")
                     errors += 1
             
-            conn.commit()
-            conn.close()
+            imported = self.storage.add_subscribers_bulk(subscribers)
             self.logger.info(f"Import terminé: {imported} nouveaux abonnés, {errors} erreurs")
             return imported, errors
             
@@ -220,53 +842,32 @@ class NewsletterManager:
     def _import_from_dataframe(self, df: pd.DataFrame, email_column: str,
                              nom_column: str = None, prenom_column: str = None):
         """Méthode helper pour importer depuis un DataFrame"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        imported = 0
+        subscribers = []
         errors = 0
         
         for _, row in df.iterrows():
             try:
                 email = str(row[email_column]).strip().lower()
-                nom = str(row[nom_column]) if nom_column and nom_column in row and pd.notna(row[nom_column]) else None
-                prenom = str(row[prenom_column]) if prenom_column and prenom_column in row and pd.notna(row[prenom_column]) else None
-                token = self.generate_unsubscribe_token(email)
-                
-                cursor.execute('''
-                    INSERT OR IGNORE INTO subscribers (email, nom, prenom, token_desabonnement)
-                    VALUES (?, ?, ?, ?)
-                ''', (email, nom, prenom, token))
-                
-                if cursor.rowcount > 0:
-                    imported += 1
-                
+                subscribers.append({
+                    'email': email,
+                    'nom': str(row[nom_column]) if nom_column and nom_column in row and pd.notna(row[nom_column]) else None,
+                    'prenom': str(row[prenom_column]) if prenom_column and prenom_column in row and pd.notna(row[prenom_column]) else None,
+                    'token': None,
+                })
             except Exception as e:
                 self.logger.error(f"Erreur lors de l'import de {row}: {e}")
                 errors += 1
         
-        conn.commit()
-        conn.close()
+        imported = self.storage.add_subscribers_bulk(subscribers)
         self.logger.info(f"Import terminé: {imported} nouveaux abonnés, {errors} erreurs")
         return imported, errors
     
     def add_subscriber(self, email: str, nom: str = None, prenom: str = None):
         """Ajoute un abonné manuellement"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            token = self.generate_unsubscribe_token(email)
-            
-            cursor.execute('''
-                INSERT INTO subscribers (email, nom, prenom, token_desabonnement)
-                VALUES (?, ?, ?, ?)
-            ''', (email.strip().lower(), nom, prenom, token))
-            
-            conn.commit()
-            conn.close()
-            self.logger.info(f"Abonné ajouté: {email}")
-            return True
-        except sqlite3.IntegrityError:
+            if self.storage.add_subscriber(email.strip().lower(), nom, prenom, None):
+                self.logger.info(f"Abonné ajouté: {email}")
+                return True
             self.logger.warning(f"Email déjà existant: {email}")
             return False
         except Exception as e:
@@ -276,23 +877,10 @@ class NewsletterManager:
     def unsubscribe_by_token(self, token: str):
         """Désabonne un utilisateur via son token"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE subscribers 
-                SET statut = 'desabonne' 
-                WHERE token_desabonnement = ?
-            ''', (token,))
-            
-            if cursor.rowcount > 0:
-                conn.commit()
-                conn.close()
+            if self.storage.unsubscribe_by_token(token):
                 self.logger.info(f"Utilisateur désabonné avec le token: {token}")
                 return True
-            else:
-                conn.close()
-                return False
+            return False
         except Exception as e:
             self.logger.error(f"Erreur lors du désabonnement: {e}")
             return False
@@ -300,20 +888,7 @@ class NewsletterManager:
     def unsubscribe_by_email(self, email: str):
         """Désabonne un utilisateur via son email"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE subscribers 
-                SET statut = 'desabonne' 
-                WHERE email = ?
-            ''', (email.strip().lower(),))
-            
-            conn.commit()
-            affected = cursor.rowcount
-            conn.close()
-            
-            if affected > 0:
+            if self.storage.unsubscribe_by_email(email.strip().lower()):
                 self.logger.info(f"Utilisateur désabonné: {email}")
                 return True
             return False
@@ -327,9 +902,6 @@ class NewsletterManager:
                          date_envoi_planifie: datetime = None):
         """Crée une nouvelle newsletter avec les paramètres avancés"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             # Si pas d'objet spécifié, utiliser le titre
             if not objet:
                 objet = titre
@@ -337,20 +909,10 @@ class NewsletterManager:
             # Convertir les listes en chaînes JSON
             cc_str = json.dumps(destinataires_cc) if destinataires_cc else None
             
-            cursor.execute('''
-                INSERT INTO newsletters (
-                    titre, objet, contenu_html, contenu_text, 
-                    police, destinataires_cc, date_envoi_planifie
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            newsletter_id = self.storage.create_newsletter(
                 titre, objet, contenu_html, contenu_text or "Version texte non disponible",
                 police, cc_str, date_envoi_planifie
-            ))
-            
-            newsletter_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            )
             
             self.logger.info(f"Newsletter créée: {titre} (ID: {newsletter_id})")
             return newsletter_id
@@ -358,30 +920,18 @@ class NewsletterManager:
             self.logger.error(f"Erreur lors de la création de la newsletter: {e}")
             return None
     
+    def list_newsletters(self, statut: str = None) -> List[Dict]:
+        """Liste les newsletters, éventuellement filtrées par statut"""
+        return self.storage.list_newsletters(statut)
+    
+    def get_due_newsletters(self) -> List[Dict]:
+        """Liste les newsletters planifiées arrivées à échéance"""
+        return self.storage.get_due_newsletters(datetime.now())
+    
     def get_active_subscribers(self) -> List[Dict]:
         """Récupère la liste des abonnés actifs"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT id, email, nom, prenom, token_desabonnement
-                FROM subscribers 
-                WHERE statut = 'actif'
-            ''')
-            
-            subscribers = []
-            for row in cursor.fetchall():
-                subscribers.append({
-                    'id': row[0],
-                    'email': row[1],
-                    'nom': row[2],
-                    'prenom': row[3],
-                    'token': row[4]
-                })
-            
-            conn.close()
-            return subscribers
+            return self.storage.get_active_subscribers()
         except Exception as e:
             self.logger.error(f"Erreur lors de la récupération des abonnés: {e}")
             return []
@@ -390,20 +940,20 @@ class NewsletterManager:
         """Envoie la newsletter aux abonnés avec gestion avancée des destinataires"""
         try:
             # Récupérer la newsletter
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT titre, objet, contenu_html, contenu_text, police, destinataires_cc 
-                FROM newsletters WHERE id = ?
-            ''', (newsletter_id,))
-            newsletter = cursor.fetchone()
+            newsletter = self.storage.get_newsletter(newsletter_id)
             
             if not newsletter:
                 self.logger.error(f"Newsletter {newsletter_id} non trouvée")
                 return False
             
-            titre, objet, contenu_html, contenu_text, police, destinataires_cc = newsletter
+            objet = newsletter['objet']
+            # Images intégrées en CID, puis HTML optimisé une seule fois par version (mis en cache)
+            contenu_html, images = integrer_images_cid(newsletter['contenu_html'], self.resoudre_static)
+            contenu_html = optimiser_html_email(contenu_html)
+            contenu_text = newsletter['contenu_text']
+            police = newsletter['police']
+            entete_police = f'<div style="font-family: {police}, sans-serif;">'
+            destinataires_cc = newsletter['destinataires_cc']
             
             # Convertir la chaîne JSON des CC en liste
             cc_list = json.loads(destinataires_cc) if destinataires_cc else []
@@ -429,76 +979,60 @@ class NewsletterManager:
             
             sent_count = 0
             error_count = 0
+            envois = []
+            
+            # Message compilé une fois (police, lien de désabonnement en balise de fusion) :
+            # chaque abonné ne coûte qu'un assemblage de buffers
+            modele = ModeleMessage(
+                (contenu_text or '') + '\n\nPour vous désabonner: {{unsubscribe_url}}',
+                f'{entete_police}{contenu_html}'
+                '<br><br><small><a href="{{unsubscribe_url}}">Se désabonner</a></small></div>',
+                {
+                    'Subject': objet,
+                    'From': f"{self.config['sender_name']} <{self.config['email_sender']}>",
+                    'Cc': ', '.join(cc_list),
+                    ENTETE_NEWSLETTER: str(newsletter_id),
+                },
+                images,
+            )
             
-            # Liste des destinataires en CCI
-            bcc_emails = [sub['email'] for sub in subscribers]
-            
+            journal = JournalLot(self.logger, f"Envoi de la newsletter {newsletter_id}")
             for subscriber in subscribers:
                 try:
                     # Personnaliser le contenu
-                    html_content = contenu_html
-                    text_content = contenu_text
-                    
-                    # Ajouter le lien de désabonnement
-                    unsubscribe_link = f"http://votre-site.com/unsubscribe?token={subscriber['token']}"
-                    html_content += f'<br><br><small><a href="{unsubscribe_link}">Se désabonner</a></small>'
-                    text_content += f'\n\nPour vous désabonner: {unsubscribe_link}'
-                    
-                    # Créer le message
-                    msg = MIMEMultipart('alternative')
-                    msg['Subject'] = objet
-                    msg['From'] = f"{self.config['sender_name']} <{self.config['email_sender']}>"
+                    valeurs = dict(subscriber)
+                    token = self.generate_unsubscribe_token(subscriber['id'])
+                    valeurs['unsubscribe_url'] = f"http://votre-site.com/unsubscribe?token={token}"
                     
-                    # Ajouter les destinataires en CC si présents
-                    if cc_list:
-                        msg['Cc'] = ', '.join(cc_list)
-                    
-                    # Ajouter les destinataires en CCI
-                    msg['Bcc'] = ', '.join(bcc_emails)
-                    
-                    # Ajouter les versions texte et HTML avec la police spécifiée
-                    html_content = f'<div style="font-family: {police}, sans-serif;">{html_content}</div>'
-                    part1 = MIMEText(text_content, 'plain', 'utf-8')
-                    part2 = MIMEText(html_content, 'html', 'utf-8')
-                    
-                    msg.attach(part1)
-                    msg.attach(part2)
-                    
-                    # Envoyer
-                    server.send_message(msg)
+                    # Envoyer à l'abonné (et aux destinataires en CC)
+                    server.sendmail(
+                        self.config['email_sender'],
+                        [subscriber['email'], *cc_list],
+                        modele.rendre(valeurs, subscriber['email'])
+                    )
                     
                     # Enregistrer l'envoi
                     if not test_email:
-                        cursor.execute('''
-                            INSERT INTO envois (newsletter_id, subscriber_id, statut)
-                            VALUES (?, ?, 'envoye')
-                        ''', (newsletter_id, subscriber['id']))
+                        envois.append((subscriber['id'], 'envoye'))
                     
                     sent_count += 1
-                    self.logger.info(f"Email envoyé à: {subscriber['email']}")
+                    journal.compter('envoye', "Email envoyé à: %s", subscriber['email'])
                     
                 except Exception as e:
                     error_count += 1
+                    journal.compter('erreur')
                     self.logger.error(f"Erreur envoi pour {subscriber['email']}: {e}")
                     
                     if not test_email:
-                        cursor.execute('''
-                            INSERT INTO envois (newsletter_id, subscriber_id, statut)
-                            VALUES (?, ?, 'erreur')
-                        ''', (newsletter_id, subscriber['id']))
+                        envois.append((subscriber['id'], 'erreur'))
             
+            journal.terminer()
             server.quit()
             
-            # Marquer la newsletter comme envoyée
+            # Enregistrer les envois et marquer la newsletter comme envoyée
             if not test_email:
-                cursor.execute('''
-                    UPDATE newsletters 
-                    SET statut = 'envoye', date_envoi = CURRENT_TIMESTAMP 
-                    WHERE id = ?
-                ''', (newsletter_id,))
-            
-            conn.commit()
-            conn.close()
+                self.storage.record_envois(newsletter_id, envois)
+                self.storage.mark_newsletter_sent(newsletter_id)
             
             self.logger.info(f"Envoi terminé: {sent_count} succès, {error_count} erreurs")
             return True
@@ -510,39 +1044,7 @@ class NewsletterManager:
     def get_statistics(self):
         """Retourne les statistiques de la newsletter"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Nombre d'abonnés actifs
-            cursor.execute("SELECT COUNT(*) FROM subscribers WHERE statut = 'actif'")
-            actifs = cursor.fetchone()[0]
-            
-            # Nombre total d'abonnés
-            cursor.execute("SELECT COUNT(*) FROM subscribers")
-            total = cursor.fetchone()[0]
-            
-            # Nombre de newsletters envoyées
-            cursor.execute("SELECT COUNT(*) FROM newsletters WHERE statut = 'envoye'")
-            newsletters_envoyees = cursor.fetchone()[0]
-            
-            # Dernière newsletter
-            cursor.execute("""
-                SELECT titre, date_envoi 
-                FROM newsletters 
-                WHERE statut = 'envoye' 
-                ORDER BY date_envoi DESC 
-                LIMIT 1
-            """)
-            derniere = cursor.fetchone()
-            
-            conn.close()
-            
-            return {
-                'abonnes_actifs': actifs,
-                'total_abonnes': total,
-                'newsletters_envoyees': newsletters_envoyees,
-                'derniere_newsletter': derniere
-            }
+            return self.storage.get_statistics()
         except Exception as e:
             self.logger.error(f"Erreur lors de la récupération des statistiques: {e}")
     
@@ -576,18 +1078,7 @@ class NewsletterManager:
     def planifier_envoi(self, newsletter_id: int, date_envoi: datetime):
         """Planifie l'envoi d'une newsletter pour une date future"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE newsletters 
-                SET date_envoi_planifie = ?, statut = 'planifie'
-                WHERE id = ?
-            ''', (date_envoi, newsletter_id))
-            
-            conn.commit()
-            conn.close()
-            
+            self.storage.schedule_newsletter(newsletter_id, date_envoi)
             self.logger.info(f"Newsletter {newsletter_id} planifiée pour le {date_envoi}")
             return True
         except Exception as e:
@@ -597,22 +1088,11 @@ class NewsletterManager:
     def verifier_envois_planifies(self):
         """Vérifie et envoie les newsletters planifiées"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Récupérer les newsletters planifiées pour maintenant
-            cursor.execute('''
-                SELECT id FROM newsletters 
-                WHERE statut = 'planifie' 
-                AND date_envoi_planifie <= CURRENT_TIMESTAMP
-            ''')
+            newsletters_a_envoyer = self.get_due_newsletters()
             
-            newsletters_a_envoyer = cursor.fetchall()
+            for newsletter in newsletters_a_envoyer:
+                self.send_newsletter(newsletter['id'])
             
-            for (newsletter_id,) in newsletters_a_envoyer:
-                self.send_newsletter(newsletter_id)
-            
-            conn.close()
             return len(newsletters_a_envoyer)
         except Exception as e:
             self.logger.error(f"Erreur lors de la vérification des envois planifiés: {e}")
@@ -622,64 +1102,117 @@ class NewsletterManager:
         """Vérifie périodiquement les newsletters planifiées"""
         while True:
             try:
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                
-                cursor.execute('''
-                    SELECT id, titre, date_envoi_planifie 
-                    FROM newsletters 
-                    WHERE statut = 'planifie' 
-                    AND datetime(date_envoi_planifie) <= datetime(?)
-                ''', (current_time,))
-                
-                newsletters_a_envoyer = cursor.fetchall()
+                newsletters_a_envoyer = self.get_due_newsletters()
                 
                 if newsletters_a_envoyer:
                     self.logger.info(f"Newsletters à envoyer trouvées: {len(newsletters_a_envoyer)}")
-                    for id, titre, date in newsletters_a_envoyer:
-                        self.logger.info(f"Envoi de la newsletter: {titre} (ID: {id})")
-                        self.send_newsletter(id)
-                
-                conn.close()
+                    for newsletter in newsletters_a_envoyer:
+                        self.logger.info(f"Envoi de la newsletter: {newsletter['titre']} (ID: {newsletter['id']})")
+                        self.send_newsletter(newsletter['id'])
             except Exception as e:
                 self.logger.error(f"Erreur lors de la vérification des newsletters planifiées: {e}")
             
             # Attendre 30 secondes avant la prochaine vérification
             time.sleep(30)
 
-def txt_to_html(txt_path, html_path):
-    with open(txt_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    html_lines = [
-        "<html>",
-        "<head>",
-        "<meta charset='utf-8'>",
-        "<meta name='viewport' content='width=device-width, initial-scale=1.0'>",
-        "<style>",
-        "    body { font-family: sans-serif; line-height: 1.6; max-width: 800px; margin: 0 auto; padding: 20px; }",
-        "    .image-container { text-align: center; margin: 20px 0; }",
-        "    .image-container img { max-width: 100%; height: auto; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }",
-        "    .image-caption { color: #666; font-size: 0.9em; margin-top: 8px; font-style: italic; }",
-        "    table { width: 100%; border-collapse: collapse; margin: 15px 0; }",
-        "    th, td { padding: 12px; border: 1px solid #ddd; }",
-        "    th { background-color: #f5f5f5; text-align: left; }",
-        "    h1 { color: #333; border-bottom: 2px solid #eee; padding-bottom: 10px; }",
-        "    h2 { color: #444; margin-top: 30px; }",
-        "    h3 { color: #555; }",
-        "    ul { padding-left: 20px; }",
-        "    li { margin-bottom: 8px; }",
-        "    p { margin-bottom: 15px; }",
-        "</style>",
-        "</head>",
-        "<body>"
-    ]
+# --- Rendu texte -> HTML -------------------------------------------------------
+
+# Motifs précompilés une fois pour toutes
+LIEN_RE = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+GRAS_RE = re.compile(r'\*\*(.*?)\*\*')
+ITALIQUE_RE = re.compile(r'\*(.*?)\*')
+
+# En-tête du document produit par txt_to_html
+HTML_ENTETE = (
+    "<html>",
+    "<head>",
+    "<meta charset='utf-8'>",
+    "<meta name='viewport' content='width=device-width, initial-scale=1.0'>",
+    "<style>",
+    "    body { font-family: sans-serif; line-height: 1.6; max-width: 800px; margin: 0 auto; padding: 20px; }",
+    "    .image-container { text-align: center; margin: 20px 0; }",
+    "    .image-container img { max-width: 100%; height: auto; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }",
+    "    .image-caption { color: #666; font-size: 0.9em; margin-top: 8px; font-style: italic; }",
+    "    table { width: 100%; border-collapse: collapse; margin: 15px 0; }",
+    "    th, td { padding: 12px; border: 1px solid #ddd; }",
+    "    th { background-color: #f5f5f5; text-align: left; }",
+    "    h1 { color: #333; border-bottom: 2px solid #eee; padding-bottom: 10px; }",
+    "    h2 { color: #444; margin-top: 30px; }",
+    "    h3 { color: #555; }",
+    "    ul { padding-left: 20px; }",
+    "    li { margin-bottom: 8px; }",
+    "    p { margin-bottom: 15px; }",
+    "</style>",
+    "</head>",
+    "<body>"
+)
+
+# Préfixes de titres reconnus et balise correspondante
+TITRES = (
+    ("TITRE:", "h1"),
+    ("SOUS-TITRE:", "h2"),
+    ("SECTION:", "h3"),
+)
+
+class RenduCache:
+    """Cache LRU borné des rendus, indexé par une empreinte du contenu (pas par le texte lui-même)"""
+    
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def cle(mode: str, contenu: str) -> str:
+        return f"{mode}:" + hashlib.blake2b(contenu.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def get_or_render(self, mode: str, contenu: str, render):
+        cle = self.cle(mode, contenu)
+        with self._lock:
+            if cle in self._entries:
+                self._entries.move_to_end(cle)
+                self.hits += 1
+                return self._entries[cle]
+            self.misses += 1
+        resultat = render(contenu)
+        with self._lock:
+            self._entries[cle] = resultat
+            self._entries.move_to_end(cle)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return resultat
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+rendu_cache = RenduCache()
+
+def iter_paragraphes_html(text: str):
+    """Génère un paragraphe <p> par bloc séparé d'une ligne vide (liens, **gras**, *italique*)"""
+    for paragraph in text.split('\n\n'):
+        if paragraph.strip():
+            paragraph = LIEN_RE.sub(r'<a href="\g<0>">\g<0></a>', paragraph)
+            paragraph = GRAS_RE.sub(r'<strong>\1</strong>', paragraph)
+            paragraph = ITALIQUE_RE.sub(r'<em>\1</em>', paragraph)
+            yield f'<p>{paragraph}</p>'
+
+def text_to_html(text: str) -> str:
+    """Convertit un texte simple en paragraphes HTML (résultat mis en cache)"""
+    if not text:
+        return ""
+    return rendu_cache.get_or_render('paragraphes', text, lambda t: '\n'.join(iter_paragraphes_html(t)))
+
+def iter_txt_html(lines):
+    """Génère les lignes HTML d'un document texte (titres, tableaux, images, listes)"""
+    yield from HTML_ENTETE
     
     in_list = False
     in_table = False
-    table_rows = []
-    current_image_caption = None
+    table_rows = 0
     
     for line in lines:
         stripped = line.strip()
@@ -690,83 +1223,577 @@ def txt_to_html(txt_path, html_path):
             image_url = image_parts[0]
             caption = image_parts[1].replace("[/CAPTION]", "") if len(image_parts) > 1 else None
             
-            html_lines.append("<div class='image-container'>")
-            html_lines.append(f"<img src='{image_url}' alt='Image' loading='lazy'>")
+            yield "<div class='image-container'>"
+            yield f"<img src='{image_url}' alt='Image' loading='lazy'>"
             if caption:
-                html_lines.append(f"<div class='image-caption'>{caption}</div>")
-            html_lines.append("</div>")
+                yield f"<div class='image-caption'>{caption}</div>"
+            yield "</div>"
             continue
         
         # Gestion des tableaux (format simple avec des tabulations ou des virgules)
         if "\t" in stripped or "," in stripped:
             if not in_table:
                 in_table = True
-                html_lines.append("<table>")
+                yield "<table>"
             
             # Utiliser soit les tabulations soit les virgules comme séparateurs
             separator = "\t" if "\t" in stripped else ","
             cells = [cell.strip() for cell in stripped.split(separator)]
             
             if not table_rows:  # Première ligne = en-tête
-                html_lines.append("<thead><tr>")
+                yield "<thead><tr>"
                 for cell in cells:
-                    html_lines.append(f"<th>{cell}</th>")
-                html_lines.append("</tr></thead><tbody>")
+                    yield f"<th>{cell}</th>"
+                yield "</tr></thead><tbody>"
             else:
-                html_lines.append("<tr>")
+                yield "<tr>"
                 for cell in cells:
-                    html_lines.append(f"<td>{cell}</td>")
-                html_lines.append("</tr>")
+                    yield f"<td>{cell}</td>"
+                yield "</tr>"
             
-            table_rows.append(cells)
+            table_rows += 1
             continue
         elif in_table:
             in_table = False
-            html_lines.append("</tbody></table>")
-            table_rows = []
+            yield "</tbody></table>"
+            table_rows = 0
         
         # Gestion des titres (format simple: TITRE:, SOUS-TITRE:, etc.)
-        if stripped.upper().endswith(":"):
-            if stripped.upper().startswith("TITRE:"):
-                html_lines.append(f"<h1>{stripped[:-1]}</h1>")
-            elif stripped.upper().startswith("SOUS-TITRE:"):
-                html_lines.append(f"<h2>{stripped[:-1]}</h2>")
-            elif stripped.upper().startswith("SECTION:"):
-                html_lines.append(f"<h3>{stripped[:-1]}</h3>")
+        if stripped.endswith(":"):
+            majuscules = stripped.upper()
+            for prefixe, balise in TITRES:
+                if majuscules.startswith(prefixe):
+                    yield f"<{balise}>{stripped[:-1]}</{balise}>"
+                    break
             continue
         
         # Gestion des listes (format simple: - ou * au début de la ligne)
         if stripped.startswith("- ") or stripped.startswith("* "):
             if not in_list:
-                html_lines.append("<ul>")
+                yield "<ul>"
                 in_list = True
-            html_lines.append(f"<li>{stripped[2:]}</li>")
+            yield f"<li>{stripped[2:]}</li>"
             continue
         
         # Gestion des sauts de ligne et paragraphes
         if stripped == "":
             if in_list:
-                html_lines.append("</ul>")
+                yield "</ul>"
                 in_list = False
-            html_lines.append("<br>")
+            yield "<br>"
             continue
         
         # Texte normal
         if in_list:
-            html_lines.append("</ul>")
+            yield "</ul>"
             in_list = False
-        html_lines.append(f"<p>{stripped}</p>")
+        yield f"<p>{stripped}</p>"
     
     # Fermer les balises ouvertes
     if in_list:
-        html_lines.append("</ul>")
+        yield "</ul>"
     if in_table:
-        html_lines.append("</tbody></table>")
+        yield "</tbody></table>"
     
-    html_lines.append("</body></html>")
+    yield "</body></html>"
+
+def render_txt_html(contenu: str) -> str:
+    """Rendu complet d'un document texte en HTML (résultat mis en cache)"""
+    return rendu_cache.get_or_render(
+        'document', contenu, lambda t: "\n".join(iter_txt_html(io.StringIO(t)))
+    )
+
+def write_txt_html(lines, out):
+    """Écrit le HTML au fil de la lecture des lignes, sans garder le document en mémoire"""
+    html_lines = iter_txt_html(lines)
+    out.write(next(html_lines))
+    for html_line in html_lines:
+        out.write("\n")
+        out.write(html_line)
+
+# Au-delà de cette taille, txt_to_html lit et écrit en flux plutôt que via le cache
+TAILLE_MAX_EN_MEMOIRE = 1024 * 1024
+
+def txt_to_html(txt_path, html_path, stream: bool = None):
+    """Convertit un fichier texte en fichier HTML.
+
+    En mode flux (stream=True, ou automatiquement pour les gros fichiers), le source est lu
+    ligne à ligne et le HTML écrit au fur et à mesure ; le résultat est identique octet pour octet.
+    """
+    if stream is None:
+        stream = os.path.getsize(txt_path) > TAILLE_MAX_EN_MEMOIRE
+    
+    if stream:
+        with open(txt_path, "r", encoding="utf-8") as src, open(html_path, "w", encoding="utf-8") as out:
+            write_txt_html(src, out)
+        return
+    
+    with open(txt_path, "r", encoding="utf-8") as f:
+        contenu = f.read()
 
     with open(html_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(html_lines))
+        f.write(render_txt_html(contenu))
+
+# --- Optimisation du HTML des emails --------------------------------------------
+
+# Balises sans fermeture (jamais empilées comme ancêtres)
+BALISES_VIDES = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+# Balises dont le contenu est conservé tel quel
+BALISES_BRUTES = {'pre', 'textarea', 'script', 'style'}
+
+COMMENTAIRE_CSS_RE = re.compile(r'/\*.*?\*/', re.S)
+ESPACES_RE = re.compile(r'\s+')
+# Sélecteur simple : balise, .classe, #id combinés, séparés par des espaces (descendance)
+SELECTEUR_SIMPLE_RE = re.compile(r'^(\*|[a-zA-Z][\w-]*)?((?:[.#][\w-]+)*)$')
+
+def _decouper_declarations(style: str):
+    """Découpe 'prop: valeur; ...' sur les ';' hors parenthèses et guillemets
+    (url(data:image/png;base64,...), content: ';')"""
+    debut = profondeur = 0
+    guillemet = None
+    for index, caractere in enumerate(style):
+        if guillemet:
+            if caractere == guillemet:
+                guillemet = None
+        elif caractere in '"\'':
+            guillemet = caractere
+        elif caractere == '(':
+            profondeur += 1
+        elif caractere == ')':
+            profondeur = max(0, profondeur - 1)
+        elif caractere == ';' and not profondeur:
+            yield style[debut:index]
+            debut = index + 1
+    yield style[debut:]
+
+def _parse_declarations(style: str) -> OrderedDict:
+    """Analyse 'prop: valeur; ...' en dictionnaire ordonné (la dernière déclaration l'emporte)"""
+    declarations = OrderedDict()
+    for declaration in _decouper_declarations(style):
+        if ':' in declaration:
+            prop, valeur = declaration.split(':', 1)
+            prop, valeur = prop.strip().lower(), ESPACES_RE.sub(' ', valeur.strip())
+            if prop and valeur:
+                declarations.pop(prop, None)
+                declarations[prop] = valeur
+    return declarations
+
+def _compiler_selecteur(selecteur: str):
+    """Retourne la liste des composants (balise, classes, id) d'un sélecteur inlinable, ou None"""
+    composants = []
+    for partie in selecteur.split():
+        match = SELECTEUR_SIMPLE_RE.match(partie)
+        if not match or not partie:
+            return None
+        balise = match.group(1)
+        suffixes = re.findall(r'[.#][\w-]+', match.group(2))
+        composants.append((
+            None if balise in (None, '*') else balise.lower(),
+            frozenset(s[1:] for s in suffixes if s[0] == '.'),
+            next((s[1:] for s in suffixes if s[0] == '#'), None),
+        ))
+    return composants or None
+
+def _specificite(composants):
+    return (
+        sum(1 for _, _, id_ in composants if id_),
+        sum(len(classes) for _, classes, _ in composants),
+        sum(1 for balise, _, _ in composants if balise),
+    )
+
+def _extraire_regles(css: str):
+    """Sépare les règles inlinables du CSS à conserver (@media, pseudo-classes, etc.)"""
+    regles = []
+    conserve = []
+    css = COMMENTAIRE_CSS_RE.sub('', css)
+    position = 0
+    while position < len(css):
+        accolade = css.find('{', position)
+        if accolade == -1:
+            break
+        prelude = css[position:accolade].strip()
+        if prelude.startswith('@'):
+            # Bloc imbriqué : conserver tel quel jusqu'à l'accolade fermante correspondante
+            profondeur, fin = 0, accolade
+            while fin < len(css):
+                if css[fin] == '{':
+                    profondeur += 1
+                elif css[fin] == '}':
+                    profondeur -= 1
+                    if profondeur == 0:
+                        break
+                fin += 1
+            conserve.append(ESPACES_RE.sub(' ', css[position:fin + 1].strip()))
+            position = fin + 1
+            continue
+        fin = css.find('}', accolade)
+        if fin == -1:
+            break
+        corps = css[accolade + 1:fin]
+        for selecteur in prelude.split(','):
+            selecteur = selecteur.strip()
+            composants = _compiler_selecteur(selecteur)
+            if composants:
+                regles.append((_specificite(composants), len(regles), composants, _parse_declarations(corps)))
+            elif selecteur:
+                conserve.append(f"{selecteur}{{{';'.join(f'{p}:{v}' for p, v in _parse_declarations(corps).items())}}}")
+        position = fin + 1
+    regles.sort(key=lambda regle: (regle[0], regle[1]))
+    return regles, conserve
+
+def _correspond(composant, element):
+    balise, classes, id_ = composant
+    return ((balise is None or balise == element[0])
+            and classes <= element[1]
+            and (id_ is None or id_ == element[2]))
+
+def _selecteur_applicable(composants, element, ancetres):
+    """Vérifie le dernier composant sur l'élément puis les précédents sur ses ancêtres"""
+    if not _correspond(composants[-1], element):
+        return False
+    index = len(ancetres) - 1
+    for composant in reversed(composants[:-1]):
+        while index >= 0 and not _correspond(composant, ancetres[index]):
+            index -= 1
+        if index < 0:
+            return False
+        index -= 1
+    return True
+
+class _OptimiseurHTML(HTMLParser):
+    """Réécrit le HTML : styles inlinés et dédoublonnés, commentaires et espaces superflus retirés"""
+    
+    def __init__(self, regles):
+        super().__init__(convert_charrefs=False)
+        self.regles = regles
+        self.sortie = []
+        self.ancetres = []
+        self.brut = 0
+    
+    def _attributs(self, tag, attrs):
+        attributs = OrderedDict()
+        for nom, valeur in attrs:
+            attributs[nom] = valeur
+        classes = frozenset((attributs.get('class') or '').split())
+        element = (tag, classes, attributs.get('id'))
+        declarations = OrderedDict()
+        for _, _, composants, regle in self.regles:
+            if _selecteur_applicable(composants, element, self.ancetres):
+                for prop, valeur in regle.items():
+                    declarations.pop(prop, None)
+                    declarations[prop] = valeur
+        # Le style déjà présent sur l'élément reste prioritaire
+        for prop, valeur in _parse_declarations(attributs.get('style') or '').items():
+            declarations.pop(prop, None)
+            declarations[prop] = valeur
+        if declarations:
+            attributs['style'] = ';'.join(f'{prop}:{valeur}' for prop, valeur in declarations.items())
+        else:
+            attributs.pop('style', None)
+        texte = ''.join(
+            f' {nom}' if valeur is None else f' {nom}="{html.escape(valeur, quote=True)}"'
+            for nom, valeur in attributs.items()
+        )
+        return element, texte
+    
+    def handle_starttag(self, tag, attrs):
+        element, attributs = self._attributs(tag, attrs)
+        self.sortie.append(f'<{tag}{attributs}>')
+        if tag not in BALISES_VIDES:
+            self.ancetres.append(element)
+            if tag in BALISES_BRUTES:
+                self.brut += 1
+    
+    def handle_startendtag(self, tag, attrs):
+        _, attributs = self._attributs(tag, attrs)
+        self.sortie.append(f'<{tag}{attributs}/>')
+    
+    def handle_endtag(self, tag):
+        for index in range(len(self.ancetres) - 1, -1, -1):
+            if self.ancetres[index][0] == tag:
+                for element in self.ancetres[index:]:
+                    if element[0] in BALISES_BRUTES:
+                        self.brut -= 1
+                del self.ancetres[index:]
+                break
+        self.sortie.append(f'</{tag}>')
+    
+    def handle_data(self, data):
+        self.sortie.append(data if self.brut else ESPACES_RE.sub(' ', data))
+    
+    def handle_entityref(self, name):
+        self.sortie.append(f'&{name};')
+    
+    def handle_charref(self, name):
+        self.sortie.append(f'&#{name};')
+    
+    def handle_comment(self, data):
+        # Conserver les commentaires conditionnels destinés à Outlook
+        if data.startswith('[if') or data.startswith('<![endif]'):
+            self.sortie.append(f'<!--{data}-->')
+    
+    def handle_decl(self, decl):
+        self.sortie.append(f'<!{decl}>')
+    
+    def unknown_decl(self, data):
+        self.sortie.append(f'<![{data}]>')
+
+STYLE_BLOC_RE = re.compile(r'<style[^>]*>(.*?)</style>', re.S | re.I)
+
+def _optimiser(contenu: str) -> str:
+    regles = []
+    conserve = []
+    for css in STYLE_BLOC_RE.findall(contenu):
+        regles_bloc, conserve_bloc = _extraire_regles(css)
+        regles.extend(regles_bloc)
+        conserve.extend(conserve_bloc)
+    regles.sort(key=lambda regle: (regle[0], regle[1]))
+    # Les règles inlinées disparaissent ; seul le CSS non inlinable reste dans un <style>
+    residuel = f"<style>{''.join(conserve)}</style>" if conserve else ''
+    blocs = iter([residuel])
+    contenu = STYLE_BLOC_RE.sub(lambda match: next(blocs, ''), contenu)
+    optimiseur = _OptimiseurHTML(regles)
+    optimiseur.feed(contenu)
+    optimiseur.close()
+    return ''.join(optimiseur.sortie).strip()
+
+def optimiser_html_email(contenu: str) -> str:
+    """Prépare le HTML d'une newsletter pour l'envoi (CSS inliné, commentaires et espaces retirés).
+
+    Le résultat est mis en cache par empreinte du contenu : chaque version d'une newsletter
+    n'est optimisée qu'une fois, quel que soit le nombre d'envois.
+    """
+    if not contenu:
+        return ""
+    return rendu_cache.get_or_render('email', contenu, _optimiser)
+
+
+# --- Images intégrées (CID) ---------------------------------------------------
+
+STATIC_TAG_RE = re.compile(r'\{%\s*static\s+["\']([^"\']+)["\']\s*%\}')
+
+class CacheImagesInline:
+    """Cache par processus des images encodées en base64, invalidé par mtime/taille du fichier"""
+    
+    def __init__(self):
+        self._entrees = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, chemin: str):
+        """Retourne (cid, type MIME, contenu base64) pour un fichier, lu et encodé une seule fois"""
+        stat = os.stat(chemin)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entree = self._entrees.get(chemin)
+            if entree and entree[0] == signature:
+                self.hits += 1
+                return entree[1]
+            self.misses += 1
+        with open(chemin, 'rb') as f:
+            donnees = f.read()
+        # Le cid dépend du contenu : même image, même référence dans le HTML (et dans le cache de rendu)
+        cid = f"{hashlib.blake2b(donnees, digest_size=12).hexdigest()}@newsletter"
+        type_mime = mimetypes.guess_type(chemin)[0] or 'application/octet-stream'
+        image = (cid, type_mime, base64.encodebytes(donnees).decode('ascii'))
+        with self._lock:
+            self._entrees[chemin] = (signature, image)
+        return image
+    
+    def clear(self):
+        with self._lock:
+            self._entrees.clear()
+            self.hits = 0
+            self.misses = 0
+
+images_inline = CacheImagesInline()
+
+def _partie_image(image, nom: str) -> MIMEBase:
+    cid, type_mime, contenu = image
+    partie = MIMEBase(*type_mime.split('/', 1))
+    # Contenu déjà encodé : aucun ré-encodage par message
+    partie.set_payload(contenu)
+    partie['Content-Transfer-Encoding'] = 'base64'
+    partie['Content-ID'] = f'<{cid}>'
+    partie.add_header('Content-Disposition', 'inline', filename=nom)
+    return partie
+
+def integrer_images_cid(contenu: str, resoudre):
+    """Remplace les balises {% static "..." %} par des références cid:.
+
+    `resoudre` associe un chemin statique à un fichier local (ou None). Les balises non résolues
+    sont laissées telles quelles. Retourne le HTML et la liste des parties MIME à joindre.
+    """
+    parties = OrderedDict()
+    
+    def remplacer(match):
+        chemin = resoudre(match.group(1))
+        if not chemin:
+            return match.group(0)
+        try:
+            image = images_inline.get(chemin)
+        except OSError as e:
+            logging.getLogger(__name__).warning(f"Image {chemin} non intégrée: {e}")
+            return match.group(0)
+        if image[0] not in parties:
+            parties[image[0]] = _partie_image(image, os.path.basename(chemin))
+        return f'cid:{image[0]}'
+    
+    return STATIC_TAG_RE.sub(remplacer, contenu), list(parties.values())
+
+def construire_message(contenu_text: str, contenu_html: str, parties=()) -> MIMEMultipart:
+    """Assemble les versions texte et HTML, dans un multipart/related si des images sont intégrées"""
+    alternative = MIMEMultipart('alternative')
+    alternative.attach(MIMEText(contenu_text, 'plain', 'utf-8'))
+    alternative.attach(MIMEText(contenu_html, 'html', 'utf-8'))
+    if not parties:
+        return alternative
+    message = MIMEMultipart('related')
+    message.attach(alternative)
+    for partie in parties:
+        message.attach(partie)
+    return message
+
+
+# --- Personnalisation par destinataire ------------------------------------------
+
+# En-tête ajouté aux envois : retrouvé dans les rapports de rebond (DSN) pour les attribuer
+ENTETE_NEWSLETTER = 'X-Newsletter-ID'
+
+# Balises de fusion reconnues ; toute autre accolade double est laissée telle quelle
+CHAMPS_FUSION = ('prenom', 'nom', 'email', 'unsubscribe_url', 'pixel_url', 'suivi_token')
+BALISE_FUSION_RE = re.compile(r'\{\{\s*(' + '|'.join(CHAMPS_FUSION) + r')\s*\}\}')
+
+def _base64_lignes(donnees: bytes) -> bytes:
+    """Base64 en lignes de 76 caractères (57 octets), chaque ligne terminée par CRLF"""
+    return b''.join(
+        base64.b64encode(donnees[i:i + 57]) + b'\r\n'
+        for i in range(0, len(donnees), 57)
+    )
+
+class GabaritFusion:
+    """Contenu compilé une fois en segments statiques (bytes) et emplacements {{champ}}"""
+    
+    def __init__(self, contenu: str, echapper: bool = False):
+        self.echapper = echapper
+        morceaux = BALISE_FUSION_RE.split(contenu or "")
+        self.segments = [morceau.encode('utf-8') for morceau in morceaux[::2]]
+        self.champs = morceaux[1::2]
+        self.personnalise = bool(self.champs)
+        self._morceaux = [None] * (len(self.segments) + len(self.champs))
+        self._morceaux[::2] = self.segments
+        # Segments pré-encodés en base64 pour chacun des 3 décalages possibles : le segment
+        # commence par compléter (0 à 2 octets) le groupe de 3 octets laissé par la valeur précédente.
+        # Seuls ces raccords et les valeurs sont encodés par destinataire.
+        self._segments_base64 = []
+        for segment in self.segments:
+            variantes = []
+            for decalage in range(3):
+                fin = decalage + max(0, len(segment) - decalage) // 3 * 3
+                variantes.append((_base64_lignes(segment[decalage:fin]), segment[fin:]))
+            self._segments_base64.append(variantes)
+    
+    def encoder_valeurs(self, valeurs: dict) -> dict:
+        """Encode (et échappe pour le HTML) chaque valeur une seule fois par destinataire"""
+        return {
+            champ: (html.escape(str(valeurs.get(champ) or '')) if self.echapper
+                    else str(valeurs.get(champ) or '')).encode('utf-8')
+            for champ in set(self.champs)
+        }
+    
+    def rendre(self, valeurs: dict) -> bytes:
+        if not self.champs:
+            return self.segments[0]
+        encodees = self.encoder_valeurs(valeurs)
+        morceaux = self._morceaux.copy()
+        morceaux[1::2] = [encodees[champ] for champ in self.champs]
+        return b''.join(morceaux)
+    
+    def rendre_base64(self, valeurs: dict) -> bytes:
+        """Équivalent à un encodage base64 de rendre(), sans ré-encoder les segments statiques"""
+        encodees = self.encoder_valeurs(valeurs) if self.champs else {}
+        sortie = []
+        reste = b''
+        for index, segment in enumerate(self.segments):
+            if index:
+                donnees = reste + encodees[self.champs[index - 1]]
+                coupure = len(donnees) // 3 * 3
+                sortie.append(_base64_lignes(donnees[:coupure]))
+                reste = donnees[coupure:]
+            manque = (3 - len(reste)) % 3
+            if len(segment) < manque:
+                reste += segment
+                continue
+            if manque:
+                sortie.append(_base64_lignes(reste + segment[:manque]))
+            corps, reste = self._segments_base64[index][manque]
+            sortie.append(corps)
+        sortie.append(_base64_lignes(reste))
+        return b''.join(sortie)
+
+def compiler_gabarit(contenu: str, echapper: bool = False) -> GabaritFusion:
+    """Gabarit partagé, mis en cache par version du contenu"""
+    mode = 'fusion-html' if echapper else 'fusion-text'
+    return rendu_cache.get_or_render(mode, contenu or "", lambda c: GabaritFusion(c, echapper))
+
+class ModeleMessage:
+    """Message MIME complet compilé une fois : seuls le destinataire et les corps varient.
+
+    Le squelette (en-têtes, frontières multipart, images déjà encodées) est sérialisé une fois ;
+    chaque message est ensuite assemblé par concaténation de buffers, sans passer par le
+    paquet email.
+    """
+    
+    MARQUEURS = (b'@@FUSION-TEXTE@@', b'@@FUSION-HTML@@')
+    
+    def __init__(self, contenu_text: str, contenu_html: str, entetes: dict, images=()):
+        self.texte = compiler_gabarit(contenu_text)
+        self.html = compiler_gabarit(contenu_html, echapper=True)
+        self.personnalise = self.texte.personnalise or self.html.personnalise
+        
+        parties = []
+        for sous_type, marqueur in zip(('plain', 'html'), self.MARQUEURS):
+            partie = MIMEBase('text', sous_type, charset='utf-8')
+            partie['Content-Transfer-Encoding'] = 'base64'
+            partie.set_payload(marqueur.decode('ascii'))
+            parties.append(partie)
+        alternative = MIMEMultipart('alternative', _subparts=parties)
+        if images:
+            message = MIMEMultipart('related', _subparts=[alternative, *images])
+        else:
+            message = alternative
+        for nom, valeur in entetes.items():
+            if valeur:
+                message[nom] = valeur if valeur.isascii() else Header(valeur, 'utf-8')
+        squelette = message.as_bytes(policy=compat32.clone(linesep='\r\n'))
+        avant, reste = squelette.split(self.MARQUEURS[0], 1)
+        self._avant = avant
+        self._entre, self._apres = reste.split(self.MARQUEURS[1], 1)
+    
+    @staticmethod
+    def contient_balises(*contenus) -> bool:
+        """Indique si l'un des contenus utilise des balises de fusion"""
+        return any(BALISE_FUSION_RE.search(contenu or '') for contenu in contenus)
+    
+    def rendre(self, valeurs: dict, destinataire: str) -> bytes:
+        """Message prêt pour smtplib.SMTP.sendmail()"""
+        entetes = b'To: ' + destinataire.encode('utf-8') + b'\r\n'
+        if valeurs.get('unsubscribe_url'):
+            # Désabonnement en un clic depuis le client mail (RFC 2369 / RFC 8058)
+            entetes += (
+                b'List-Unsubscribe: <' + valeurs['unsubscribe_url'].encode('ascii') + b'>\r\n'
+                b'List-Unsubscribe-Post: List-Unsubscribe=One-Click\r\n'
+            )
+        return b''.join((
+            entetes,
+            self._avant,
+            self.texte.rendre_base64(valeurs),
+            self._entre,
+            self.html.rendre_base64(valeurs),
+            self._apres,
+        ))
+
 
 if __name__ == "__main__":
     # Initialiser le gestionnaire
@@ -774,23 +1801,13 @@ if __name__ == "__main__":
     
     # Vérifier les newsletters planifiées au démarrage
     print("\n=== VÉRIFICATION DES NEWSLETTERS PLANIFIÉES ===")
-    conn = sqlite3.connect(newsletter_manager.db_path)
-    cursor = conn.cursor()
-    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    cursor.execute('''
-        SELECT id, titre, date_envoi_planifie 
-        FROM newsletters 
-        WHERE statut = 'planifie' 
-        AND datetime(date_envoi_planifie) <= datetime(?)
-    ''', (current_time,))
-    newsletters_a_envoyer = cursor.fetchall()
+    newsletters_a_envoyer = newsletter_manager.get_due_newsletters()
     
     if newsletters_a_envoyer:
         print(f"\n{len(newsletters_a_envoyer)} newsletter(s) à envoyer :")
-        for id, titre, date in newsletters_a_envoyer:
-            print(f"- {titre} (ID: {id}, planifiée pour: {date})")
-            newsletter_manager.send_newsletter(id)
-    conn.close()
+        for newsletter in newsletters_a_envoyer:
+            print(f"- {newsletter['titre']} (ID: {newsletter['id']}, planifiée pour: {newsletter['date_envoi_planifie']})")
+            newsletter_manager.send_newsletter(newsletter['id'])
     
     # Menu principal
     while True:
@@ -885,19 +1902,15 @@ if __name__ == "__main__":
             
             if sous_choix in ["1", "2"]:
                 # Lister les newsletters disponibles
-                conn = sqlite3.connect(newsletter_manager.db_path)
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, titre, statut FROM newsletters ORDER BY date_creation DESC")
-                newsletters = cursor.fetchall()
-                conn.close()
+                newsletters = newsletter_manager.list_newsletters()
                 
                 if not newsletters:
                     print("Aucune newsletter disponible")
                     continue
                 
                 print("\nNewsletters disponibles:")
-                for id, titre, statut in newsletters:
-                    print(f"{id}. {titre} ({statut})")
+                for newsletter in newsletters:
+                    print(f"{newsletter['id']}. {newsletter['titre']} ({newsletter['statut']})")
                 
                 newsletter_id = int(input("\nID de la newsletter à envoyer: "))
                 
@@ -933,42 +1946,25 @@ if __name__ == "__main__":
         elif choix == "5":
             # Vérifier les envois planifiés
             print("\n=== VÉRIFICATION DES ENVOIS PLANIFIÉS ===")
-            conn = sqlite3.connect(newsletter_manager.db_path)
-            cursor = conn.cursor()
-            
             # Afficher toutes les newsletters planifiées
-            cursor.execute('''
-                SELECT id, titre, date_envoi_planifie, statut 
-                FROM newsletters 
-                WHERE statut = 'planifie'
-            ''')
-            toutes_newsletters = cursor.fetchall()
+            toutes_newsletters = newsletter_manager.list_newsletters('planifie')
             
             print("\nToutes les newsletters planifiées :")
-            for id, titre, date, statut in toutes_newsletters:
-                print(f"- {titre} (ID: {id}, statut: {statut}, date prévue: {date})")
+            for newsletter in toutes_newsletters:
+                print(f"- {newsletter['titre']} (ID: {newsletter['id']}, statut: {newsletter['statut']}, date prévue: {newsletter['date_envoi_planifie']})")
             
             # Vérifier les newsletters à envoyer maintenant
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            cursor.execute('''
-                SELECT id, titre, date_envoi_planifie 
-                FROM newsletters 
-                WHERE statut = 'planifie' 
-                AND datetime(date_envoi_planifie) <= datetime(?)
-            ''', (current_time,))
-            newsletters_a_envoyer = cursor.fetchall()
+            newsletters_a_envoyer = newsletter_manager.get_due_newsletters()
             
             print("\nDate actuelle:", datetime.now())
             
             if newsletters_a_envoyer:
                 print(f"\n{len(newsletters_a_envoyer)} newsletter(s) à envoyer :")
-                for id, titre, date in newsletters_a_envoyer:
-                    print(f"- {titre} (ID: {id}, planifiée pour: {date})")
-                    newsletter_manager.send_newsletter(id)
+                for newsletter in newsletters_a_envoyer:
+                    print(f"- {newsletter['titre']} (ID: {newsletter['id']}, planifiée pour: {newsletter['date_envoi_planifie']})")
+                    newsletter_manager.send_newsletter(newsletter['id'])
             else:
                 print("\nAucune newsletter à envoyer pour le moment.")
-            
-            conn.close()
         
         elif choix == "6":
             print("Au revoir!")
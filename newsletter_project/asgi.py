@@ -0,0 +1,18 @@
+"""
+ASGI config for newsletter_project project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Served by an ASGI server (e.g. ``gunicorn -k uvicorn.workers.UvicornWorker``), the
+send progress stream (Server-Sent Events) does not hold a worker per open connection.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'newsletter_project.settings')
+
+application = get_asgi_application()
@@ -5,12 +5,13 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-your-secret-key-here'
+SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-your-secret-key-here')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Lu depuis l'environnement (render.yaml fixe DEBUG=false) ; activé par défaut en local
+DEBUG = os.environ.get('DEBUG', 'True').lower() == 'true'
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [hote.strip() for hote in os.environ.get('ALLOWED_HOSTS', '').split(',') if hote.strip()]
 
 # Application definition
 INSTALLED_APPS = [
@@ -27,6 +28,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Fichiers statiques servis avant sessions et authentification (hors DEBUG)
+    'newsletters.statiques.MiddlewareStatiques',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -57,15 +60,44 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'newsletter_project.wsgi.application'
+ASGI_APPLICATION = 'newsletter_project.asgi.application'
 
 # Database
+# En local, db.sqlite3 est écrit en même temps par les workers web et le scheduler :
+# - WAL permet aux lectures de continuer pendant une écriture
+# - busy_timeout fait patienter les écritures concurrentes au lieu de lever "database is locked"
+# - BEGIN IMMEDIATE prend le verrou d'écriture dès le début de la transaction (pas d'impasse lecture -> écriture)
+SQLITE_INIT_COMMAND = ';'.join([
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=20000',
+    'PRAGMA mmap_size=134217728',  # 128 Mo
+    'PRAGMA cache_size=-20000',  # ~20 Mo
+])
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Connexions persistantes (le scheduler, qui tourne en continu, les recycle à chaque passage)
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_INIT_COMMAND,
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# En production (render.yaml), le service web et le scheduler partagent la base PostgreSQL
+# désignée par DATABASE_URL : newsletters planifiées, Envois, cache 'db' et avancement des envois
+if os.environ.get('DATABASE_URL'):
+    import dj_database_url
+    DATABASES['default'] = dj_database_url.config(
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        conn_health_checks=True,
+    )
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -94,11 +126,50 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
+# collectstatic : noms par empreinte (manifest) et variantes .gz / .br précompressées,
+# servies par newsletters.statiques.MiddlewareStatiques avec un cache d'un an
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'newsletters.statiques.StockageStatiquesCompresses',
+    },
+}
 
 # Media files
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Cache (clics de désabonnement répétés, métriques, pages du tableau de bord). LocMemCache par défaut
+# ne garde que 300 entrées, insuffisant après l'envoi d'une campagne.
+# NEWSLETTER_CACHE_BACKEND : 'locmem' (mémoire propre à chaque worker), 'file' (partagé par les
+# workers d'une même machine) ou 'db' (table de la base, créée par manage.py createcachetable).
+# Avec plusieurs processus (workers, scheduler), seul un cache partagé voit les invalidations des autres.
+# Les backends comptent les succès / échecs de lecture, exposés par /cache/stats/.
+NEWSLETTER_CACHE_BACKEND = os.environ.get('NEWSLETTER_CACHE_BACKEND', 'locmem')
+CACHES_DISPONIBLES = {
+    'locmem': {
+        'BACKEND': 'newsletters.caches.LocMemCacheCompte',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'file': {
+        'BACKEND': 'newsletters.caches.FileBasedCacheCompte',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'db': {
+        'BACKEND': 'newsletters.caches.DatabaseCacheCompte',
+        'LOCATION': 'newsletter_cache',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+CACHES = {'default': CACHES_DISPONIBLES[NEWSLETTER_CACHE_BACKEND]}
+
+# Durée de conservation des fragments de page en cache (lignes des listes), en secondes.
+# Toute modification des données les invalide avant ce délai.
+NEWSLETTER_FRAGMENT_CACHE_SECONDS = 300
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -111,29 +182,109 @@ EMAIL_HOST_USER = 'augugu.delfly1234@gmail.com'  # À configurer
 EMAIL_HOST_PASSWORD = 'ynur qlmj zupo quyi'  # À configurer
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 DEFAULT_FONT = 'Times New Roman'  # Pour utiliser Times New Roman
+# Intégrer le logo et les images {% static %} dans les emails (parties CID) plutôt que des URLs absolues
+NEWSLETTER_EMBED_IMAGES = True
+# Clés de signature des tokens de désabonnement, par version. Pour une rotation, ajouter une
+# nouvelle version (utilisée pour signer) en gardant les anciennes le temps que leurs liens expirent.
+# Clé dédiée, indépendante de SECRET_KEY, identique sur le service web et le scheduler (les liens
+# signés par l'un sont vérifiés par l'autre) : 'version:cle' séparées par des virgules, ou une
+# clé seule (version 1).
+UNSUBSCRIBE_TOKEN_KEYS = {}
+for _entree in (os.environ.get('UNSUBSCRIBE_TOKEN_KEYS') or 'cle-desabonnement-dev-local').split(','):
+    _version, _separateur, _cle = _entree.strip().partition(':')
+    if not _separateur:
+        _version, _cle = '1', _version
+    if _cle:
+        UNSUBSCRIBE_TOKEN_KEYS[int(_version)] = _cle
+# Regroupement des désabonnements : 0 = écriture immédiate, sinon un UPDATE groupé toutes les N secondes
+UNSUBSCRIBE_COALESCE_SECONDS = 0
+# Événements de suivi (ouvertures) : insérés par lots toutes les N ms ou dès N événements en attente
+NEWSLETTER_EVENTS_FLUSH_MS = 500
+NEWSLETTER_EVENTS_FLUSH_SIZE = 1000
+# Événements bruts conservés (jours) après agrégation par rollup_events ; fenêtre des segments « engagés »
+NEWSLETTER_EVENTS_RETENTION_DAYS = 90
+NEWSLETTER_ENGAGEMENT_DAYS = 90
+# Envois (planifiés ou immédiats) exécutés par le scheduler, qui vérifie les échéances toutes les
+# NEWSLETTER_SCHEDULER_INTERVAL secondes. Thread lancé dans chaque processus qui charge les vues,
+# sauf NEWSLETTER_SCHEDULER_THREAD=false (processus dédié : manage.py run_scheduler).
+# Un envoi en cours sans lot écrit depuis NEWSLETTER_SEND_STALE_SECONDS (processus arrêté) est repris.
+# SITE_URL : adresse publique du site, pour les liens des emails (désabonnement, suivi)
+NEWSLETTER_SCHEDULER_THREAD = os.environ.get('NEWSLETTER_SCHEDULER_THREAD', 'True').lower() == 'true'
+NEWSLETTER_SCHEDULER_INTERVAL = 10
+NEWSLETTER_SEND_STALE_SECONDS = 600
+SITE_URL = os.environ.get('SITE_URL', '')
+# Statuts des Envois écrits par lots de N destinataires pendant un envoi personnalisé
+# (un INSERT / UPDATE groupé et une mise à jour des compteurs par lot)
+NEWSLETTER_SEND_BATCH_SIZE = 500
+# Newsletters par page dans la liste
+NEWSLETTER_LIST_PAGE_SIZE = 25
+
+# Avancement des envois (newsletters.progression) : publié dans le cache tous les
+# NEWSLETTER_PROGRESS_BATCH_SIZE messages, relu par le flux SSE toutes les NEWSLETTER_PROGRESS_POLL_MS ms.
+# Le flux est refermé après NEWSLETTER_PROGRESS_STREAM_SECONDS (le navigateur se reconnecte) ;
+# servi en WSGI, où chaque connexion ouverte occupe un worker, après NEWSLETTER_PROGRESS_WSGI_STREAM_SECONDS.
+# En production, l'application est servie en ASGI (render.yaml : gunicorn + workers uvicorn).
+NEWSLETTER_PROGRESS_BATCH_SIZE = 100
+NEWSLETTER_PROGRESS_POLL_MS = 500
+NEWSLETTER_PROGRESS_STREAM_SECONDS = 300
+NEWSLETTER_PROGRESS_WSGI_STREAM_SECONDS = 5
+
+# Métriques (newsletters.telemetrie), exposées au format Prometheus sur /newsletters/metrics/.
+# Avec NEWSLETTER_METRICS_DIR, chaque processus (workers gunicorn, scheduler) y écrit ses valeurs
+# toutes les NEWSLETTER_METRICS_FLUSH_SECONDS secondes et l'exposition les agrège ; le répertoire
+# est à vider au déploiement. Le collecteur s'authentifie par « Authorization: Bearer <token> ».
+NEWSLETTER_METRICS_DIR = os.environ.get('NEWSLETTER_METRICS_DIR') or None
+NEWSLETTER_METRICS_FLUSH_SECONDS = 5
+NEWSLETTER_METRICS_TOKEN = os.environ.get('NEWSLETTER_METRICS_TOKEN', '')
+NEWSLETTER_METRICS_DB = True
+
+# Traces (newsletters.traces) : étapes des envois, du scheduler et des imports, une ligne JSON
+# par span dans NEWSLETTER_TRACE_FILE (désactivé sans fichier). Une opération sur
+# 1/NEWSLETTER_TRACE_SAMPLE_RATE est tracée ; dans une trace, les étapes répétées par
+# destinataire le sont avec la probabilité NEWSLETTER_TRACE_DETAIL_SAMPLE_RATE.
+# Résumé par étape : manage.py resumer_traces
+NEWSLETTER_TRACE_FILE = os.environ.get('NEWSLETTER_TRACE_FILE') or None
+NEWSLETTER_TRACE_SAMPLE_RATE = float(os.environ.get('NEWSLETTER_TRACE_SAMPLE_RATE', 1.0))
+NEWSLETTER_TRACE_DETAIL_SAMPLE_RATE = float(os.environ.get('NEWSLETTER_TRACE_DETAIL_SAMPLE_RATE', 0.01))
 
 # Crispy Forms Configuration
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 # Logging configuration
+# Les handlers ne font que mettre les enregistrements en file : un thread dédié
+# (new.HandlerAsynchrone) les écrit dans le fichier et sur la console. Le fichier est partagé
+# par tous les processus : sa rotation est confiée à logrotate (le handler rouvre le fichier).
+# Les boucles d'envoi et d'import journalisent un résumé par lot de NEWSLETTER_LOG_BATCH_SIZE
+# destinataires ; une fraction NEWSLETTER_LOG_SAMPLE_RATE des lignes individuelles est gardée.
+NEWSLETTER_LOG_LEVEL = os.environ.get('NEWSLETTER_LOG_LEVEL', 'INFO')
+NEWSLETTER_LOG_BATCH_SIZE = 1000
+NEWSLETTER_LOG_SAMPLE_RATE = float(os.environ.get('NEWSLETTER_LOG_SAMPLE_RATE', 0.0))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'standard': {
+            'format': '%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+        },
+    },
     'handlers': {
         'file': {
-            'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': 'debug.log',
-        },
-        'console': {
-            'class': 'logging.StreamHandler',
+            'class': 'new.HandlerAsynchrone',
+            'fichier': 'debug.log',
+            'formatter': 'standard',
         },
     },
     'loggers': {
         'newsletters': {
-            'handlers': ['file', 'console'],
-            'level': 'DEBUG',
+            'handlers': ['file'],
+            'level': NEWSLETTER_LOG_LEVEL,
+            'propagate': True,
+        },
+        'new': {
+            'handlers': ['file'],
+            'level': NEWSLETTER_LOG_LEVEL,
             'propagate': True,
         },
     },
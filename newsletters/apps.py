@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+
+
+class NewslettersConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'newsletters'
+
+    def ready(self):
+        # Connecter les signaux qui maintiennent les compteurs de statistiques
+        from . import stats  # noqa: F401
+        # ...et ceux qui invalident les pages en cache
+        from . import invalidation  # noqa: F401
+        # ...et ceux qui invalident les totaux de pagination en cache (scheduler et commandes compris)
+        from . import pagination  # noqa: F401
+        # ...et celui qui chronomètre les requêtes SQL (avant toute connexion)
+        from . import telemetrie  # noqa: F401
@@ -0,0 +1,93 @@
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from collections import Counter
+import threading
+import time
+
+# Durée de vie d'une valeur de génération : sans expiration, sa disparition ferait relire
+# d'anciennes entrées encore présentes
+DUREE_GENERATION = None
+
+_compteurs = {'hits': Counter(), 'misses': Counter()}
+_lock = threading.Lock()
+
+def _prefixe(key):
+    """Famille d'une clé de cache : fragment de template nommé, ou début de la clé jusqu'au premier « : »"""
+    if key.startswith('template.cache.'):
+        return 'fragment:' + key.split('.')[2]
+    return key.split(':', 1)[0]
+
+def statistiques():
+    """Succès / échecs de lecture du cache par famille de clés, depuis le démarrage de ce processus"""
+    with _lock:
+        familles = set(_compteurs['hits']) | set(_compteurs['misses'])
+        resultat = {}
+        for famille in sorted(familles):
+            hits, misses = _compteurs['hits'][famille], _compteurs['misses'][famille]
+            resultat[famille] = {
+                'hits': hits,
+                'misses': misses,
+                'ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+            }
+    return resultat
+
+def reinitialiser_statistiques():
+    with _lock:
+        _compteurs['hits'].clear()
+        _compteurs['misses'].clear()
+
+class CompteurMixin:
+    """Compte les lectures du cache (get) réussies et manquées, par famille de clés"""
+
+    def get(self, key, default=None, version=None):
+        valeur = super().get(key, self._missing_key, version)
+        # Les lectures internes (incr, get_or_set...) passent _missing_key : non comptées deux fois
+        if default is not self._missing_key:
+            with _lock:
+                _compteurs['hits' if valeur is not self._missing_key else 'misses'][_prefixe(key)] += 1
+        return default if valeur is self._missing_key else valeur
+
+class LocMemCacheCompte(CompteurMixin, LocMemCache):
+    """Cache en mémoire, propre à chaque processus"""
+
+class FileBasedCacheCompte(CompteurMixin, FileBasedCache):
+    """Cache fichiers, partagé par les processus d'une même machine"""
+
+class DatabaseCacheCompte(CompteurMixin, DatabaseCache):
+    """Cache dans une table de la base (manage.py createcachetable), partagé par tous les processus"""
+
+def _graine():
+    # Valeur de départ d'une génération absente du cache (jamais créée, ou évincée) : supérieure
+    # à toutes celles déjà servies, les entrées écrites sous une ancienne génération restent mortes
+    return time.time_ns()
+
+def lire_generation(cle):
+    """Valeur d'un compteur de génération, créé avec une valeur inédite s'il n'existe pas"""
+    valeur = cache.get(cle)
+    if valeur is None:
+        # add() n'écrase pas la valeur posée entre-temps par un autre processus
+        cache.add(cle, _graine(), DUREE_GENERATION)
+        valeur = cache.get(cle, 0)
+    return valeur
+
+def incrementer_generation(cle):
+    """Passe un compteur de génération à une valeur jamais utilisée"""
+    try:
+        cache.incr(cle)
+    except ValueError:
+        if not cache.add(cle, _graine(), DUREE_GENERATION):
+            cache.incr(cle)
+
+def _cle_generation(groupe):
+    return f"generation:{groupe}"
+
+def generation(groupe):
+    """Génération courante d'un groupe de données ; fait partie des clés des entrées qui en dépendent"""
+    return lire_generation(_cle_generation(groupe))
+
+def invalider(*groupes):
+    """Rend obsolètes toutes les entrées en cache des groupes (appelé après modification des données)"""
+    for groupe in groupes:
+        incrementer_generation(_cle_generation(groupe))
@@ -0,0 +1,137 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.template.loader import render_to_string
+from .models import Subscriber, Envoi
+from .caches import invalider
+from .stats import enregistrer_desabonnement
+from .telemetrie import FILE_ATTENTE
+from collections import Counter
+from functools import lru_cache
+import atexit
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Durée pendant laquelle un clic répété est servi depuis le cache, sans requête
+DUREE_CACHE_DESABONNEMENT = 24 * 3600
+
+# Nombre maximal d'ids par requête IN
+TAILLE_LOT = 500
+
+def _cle_cache(token):
+    return f"desabonne:{token}"
+
+@lru_cache(maxsize=None)
+def page_desabonnement():
+    """Page de confirmation, rendue une seule fois par processus (elle ne dépend pas de la requête)"""
+    return render_to_string('newsletters/unsubscribe_success.html')
+
+@lru_cache(maxsize=None)
+def page_confirmation_desabonnement():
+    """Formulaire de confirmation (POST vers l'URL du lien), rendu une seule fois par processus"""
+    return render_to_string('newsletters/unsubscribe_confirm.html')
+
+def _attribuer(subscriber_ids):
+    """Compte les désabonnements, attribués à la dernière newsletter reçue par chaque abonné"""
+    dernieres = {}
+    for debut in range(0, len(subscriber_ids), TAILLE_LOT):
+        dernieres.update(Envoi.objects.filter(
+            subscriber_id__in=subscriber_ids[debut:debut + TAILLE_LOT]
+        ).order_by('date_envoi').values_list('subscriber_id', 'newsletter_id'))
+    for newsletter_id, nombre in Counter(dernieres.get(i) for i in subscriber_ids).items():
+        enregistrer_desabonnement(newsletter_id, nombre)
+
+class TamponDesabonnements:
+    """Regroupe les désabonnements et les applique par lots (settings.UNSUBSCRIBE_COALESCE_SECONDS)"""
+
+    def __init__(self):
+        self._ids = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def intervalle(self):
+        return getattr(settings, 'UNSUBSCRIBE_COALESCE_SECONDS', 0)
+
+    @property
+    def actif(self):
+        return self.intervalle > 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def ajouter(self, subscriber_id):
+        with self._lock:
+            self._ids.add(subscriber_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._boucle, daemon=True)
+                self._thread.start()
+
+    def _boucle(self):
+        while True:
+            time.sleep(self.intervalle or 1)
+            try:
+                close_old_connections()
+                self.vider()
+            except Exception as e:
+                logger.error(f"Erreur lors de l'application des désabonnements: {e}")
+
+    def vider(self):
+        """Applique les désabonnements en attente, retourne le nombre d'abonnés désabonnés"""
+        with self._lock:
+            ids, self._ids = list(self._ids), set()
+        if not ids:
+            return 0
+        modifies = []
+        with transaction.atomic():
+            for debut in range(0, len(ids), TAILLE_LOT):
+                lot = Subscriber.objects.filter(pk__in=ids[debut:debut + TAILLE_LOT]).exclude(statut='desabonne')
+                a_modifier = list(lot.values_list('pk', flat=True))
+                Subscriber.objects.filter(pk__in=a_modifier).update(statut='desabonne')
+                modifies.extend(a_modifier)
+        invalider('abonnes')
+        _attribuer(modifies)
+        logger.info(f"{len(modifies)} désabonnements appliqués ({len(ids)} demandes regroupées)")
+        return len(modifies)
+
+tampon = TamponDesabonnements()
+atexit.register(tampon.vider)
+FILE_ATTENTE.suivre(tampon.__len__, file='desabonnements')
+
+def token_valide(token):
+    """Indique si le token désigne un abonné existant, sans rien modifier"""
+    if cache.get(_cle_cache(token)):
+        return True
+    return Subscriber.objects.filter(**Subscriber.filtre_token(token)).exists()
+
+def desabonner(token):
+    """Désabonne l'abonné du token (idempotent) ; retourne False si le token est inconnu"""
+    cle = _cle_cache(token)
+    if cache.get(cle):
+        return True
+    filtre = Subscriber.filtre_token(token)
+    if 'pk' in filtre:
+        subscriber_id = filtre['pk']
+        if tampon.actif:
+            # Token signé : l'id est authentique, l'écriture peut être différée ; l'abonné
+            # peut toutefois avoir été supprimé (réponse 404, comme sans regroupement)
+            if not Subscriber.objects.filter(pk=subscriber_id).exists():
+                return False
+            tampon.ajouter(subscriber_id)
+            cache.set(cle, 1, DUREE_CACHE_DESABONNEMENT)
+            return True
+    else:
+        # Token historique : retrouver l'id par la colonne indexée
+        subscriber_id = Subscriber.objects.filter(**filtre).values_list('pk', flat=True).first()
+        if subscriber_id is None:
+            return False
+    if Subscriber.objects.filter(pk=subscriber_id).exclude(statut='desabonne').update(statut='desabonne'):
+        invalider('abonnes')
+        _attribuer([subscriber_id])
+    elif not Subscriber.objects.filter(pk=subscriber_id).exists():
+        return False
+    cache.set(cle, 1, DUREE_CACHE_DESABONNEMENT)
+    return True
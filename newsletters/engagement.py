@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Subscriber, Evenement, EngagementJour, RepriseAgregation
+from collections import defaultdict
+from datetime import timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal d'éléments par requête IN
+TAILLE_IN = 500
+
+# Événements supprimés par requête lors de la purge
+TAILLE_PURGE = 5000
+
+# Les événements plus récents peuvent appartenir à un lot encore en cours d'insertion
+MARGE_INSERTION = timedelta(minutes=1)
+
+# Champ « dernier engagement » de l'abonné, par type d'événement
+CHAMPS_DERNIER_ENGAGEMENT = {
+    'ouverture': 'derniere_ouverture',
+    'clic': 'dernier_clic',
+}
+
+# Compteurs (total, abonnés distincts) d'EngagementJour, par type d'événement
+COMPTEURS_PAR_TYPE = {
+    'ouverture': ('ouvertures', 'ouvreurs'),
+    'clic': ('clics', 'cliqueurs'),
+}
+
+def _recalculer_jours(jours):
+    """Recalcule entièrement les agrégats des (newsletter, jour) touchés, à partir des événements bruts.
+
+    Un recalcul complet (plutôt qu'un incrément) garde les abonnés distincts exacts et rend
+    l'agrégation idempotente.
+    """
+    par_newsletter = defaultdict(set)
+    for newsletter_id, jour in jours:
+        par_newsletter[newsletter_id].add(jour)
+    for newsletter_id, dates in par_newsletter.items():
+        agregats = {jour: dict.fromkeys(('ouvertures', 'ouvreurs', 'clics', 'cliqueurs'), 0) for jour in dates}
+        lignes = Evenement.objects.filter(
+            newsletter_id=newsletter_id, date__date__in=list(dates)
+        ).annotate(jour=TruncDate('date')).values('jour', 'type').annotate(
+            nombre=Count('id'), distincts=Count('subscriber', distinct=True)
+        )
+        for ligne in lignes:
+            total, distincts = COMPTEURS_PAR_TYPE[ligne['type']]
+            agregats[ligne['jour']][total] = ligne['nombre']
+            agregats[ligne['jour']][distincts] = ligne['distincts']
+        for jour, valeurs in agregats.items():
+            EngagementJour.objects.update_or_create(newsletter_id=newsletter_id, jour=jour, defaults=valeurs)
+
+def _maj_derniers_engagements(evenements):
+    """Avance les champs « dernier engagement » des abonnés concernés par les événements"""
+    derniers = defaultdict(dict)
+    for ligne in evenements.filter(subscriber__isnull=False).values('subscriber_id', 'type').annotate(derniere=Max('date')):
+        derniers[ligne['subscriber_id']][CHAMPS_DERNIER_ENGAGEMENT[ligne['type']]] = ligne['derniere']
+    ids = list(derniers)
+    champs = list(CHAMPS_DERNIER_ENGAGEMENT.values())
+    for debut in range(0, len(ids), TAILLE_IN):
+        abonnes = list(Subscriber.objects.filter(pk__in=ids[debut:debut + TAILLE_IN]).only('id', *champs))
+        for abonne in abonnes:
+            for champ, date in derniers[abonne.pk].items():
+                actuelle = getattr(abonne, champ)
+                if actuelle is None or date > actuelle:
+                    setattr(abonne, champ, date)
+        Subscriber.objects.bulk_update(abonnes, champs)
+    return len(ids)
+
+def agreger_evenements():
+    """Agrège les événements bruts arrivés depuis le dernier passage (point de reprise par id)"""
+    with transaction.atomic():
+        reprise, _ = RepriseAgregation.objects.select_for_update().get_or_create(pk=1)
+        fin = Evenement.objects.filter(
+            date__lt=timezone.now() - MARGE_INSERTION
+        ).aggregate(fin=Max('id'))['fin'] or 0
+        if fin <= reprise.dernier_evenement:
+            return {'evenements': 0, 'jours': 0, 'abonnes': 0}
+        nouveaux = Evenement.objects.filter(id__gt=reprise.dernier_evenement, id__lte=fin)
+        nombre = nouveaux.count()
+        jours = set(nouveaux.annotate(jour=TruncDate('date')).values_list('newsletter_id', 'jour').distinct())
+        _recalculer_jours(jours)
+        abonnes = _maj_derniers_engagements(nouveaux)
+        reprise.dernier_evenement = fin
+        reprise.save()
+    logger.info(f"Agrégation : {nombre} événements, {len(jours)} jours recalculés, {abonnes} abonnés mis à jour")
+    return {'evenements': nombre, 'jours': len(jours), 'abonnes': abonnes}
+
+def purger_evenements(retention_jours=None):
+    """Supprime les événements bruts déjà agrégés et plus anciens que la période de rétention.
+
+    La limite est alignée sur un début de journée : un jour est conservé entier ou purgé entier,
+    jamais recalculé à partir d'événements partiels. Une ouverture postérieure à la purge
+    compte à nouveau comme première ouverture.
+    """
+    if retention_jours is None:
+        retention_jours = getattr(settings, 'NEWSLETTER_EVENTS_RETENTION_DAYS', 90)
+    limite = timezone.localtime() - timedelta(days=retention_jours)
+    limite = limite.replace(hour=0, minute=0, second=0, microsecond=0)
+    agrege = RepriseAgregation.objects.filter(pk=1).values_list('dernier_evenement', flat=True).first() or 0
+    anciens = Evenement.objects.filter(date__lt=limite, id__lte=agrege)
+    supprimes = 0
+    while True:
+        # Suppression par tranches d'ids : transactions courtes, sans longue liste IN
+        ids = list(anciens.order_by('id').values_list('id', flat=True)[:TAILLE_PURGE])
+        if not ids:
+            break
+        nombre, _ = anciens.filter(id__lte=ids[-1]).delete()
+        supprimes += nombre
+    if supprimes:
+        logger.info(f"Purge : {supprimes} événements antérieurs au {limite:%d/%m/%Y} supprimés")
+    return supprimes
+
+def abonnes_engages(abonnes, jours=None):
+    """Filtre les abonnés ayant ouvert ou cliqué sur la période (lit les champs agrégés, pas les événements)"""
+    if jours is None:
+        jours = getattr(settings, 'NEWSLETTER_ENGAGEMENT_DAYS', 90)
+    depuis = timezone.now() - timedelta(days=jours)
+    return abonnes.filter(Q(derniere_ouverture__gte=depuis) | Q(dernier_clic__gte=depuis))
+
+def get_engagement(newsletter_id):
+    """Engagement quotidien d'une newsletter, lu dans les agrégats"""
+    return list(EngagementJour.objects.filter(newsletter_id=newsletter_id).values(
+        'jour', 'ouvertures', 'ouvreurs', 'clics', 'cliqueurs'
+    ))
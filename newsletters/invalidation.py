@@ -0,0 +1,25 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Newsletter, Subscriber
+from .caches import invalider
+from .rendu import invalider_rendu
+
+# Les mises à jour groupées (update, bulk_create) n'émettent pas ces signaux :
+# elles appellent invalider() elles-mêmes. Les Envois n'ont pas de receveur : leurs
+# écritures passent par les compteurs de stats.py, qui invalident la liste une fois par lot.
+
+def invalider_newsletter(newsletter_id):
+    """Liste des newsletters et pages de la newsletter"""
+    invalider('newsletters')
+    invalider_rendu(newsletter_id)
+
+@receiver(post_save, sender=Newsletter)
+@receiver(post_delete, sender=Newsletter)
+def newsletter_modifiee(sender, instance, **kwargs):
+    invalider_newsletter(instance.pk)
+
+@receiver(post_save, sender=Subscriber)
+@receiver(post_delete, sender=Subscriber)
+def abonne_modifie(sender, instance, **kwargs):
+    """Liste des abonnés"""
+    invalider('abonnes')
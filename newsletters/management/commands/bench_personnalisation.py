@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from new import ModeleMessage
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks per-recipient merge-tag rendering (complete MIME messages per second on one core).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=100000, help='Messages rendered')
+        parser.add_argument('--size', type=int, default=20, help='Approximate HTML body size in KiB')
+
+    def handle(self, *args, **options):
+        paragraphe = '<p style="color:#333;margin:0 0 12px">Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>'
+        corps = paragraphe * max(1, options['size'] * 1024 // len(paragraphe))
+        contenu_html = (
+            '<h1>Bonjour {{prenom}} {{nom}}</h1>' + corps
+            + '<p><a href="{{unsubscribe_url}}">Se désabonner</a></p>'
+        )
+        contenu_text = 'Bonjour {{prenom}},\n\n' + 'Lorem ipsum dolor sit amet.\n' * 50 + '\n{{unsubscribe_url}}'
+
+        start = time.perf_counter()
+        modele = ModeleMessage(contenu_text, contenu_html, {'Subject': 'Lettre mensuelle', 'From': 'news@example.com'})
+        compile_time = time.perf_counter() - start
+
+        recipients = [
+            {
+                'prenom': f'Prénom{i}',
+                'nom': f'Nom{i}',
+                'email': f'abonne{i}@example.com',
+                'unsubscribe_url': f'https://example.com/unsubscribe/{i:032x}/',
+            }
+            for i in range(options['recipients'])
+        ]
+        total = 0
+        start = time.perf_counter()
+        for valeurs in recipients:
+            total += len(modele.rendre(valeurs, valeurs['email']))
+        elapsed = time.perf_counter() - start
+
+        rate = options['recipients'] / elapsed
+        self.stdout.write(f"Template: {len(contenu_html) / 1024:.0f} KiB HTML, compiled in {compile_time * 1000:.2f} ms")
+        self.stdout.write(
+            f"{options['recipients']} messages in {elapsed:.2f} s: {rate:,.0f} messages/s, "
+            f"{total / elapsed / 2 ** 20:.0f} MiB/s"
+        )
+        style = self.style.SUCCESS if rate >= 10000 else self.style.WARNING
+        self.stdout.write(style('target >= 10,000 messages/s: ' + ('met' if rate >= 10000 else 'missed')))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from new import rendu_cache, render_txt_html, text_to_html
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmarks the text-to-HTML renderers on large generated inputs, cold and from the cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=50000, help='Lines in the generated document')
+        parser.add_argument('--repeat', type=int, default=20, help='Renders per measurement')
+
+    def handle(self, *args, **options):
+        document = self._generate(options['lines'])
+        self.stdout.write(f"Input: {len(document) / 1024:.0f} KiB, {options['lines']} lines")
+        for name, render in (('text_to_html', text_to_html), ('txt_to_html', render_txt_html)):
+            rendu_cache.clear()
+            cold = self._measure(lambda: (rendu_cache.clear(), render(document)), options['repeat'])
+            warm = self._measure(lambda: render(document), options['repeat'])
+            self.stdout.write(self.style.SUCCESS(name))
+            self.stdout.write(f"  cold: {cold * 1000:.2f} ms/render  cached: {warm * 1000:.3f} ms/render")
+
+    def _measure(self, func, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - start) / repeat
+
+    def _generate(self, lines):
+        random.seed(42)
+        samples = [
+            'TITRE: Lettre mensuelle:',
+            'SECTION: Actualités:',
+            'Un paragraphe avec du **gras**, de l\'*italique* et un lien https://example.com/article?id=42',
+            '- Premier point',
+            '* Second point',
+            'Produit\tPrix\tStock',
+            'A,12.50,3',
+            '[IMAGE]https://example.com/photo.jpg[CAPTION]Légende[/CAPTION]',
+            '',
+        ]
+        return '\n'.join(random.choice(samples) for _ in range(lines))
@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks SQLite contention with concurrent readers and writers, with and without the configured pragmas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help='Number of reader threads')
+        parser.add_argument('--writers', type=int, default=2, help='Number of writer threads')
+        parser.add_argument('--duration', type=float, default=5.0, help='Duration of each run in seconds')
+        parser.add_argument('--rows', type=int, default=10000, help='Rows seeded before the run')
+
+    def handle(self, *args, **options):
+        tuned = settings.DATABASES['default'].get('OPTIONS', {}).get('init_command', '')
+        runs = [
+            ('default (rollback journal, no busy_timeout)', ''),
+            ('tuned (settings init_command)', tuned),
+        ]
+        for label, init_command in runs:
+            result = self._run(init_command, options)
+            self.stdout.write(self.style.SUCCESS(label))
+            self.stdout.write(
+                f"  reads: {result['reads']} ({result['reads'] / options['duration']:.0f}/s)  "
+                f"writes: {result['writes']} ({result['writes'] / options['duration']:.0f}/s)  "
+                f"'database is locked': {result['locked']}"
+            )
+
+    def _connect(self, path, init_command):
+        # timeout=0 : sans busy_timeout, sqlite3 échoue immédiatement sur un verrou
+        conn = sqlite3.connect(path, timeout=0, isolation_level=None, check_same_thread=False)
+        for statement in init_command.split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        return conn
+
+    def _run(self, init_command, options):
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        try:
+            conn = self._connect(path, init_command)
+            conn.execute('CREATE TABLE envois (id INTEGER PRIMARY KEY, newsletter_id INTEGER, statut TEXT)')
+            conn.execute('BEGIN')
+            conn.executemany(
+                'INSERT INTO envois (newsletter_id, statut) VALUES (?, ?)',
+                ((i % 10, 'en_attente') for i in range(options['rows']))
+            )
+            conn.execute('COMMIT')
+            conn.close()
+
+            counters = {'reads': 0, 'writes': 0, 'locked': 0}
+            lock = threading.Lock()
+            deadline = time.monotonic() + options['duration']
+
+            def count(key):
+                with lock:
+                    counters[key] += 1
+
+            def reader():
+                db = self._connect(path, init_command)
+                while time.monotonic() < deadline:
+                    try:
+                        db.execute("SELECT COUNT(*) FROM envois WHERE statut = 'envoye'").fetchone()
+                        count('reads')
+                    except sqlite3.OperationalError:
+                        count('locked')
+                db.close()
+
+            def writer(number):
+                db = self._connect(path, init_command)
+                i = 0
+                while time.monotonic() < deadline:
+                    try:
+                        db.execute('BEGIN IMMEDIATE')
+                        db.execute(
+                            "UPDATE envois SET statut = 'envoye' WHERE id = ?",
+                            (1 + (number * 7919 + i) % options['rows'],)
+                        )
+                        db.execute('INSERT INTO envois (newsletter_id, statut) VALUES (?, ?)', (number, 'en_attente'))
+                        db.execute('COMMIT')
+                        count('writes')
+                    except sqlite3.OperationalError:
+                        if db.in_transaction:
+                            db.execute('ROLLBACK')
+                        count('locked')
+                    i += 1
+                db.close()
+
+            threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+            threads += [threading.Thread(target=writer, args=(n,)) for n in range(options['writers'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return counters
+        finally:
+            for suffix in ('', '-wal', '-shm', '-journal'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
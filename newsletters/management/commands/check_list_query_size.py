@@ -0,0 +1,95 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.backends.utils import CursorWrapper
+from django.test import Client
+from django.urls import reverse
+from newsletters.models import Newsletter
+
+
+class MeasuringCursor(CursorWrapper):
+    """Cursor wrapper adding up the size of every value fetched from the database"""
+
+    fetched = 0
+
+    def _measure(self, rows):
+        for row in rows:
+            MeasuringCursor.fetched += sum(len(value) if isinstance(value, (str, bytes)) else 8 for value in row)
+        return rows
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self._measure([row])
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self.cursor.fetchmany(size) if size is not None else self.cursor.fetchmany()
+        return self._measure(rows)
+
+    def fetchall(self):
+        return self._measure(self.cursor.fetchall())
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Query-size regression check for newsletter_list: fetches the page with a growing number of '
+        'newsletters with large bodies and fails if the bytes read from the database grow with them '
+        'or if any body is loaded.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='50,500,2000', help='Comma-separated newsletter counts (at least one full page each)')
+        parser.add_argument('--body-kb', type=int, default=16, help='Size of each HTML body in KB')
+        parser.add_argument('--tolerance', type=float, default=0.05, help='Allowed growth between the smallest and largest count')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        body = '<p>' + 'x' * (options['body_kb'] * 1024) + '</p>'
+        results = []
+        make_cursor = connection.make_cursor
+        make_debug_cursor = connection.make_debug_cursor
+        connection.make_cursor = connection.make_debug_cursor = lambda cursor: MeasuringCursor(cursor, connection)
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user('query-size-check')
+                client = Client()
+                client.force_login(user)
+                created = 0
+                for size in sizes:
+                    Newsletter.objects.bulk_create(
+                        Newsletter(titre=f'Query size {i}', objet='Check', contenu_html=body, contenu_text=body)
+                        for i in range(created, size)
+                    )
+                    created = size
+                    cache.clear()
+                    results.append((size, self._measure(client), self._measure(client)))
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            connection.make_cursor = make_cursor
+            connection.make_debug_cursor = make_debug_cursor
+            cache.clear()
+
+        for size, cold, warm in results:
+            self.stdout.write(f"{size:>6} newsletters: {cold:>10} bytes fetched (cold cache), {warm:>10} bytes (warm)")
+        # Le cache froid mesure la requête de la page (à chaud, les lignes viennent du fragment en cache)
+        smallest, largest = results[0][1], results[-1][1]
+        if largest >= len(body):
+            raise CommandError(f"{largest} bytes fetched per list request: newsletter bodies are being loaded")
+        if largest > smallest * (1 + options['tolerance']):
+            raise CommandError(f"Bytes fetched per list request grew from {smallest} to {largest}")
+        self.stdout.write(self.style.SUCCESS('Bytes fetched per list request stay constant'))
+
+    def _measure(self, client):
+        MeasuringCursor.fetched = 0
+        response = client.get(reverse('newsletter_list'))
+        if response.status_code != 200:
+            raise CommandError(f"newsletter_list returned {response.status_code}")
+        return MeasuringCursor.fetched
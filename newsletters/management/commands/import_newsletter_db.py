@@ -0,0 +1,146 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from newsletters.models import Newsletter, Subscriber, Envoi
+from newsletters.stats import recalculer_statistiques
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+import os
+import sqlite3
+
+
+def parse_date(value, tz=dt_timezone.utc):
+    """Convertit une date de newsletter.db (texte ISO ou CURRENT_TIMESTAMP) en datetime aware"""
+    if not value:
+        return None
+    try:
+        date = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, tz)
+    return date
+
+
+@contextmanager
+def preserve_auto_now_add(*models):
+    """Désactive auto_now_add pour conserver les dates d'origine des lignes importées"""
+    fields = [
+        field for model in models for field in model._meta.fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = 'One-shot bulk migration of the legacy newsletter.db (subscribers, newsletters, envois) into the Django tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db', default='newsletter.db', help='Path to the legacy SQLite database')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be imported without writing')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['db']):
+            raise CommandError(f"Base introuvable : {options['db']}")
+        source = sqlite3.connect(f"file:{options['db']}?mode=ro", uri=True)
+        source.row_factory = sqlite3.Row
+        batch_size = options['batch_size']
+
+        try:
+            with transaction.atomic(), preserve_auto_now_add(Subscriber, Newsletter, Envoi):
+                subscriber_ids = self._import_subscribers(source, batch_size)
+                newsletter_ids = self._import_newsletters(source)
+                envois = self._import_envois(source, subscriber_ids, newsletter_ids, batch_size)
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+        finally:
+            source.close()
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run: nothing was written.'))
+        else:
+            recalculer_statistiques()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(subscriber_ids)} subscribers, {len(newsletter_ids)} newsletters, {envois} envois imported."
+        ))
+
+    def _import_subscribers(self, source, batch_size):
+        """Importe les abonnés absents (par email) et retourne la correspondance ancien id -> nouvel id"""
+        rows = source.execute(
+            'SELECT id, email, nom, prenom, date_inscription, statut, token_desabonnement FROM subscribers'
+        ).fetchall()
+        existing = set(Subscriber.objects.values_list('email', flat=True))
+        used_tokens = set(Subscriber.objects.values_list('token_desabonnement', flat=True))
+        to_create = []
+        for row in rows:
+            email = row['email'].strip().lower()
+            if email in existing:
+                continue
+            existing.add(email)
+            # Les tokens historiques restent valides pour les liens déjà envoyés ; les nouveaux
+            # liens utilisent le token signé dérivé de l'id
+            token = row['token_desabonnement']
+            if not token or len(token) > 32 or token in used_tokens:
+                token = None
+            used_tokens.add(token)
+            to_create.append(Subscriber(
+                email=email,
+                nom=row['nom'],
+                prenom=row['prenom'],
+                date_inscription=parse_date(row['date_inscription']) or timezone.now(),
+                statut=row['statut'] or 'actif',
+                token_desabonnement=token,
+            ))
+        Subscriber.objects.bulk_create(to_create, batch_size=batch_size)
+
+        ids_by_email = {}
+        emails = [row['email'].strip().lower() for row in rows]
+        for start in range(0, len(emails), batch_size):
+            ids_by_email.update(Subscriber.objects.filter(
+                email__in=emails[start:start + batch_size]
+            ).values_list('email', 'id'))
+        return {row['id']: ids_by_email[row['email'].strip().lower()] for row in rows}
+
+    def _import_newsletters(self, source):
+        """Importe les newsletters et retourne la correspondance ancien id -> nouvel id"""
+        ids = {}
+        for row in source.execute('SELECT * FROM newsletters ORDER BY id'):
+            newsletter = Newsletter.objects.create(
+                titre=row['titre'],
+                objet=row['objet'] or row['titre'],
+                contenu_html=row['contenu_html'] or '',
+                contenu_text=row['contenu_text'] or '',
+                date_creation=parse_date(row['date_creation']) or timezone.now(),
+                date_envoi=parse_date(row['date_envoi']),
+                # Les dates planifiées sont saisies en heure locale
+                date_envoi_planifie=parse_date(row['date_envoi_planifie'], timezone.get_current_timezone()),
+                statut=row['statut'] or 'brouillon',
+                police=row['police'] or 'Arial',
+                destinataires_cc=row['destinataires_cc'],
+                destinataires_cci=row['destinataires_cci'],
+            )
+            ids[row['id']] = newsletter.pk
+        return ids
+
+    def _import_envois(self, source, subscriber_ids, newsletter_ids, batch_size):
+        """Importe les envois par lots ; le dernier envoi d'un couple newsletter/abonné l'emporte"""
+        envois = {}
+        for row in source.execute('SELECT newsletter_id, subscriber_id, date_envoi, statut FROM envois ORDER BY id'):
+            key = (newsletter_ids.get(row['newsletter_id']), subscriber_ids.get(row['subscriber_id']))
+            if None in key:
+                continue
+            envois[key] = Envoi(
+                newsletter_id=key[0],
+                subscriber_id=key[1],
+                date_envoi=parse_date(row['date_envoi']) or timezone.now(),
+                statut=row['statut'] or 'envoye',
+            )
+        Envoi.objects.bulk_create(envois.values(), batch_size=batch_size, ignore_conflicts=True)
+        return len(envois)
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db.models import F
+from django.urls import reverse
+from newsletters.desabonnement import tampon
+from newsletters.models import Subscriber, StatistiquesGlobales
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LoadTestServer(ThreadedWSGIServer):
+    # La file par défaut (5) provoque des retransmissions SYN d'une seconde sous charge
+    request_queue_size = 256
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-tests the unsubscribe endpoint against a local Django server: first clicks, '
+        'repeat clicks, RFC 8058 one-click POSTs, and first clicks with write coalescing.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=2000, help='Subscribers per scenario')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+        parser.add_argument('--coalesce', type=float, default=1.0, help='UNSUBSCRIBE_COALESCE_SECONDS for the coalesced scenario')
+
+    def handle(self, *args, **options):
+        server = LoadTestServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=True)
+        server.daemon_threads = True
+        server.set_app(WSGIHandler())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        self.stdout.write(f"Server on {base_url}, {options['concurrency']} clients")
+
+        desabonnes_avant = StatistiquesGlobales.objects.filter(pk=1).values_list('desabonnes', flat=True).first() or 0
+        coalesce_avant = getattr(settings, 'UNSUBSCRIBE_COALESCE_SECONDS', 0)
+        created = []
+        try:
+            settings.UNSUBSCRIBE_COALESCE_SECONDS = 0
+            batch = self._create(options['subscribers'], 'get', created)
+            self._run('GET first click', base_url, batch, 'GET', options)
+            self._run('GET repeat click (cached)', base_url, batch, 'GET', options)
+
+            batch = self._create(options['subscribers'], 'post', created)
+            self._run('POST one-click (RFC 8058)', base_url, batch, 'POST', options)
+
+            settings.UNSUBSCRIBE_COALESCE_SECONDS = options['coalesce']
+            batch = self._create(options['subscribers'], 'coalesce', created)
+            self._run(f"GET first click, coalesced every {options['coalesce']}s", base_url, batch, 'GET', options)
+            tampon.vider()
+
+            restants = Subscriber.objects.filter(pk__in=created).exclude(statut='desabonne').count()
+            style = self.style.SUCCESS if restants == 0 else self.style.ERROR
+            self.stdout.write(style(f"{len(created) - restants}/{len(created)} subscribers unsubscribed"))
+        finally:
+            settings.UNSUBSCRIBE_COALESCE_SECONDS = coalesce_avant
+            server.shutdown()
+            server.server_close()
+            Subscriber.objects.filter(pk__in=created).delete()
+            # Retirer les désabonnements de test des compteurs globaux
+            desabonnes_apres = StatistiquesGlobales.objects.filter(pk=1).values_list('desabonnes', flat=True).first() or 0
+            StatistiquesGlobales.objects.filter(pk=1).update(
+                desabonnes=F('desabonnes') - (desabonnes_apres - desabonnes_avant)
+            )
+
+    def _create(self, count, label, created):
+        stamp = int(time.time() * 1000)
+        subscribers = Subscriber.objects.bulk_create(
+            Subscriber(email=f'loadtest-{label}-{stamp}-{i}@loadtest.invalid') for i in range(count)
+        )
+        if subscribers and subscribers[0].pk is None:
+            subscribers = list(Subscriber.objects.filter(email__startswith=f'loadtest-{label}-{stamp}-'))
+        created.extend(subscriber.pk for subscriber in subscribers)
+        cache.clear()
+        return [reverse('unsubscribe', args=[subscriber.token_signe]) for subscriber in subscribers]
+
+    def _run(self, label, base_url, paths, method, options):
+        data = b'List-Unsubscribe=One-Click' if method == 'POST' else None
+
+        def hit(path):
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(base_url + path, data=data, method=method)) as response:
+                    size = len(response.read())
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                size, status = 0, e.code
+            return time.perf_counter() - start, status, size
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(hit, paths))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(result[0] for result in results)
+        errors = sum(1 for result in results if result[1] != 200)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(self.style.SUCCESS(label))
+        self.stdout.write(
+            f"  {len(results)} requests in {elapsed:.2f} s: {len(results) / elapsed:.0f} req/s, "
+            f"p50 {percentile(0.5):.1f} ms, p95 {percentile(0.95):.1f} ms, p99 {percentile(0.99):.1f} ms, "
+            f"{errors} errors, body {results[0][2]} bytes"
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from newsletters.rebonds import traiter_source
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams bounce reports (DSN) from mbox files, Maildirs or drop directories, marks hard-bounced '
+        'subscribers and their envois as bounced, and records a checkpoint so messages are never reprocessed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='+', help='mbox file, Maildir or directory of .eml files')
+        parser.add_argument('--batch-size', type=int, default=500, help='Messages applied per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Parse and report without writing or moving the checkpoint')
+
+    def handle(self, *args, **options):
+        for source in options['sources']:
+            if not os.path.exists(source):
+                raise CommandError(f"{source} not found")
+        for source in options['sources']:
+            start = time.perf_counter()
+            resume = traiter_source(source, options['batch_size'], options['dry_run'])
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(source))
+            self.stdout.write(
+                f"  {resume.get('messages', 0)} messages ({resume.get('rapports', 0)} DSN) in {elapsed:.2f} s: "
+                f"{resume.get('durs', 0)} hard, {resume.get('temporaires', 0)} soft, "
+                f"{resume.get('abonnes', 0)} subscribers and {resume.get('envois', 0)} envois marked as bounced"
+                + (' (dry run)' if options['dry_run'] else '')
+            )
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from newsletters.traces import lire_spans, resumer_traces
+
+
+class Command(BaseCommand):
+    help = (
+        'Summarizes a trace file (JSON lines written by newsletters.traces) into a per-stage time '
+        'breakdown for each traced operation: send, scheduled send, subscriber import.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', help='Trace file (default: NEWSLETTER_TRACE_FILE)')
+        parser.add_argument('--operation', help='Only this root operation (e.g. envoi, envoi_planifie, import_abonnes)')
+        parser.add_argument('--trace', help='Only this trace id')
+
+    def handle(self, *args, **options):
+        chemin = options['file'] or getattr(settings, 'NEWSLETTER_TRACE_FILE', None)
+        if not chemin:
+            raise CommandError('No trace file given and NEWSLETTER_TRACE_FILE is not set')
+        try:
+            spans, illisibles = lire_spans(chemin)
+        except OSError as e:
+            raise CommandError(f"Cannot read {chemin}: {e}")
+        for numero in illisibles:
+            self.stderr.write(f"Skipping malformed line {numero}")
+        if options['trace']:
+            spans = [span for span in spans if span['trace'] == options['trace']]
+
+        resume = resumer_traces(spans, options['operation'])
+        if not resume:
+            self.stdout.write('No complete trace in the file')
+            return
+        for operation in resume:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{operation['operation']}: {operation['traces']} trace(s), "
+                f"{operation['total_ms'] / 1000:.3f} s in total"
+            ))
+            self.stdout.write(
+                f"  {'stage':<36} {'calls':>9} {'total ms':>12} {'share':>7} {'mean ms':>10} "
+                f"{'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"
+            )
+            for etape in operation['etapes']:
+                libelle = etape['etape'] + (' ~' if etape['echantillonne'] else '')
+                self.stdout.write(
+                    f"  {libelle:<36} {etape['appels']:>9.0f} {etape['total_ms']:>12.1f} {etape['part']:>6.1f}% "
+                    f"{etape['moyenne_ms']:>10.3f} {etape['p50_ms']:>9.3f} "
+                    f"{etape['p95_ms']:>9.3f} {etape['max_ms']:>9.3f}"
+                )
+            self.stdout.write('')
+        if any(span.get('poids', 1) != 1 for span in spans):
+            self.stdout.write('~ sampled per-recipient stage: calls and total are estimated from the sample')
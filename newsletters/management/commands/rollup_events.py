@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from newsletters.engagement import agreger_evenements, purger_evenements
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Rolls raw open/click events up into per-newsletter daily aggregates and per-subscriber '
+        '"last engaged" fields, then prunes raw events older than the retention window.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, help='Raw events kept (default: NEWSLETTER_EVENTS_RETENTION_DAYS)')
+        parser.add_argument('--no-prune', action='store_true', help='Only roll up, keep every raw event')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        resume = agreger_evenements()
+        self.stdout.write(
+            f"Rolled up {resume['evenements']} events: {resume['jours']} newsletter-days recomputed, "
+            f"{resume['abonnes']} subscribers updated"
+        )
+        if not options['no_prune']:
+            pruned = purger_evenements(options['retention_days'])
+            self.stdout.write(f"Pruned {pruned} raw events")
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - start:.2f} s"))
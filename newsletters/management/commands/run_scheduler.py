@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import close_old_connections
 from newsletters.views import check_scheduled_newsletters_standalone
 import time
 import logging
@@ -13,8 +15,11 @@ class Command(BaseCommand):
         while True:
             try:
                 self.stdout.write('Checking for scheduled newsletters...')
+                # Reuse the persistent connection until CONN_MAX_AGE expires
+                close_old_connections()
                 check_scheduled_newsletters_standalone()
-                self.stdout.write('Scheduled newsletters check complete. Waiting 30 seconds.')
+                interval = getattr(settings, 'NEWSLETTER_SCHEDULER_INTERVAL', 30)
+                self.stdout.write(f'Scheduled newsletters check complete. Waiting {interval} seconds.')
             except Exception as e:
                 self.stderr.write(self.style.ERROR(f'Error in scheduler: {e}'))
-            time.sleep(30) 
\ No newline at end of file
+            time.sleep(getattr(settings, 'NEWSLETTER_SCHEDULER_INTERVAL', 30)) 
\ No newline at end of file
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from newsletters.models import Suppression
+from newsletters.suppression import ajouter_suppressions
+
+
+class Command(BaseCommand):
+    help = 'Adds addresses to (or removes them from) the suppression list checked before every send.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('emails', nargs='*', help='Addresses to suppress')
+        parser.add_argument('--file', help='File with one address per line')
+        parser.add_argument('--reason', choices=[motif for motif, _ in Suppression.MOTIFS], default='manuel', help='Suppression reason')
+        parser.add_argument('--remove', action='store_true', help='Remove the addresses from the list instead')
+
+    def handle(self, *args, **options):
+        emails = list(options['emails'])
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as f:
+                emails.extend(line.strip() for line in f if line.strip())
+        emails = {email.strip().lower() for email in emails if email.strip()}
+        if options['remove']:
+            count, _ = Suppression.objects.filter(email__in=emails).delete()
+            self.stdout.write(self.style.SUCCESS(f"{count} addresses removed from the suppression list"))
+            return
+        before = Suppression.objects.count()
+        ajouter_suppressions(emails, options['reason'])
+        added = Suppression.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(f"{added} addresses added to the suppression list ({len(emails) - added} already present)"))
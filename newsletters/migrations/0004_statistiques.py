@@ -0,0 +1,58 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def initialiser_statistiques(apps, schema_editor):
+    """Calcule les compteurs initiaux à partir des envois existants"""
+    Envoi = apps.get_model('newsletters', 'Envoi')
+    StatistiquesNewsletter = apps.get_model('newsletters', 'StatistiquesNewsletter')
+    StatistiquesGlobales = apps.get_model('newsletters', 'StatistiquesGlobales')
+    totaux = {'destinataires': 0, 'envoyes': 0, 'erreurs': 0}
+    agregats = Envoi.objects.values('newsletter_id').annotate(
+        destinataires=Count('id'),
+        envoyes=Count('id', filter=Q(statut='envoye')),
+        erreurs=Count('id', filter=Q(statut='erreur')),
+    )
+    for ligne in agregats:
+        valeurs = {champ: ligne[champ] for champ in totaux}
+        StatistiquesNewsletter.objects.create(newsletter_id=ligne['newsletter_id'], **valeurs)
+        for champ in totaux:
+            totaux[champ] += ligne[champ]
+    StatistiquesGlobales.objects.create(pk=1, **totaux)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletters', '0003_alter_newsletter_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiquesGlobales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destinataires', models.IntegerField(default=0)),
+                ('envoyes', models.IntegerField(default=0)),
+                ('erreurs', models.IntegerField(default=0)),
+                ('desabonnes', models.IntegerField(default=0)),
+                ('ouverts', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatistiquesNewsletter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destinataires', models.IntegerField(default=0)),
+                ('envoyes', models.IntegerField(default=0)),
+                ('erreurs', models.IntegerField(default=0)),
+                ('desabonnes', models.IntegerField(default=0)),
+                ('ouverts', models.IntegerField(default=0)),
+                ('newsletter', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='statistiques', to='newsletters.newsletter')),
+            ],
+        ),
+        migrations.RunPython(initialiser_statistiques, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletters', '0004_statistiques'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetriqueEnvoi',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularite', models.CharField(choices=[('minute', 'Minute'), ('heure', 'Heure')], max_length=10)),
+                ('debut', models.DateTimeField()),
+                ('envoyes', models.IntegerField(default=0)),
+                ('erreurs', models.IntegerField(default=0)),
+                ('rebonds', models.IntegerField(default=0)),
+                ('desabonnes', models.IntegerField(default=0)),
+                ('newsletter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metriques', to='newsletters.newsletter')),
+            ],
+            options={
+                'ordering': ['debut'],
+                'unique_together': {('newsletter', 'granularite', 'debut')},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletters', '0005_metriques_envoi'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='subscriber',
+            name='token_desabonnement',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(condition=models.Q(('token_desabonnement__isnull', False)), fields=['token_desabonnement'], name='subscriber_token_historique'),
+        ),
+    ]
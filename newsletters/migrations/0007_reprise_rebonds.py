@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletters', '0006_subscriber_token_signe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepriseRebonds',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=500, unique=True)),
+                ('position', models.BigIntegerField(default=0)),
+                ('marque', models.CharField(blank=True, default='', max_length=500)),
+                ('messages_traites', models.IntegerField(default=0)),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletters', '0007_reprise_rebonds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Suppression',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('motif', models.CharField(choices=[('rebond', 'Rebond permanent'), ('plainte', 'Plainte'), ('manuel', 'Blocage manuel'), ('role', 'Adresse de rôle')], max_length=20)),
+                ('date_ajout', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletters', '0008_suppression'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsletter',
+            name='suivi_ouvertures',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='Evenement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('ouverture', 'Ouverture')], max_length=20)),
+                ('date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('newsletter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='evenements', to='newsletters.newsletter')),
+                ('subscriber', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='newsletters.subscriber')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['newsletter', 'type', 'subscriber'], name='evenement_newsletter_type'), models.Index(fields=['date'], name='evenement_date')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletters', '0009_evenement_suivi_ouvertures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsletter',
+            name='suivi_clics',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='evenement',
+            name='type',
+            field=models.CharField(choices=[('ouverture', 'Ouverture'), ('clic', 'Clic')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='Lien',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=16)),
+                ('url', models.TextField()),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('newsletter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='liens', to='newsletters.newsletter')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='evenement',
+            name='lien',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='newsletters.lien'),
+        ),
+        migrations.AddIndex(
+            model_name='lien',
+            index=models.Index(fields=['newsletter', 'version'], name='lien_newsletter_version'),
+        ),
+    ]
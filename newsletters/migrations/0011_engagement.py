@@ -0,0 +1,48 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletters', '0010_lien_suivi_clics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepriseAgregation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dernier_evenement', models.BigIntegerField(default=0)),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='subscriber',
+            name='dernier_clic',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='subscriber',
+            name='derniere_ouverture',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='EngagementJour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('ouvertures', models.IntegerField(default=0)),
+                ('ouvreurs', models.IntegerField(default=0)),
+                ('clics', models.IntegerField(default=0)),
+                ('cliqueurs', models.IntegerField(default=0)),
+                ('newsletter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='engagement', to='newsletters.newsletter')),
+            ],
+            options={
+                'ordering': ['jour'],
+                'unique_together': {('newsletter', 'jour')},
+            },
+        ),
+    ]
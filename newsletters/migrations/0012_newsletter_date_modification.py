@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletters', '0011_engagement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsletter',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
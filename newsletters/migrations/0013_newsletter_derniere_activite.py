@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletters', '0012_newsletter_date_modification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsletter',
+            name='derniere_activite',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
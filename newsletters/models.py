@@ -1,7 +1,18 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.utils import timezone
-import hashlib
-from datetime import datetime
+from functools import lru_cache
+from new import SignataireDesabonnement
+
+@lru_cache(maxsize=None)
+def signataire_desabonnement():
+    """Signataire partagé des tokens de désabonnement (settings.UNSUBSCRIBE_TOKEN_KEYS)"""
+    return SignataireDesabonnement(settings.UNSUBSCRIBE_TOKEN_KEYS)
+
+@lru_cache(maxsize=None)
+def signataire_suivi():
+    """Signataire des tokens de suivi (pixel, redirections) : ils ne permettent pas de se désabonner"""
+    return SignataireDesabonnement(settings.UNSUBSCRIBE_TOKEN_KEYS, usage='suivi')
 
 class Subscriber(models.Model):
     email = models.EmailField(unique=True)
@@ -9,25 +20,51 @@ class Subscriber(models.Model):
     prenom = models.CharField(max_length=100, null=True, blank=True)
     date_inscription = models.DateTimeField(auto_now_add=True)
     statut = models.CharField(max_length=20, default='actif')
-    token_desabonnement = models.CharField(max_length=32, unique=True)
+    # Token aléatoire historique, conservé uniquement pour les liens déjà envoyés
+    token_desabonnement = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    # Dernier engagement connu, maintenu par l'agrégation des événements (segments par engagement)
+    derniere_ouverture = models.DateTimeField(null=True, blank=True, db_index=True)
+    dernier_clic = models.DateTimeField(null=True, blank=True, db_index=True)
 
-    def save(self, *args, **kwargs):
-        if not self.token_desabonnement:
-            self.token_desabonnement = self.generate_unsubscribe_token()
-        super().save(*args, **kwargs)
+    @property
+    def token_signe(self):
+        """Token de désabonnement signé, dérivé de l'id (rien n'est stocké)"""
+        return signataire_desabonnement().signer(self.pk)
+
+    @property
+    def token_suivi(self):
+        """Token du pixel et des liens suivis, distinct du token de désabonnement"""
+        return signataire_suivi().signer(self.pk)
 
-    def generate_unsubscribe_token(self):
-        return hashlib.sha256(f"{self.email}_{datetime.now().isoformat()}".encode()).hexdigest()[:32]
+    @classmethod
+    def filtre_token(cls, token):
+        """Filtre par clé primaire pour un token signé, par token historique sinon"""
+        subscriber_id = signataire_desabonnement().verifier(token)
+        if subscriber_id is not None:
+            return {'pk': subscriber_id}
+        return {'token_desabonnement': token}
 
     def __str__(self):
         return self.email
 
+    class Meta:
+        indexes = [
+            # Index partiel : seuls les abonnés disposant d'un token historique y figurent
+            models.Index(
+                fields=['token_desabonnement'],
+                name='subscriber_token_historique',
+                condition=models.Q(token_desabonnement__isnull=False),
+            ),
+        ]
+
 class Newsletter(models.Model):
     titre = models.CharField(max_length=200)
     objet = models.CharField(max_length=200)
     contenu_html = models.TextField()
     contenu_text = models.TextField(blank=True)
     date_creation = models.DateTimeField(auto_now_add=True)
+    # Mise à jour à chaque enregistrement : Last-Modified et version des rendus en cache
+    date_modification = models.DateTimeField(auto_now=True)
     date_envoi = models.DateTimeField(null=True, blank=True)
     date_envoi_planifie = models.DateTimeField(null=True, blank=True)
     statut = models.CharField(
@@ -48,6 +85,13 @@ class Newsletter(models.Model):
     ajouter_social = models.BooleanField(default=False)
     destinataires_cc = models.TextField(blank=True, null=True)
     destinataires_cci = models.TextField(blank=True, null=True)
+    # Pixel de suivi des ouvertures ajouté aux emails (sur option)
+    suivi_ouvertures = models.BooleanField(default=False)
+    # Liens réécrits vers une redirection de suivi des clics (sur option)
+    suivi_clics = models.BooleanField(default=False)
+    # Dernier signe de vie du processus qui envoie la newsletter (statut en_cours), mis à jour
+    # à chaque lot : un envoi sans nouvelle depuis NEWSLETTER_SEND_STALE_SECONDS est repris
+    derniere_activite = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return self.titre
@@ -57,14 +101,184 @@ class Newsletter(models.Model):
         verbose_name = 'Newsletter'
         verbose_name_plural = 'Newsletters'
 
+class EnvoiQuerySet(models.QuerySet):
+    def delete(self):
+        """Suppression groupée : compteurs décomptés par newsletter et statut, puis DELETE en une requête"""
+        from .stats import retirer_envois
+        with transaction.atomic():
+            retirer_envois(self)
+            return super().delete()
+
 class Envoi(models.Model):
     newsletter = models.ForeignKey(Newsletter, on_delete=models.CASCADE)
     subscriber = models.ForeignKey(Subscriber, on_delete=models.CASCADE)
     date_envoi = models.DateTimeField(auto_now_add=True)
     statut = models.CharField(max_length=20)
 
+    # Les écritures groupées (envois) passent par stats.creer_envois / changer_statut_envois ;
+    # save() et delete() ne tiennent les compteurs à jour que pour les modifications unitaires
+    objects = EnvoiQuerySet.as_manager()
+
     class Meta:
         unique_together = ('newsletter', 'subscriber')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Mémoriser le statut chargé pour détecter les transitions à l'enregistrement
+        instance._statut_initial = instance.__dict__.get('statut')
+        return instance
+
+    def save(self, *args, **kwargs):
+        from .stats import enregistrer_transition
+        ancien_statut = getattr(self, '_statut_initial', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if ancien_statut != self.statut:
+                enregistrer_transition(self.newsletter_id, ancien_statut, self.statut)
+        self._statut_initial = self.statut
+
+    def delete(self, *args, **kwargs):
+        from .stats import enregistrer_transition
+        with transaction.atomic():
+            resultat = super().delete(*args, **kwargs)
+            enregistrer_transition(self.newsletter_id, getattr(self, '_statut_initial', self.statut), None)
+        return resultat
+
+    def __str__(self):
+        return f"Envoi de {self.newsletter.titre} à {self.subscriber.email}"
+
+class StatistiquesNewsletter(models.Model):
+    """Compteurs pré-agrégés d'une newsletter, maintenus à chaque changement d'Envoi"""
+    newsletter = models.OneToOneField(Newsletter, on_delete=models.CASCADE, related_name='statistiques')
+    destinataires = models.IntegerField(default=0)
+    envoyes = models.IntegerField(default=0)
+    erreurs = models.IntegerField(default=0)
+    desabonnes = models.IntegerField(default=0)
+    ouverts = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Statistiques de {self.newsletter.titre}"
+
+class StatistiquesGlobales(models.Model):
+    """Compteurs globaux (ligne unique, pk=1)"""
+    destinataires = models.IntegerField(default=0)
+    envoyes = models.IntegerField(default=0)
+    erreurs = models.IntegerField(default=0)
+    desabonnes = models.IntegerField(default=0)
+    ouverts = models.IntegerField(default=0)
+
+    def __str__(self):
+        return "Statistiques globales"
+
+class MetriqueEnvoi(models.Model):
+    """Compteurs d'envoi agrégés par tranche de temps (minute ou heure)"""
+    GRANULARITES = [
+        ('minute', 'Minute'),
+        ('heure', 'Heure'),
+    ]
+
+    newsletter = models.ForeignKey(Newsletter, on_delete=models.CASCADE, related_name='metriques')
+    granularite = models.CharField(max_length=10, choices=GRANULARITES)
+    debut = models.DateTimeField()
+    envoyes = models.IntegerField(default=0)
+    erreurs = models.IntegerField(default=0)
+    rebonds = models.IntegerField(default=0)
+    desabonnes = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('newsletter', 'granularite', 'debut')
+        ordering = ['debut']
+
+    def __str__(self):
+        return f"{self.newsletter_id} - {self.granularite} {self.debut:%d/%m/%Y %H:%M}"
+
+class RepriseRebonds(models.Model):
+    """Point de reprise du traitement des rebonds, par source (mbox ou dossier)"""
+    source = models.CharField(max_length=500, unique=True)
+    # mbox : octet de début du prochain message ; dossier : dernier fichier traité (mtime_ns:nom)
+    position = models.BigIntegerField(default=0)
+    marque = models.CharField(max_length=500, blank=True, default='')
+    messages_traites = models.IntegerField(default=0)
+    date_maj = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.source
+
+class Suppression(models.Model):
+    """Adresse exclue de tous les envois (liste de suppression globale)"""
+    MOTIFS = [
+        ('rebond', 'Rebond permanent'),
+        ('plainte', 'Plainte'),
+        ('manuel', 'Blocage manuel'),
+        ('role', 'Adresse de rôle'),
+    ]
+
+    email = models.EmailField(unique=True)
+    motif = models.CharField(max_length=20, choices=MOTIFS)
+    date_ajout = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.email} ({self.motif})"
+
+class Lien(models.Model):
+    """Lien suivi d'une newsletter : URL d'origine derrière un identifiant court de redirection"""
+    newsletter = models.ForeignKey(Newsletter, on_delete=models.CASCADE, related_name='liens')
+    # Empreinte du contenu HTML : les liens sont extraits une seule fois par version
+    version = models.CharField(max_length=16)
+    url = models.TextField()
+    date_creation = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['newsletter', 'version'], name='lien_newsletter_version'),
+        ]
+
+    def __str__(self):
+        return self.url
+
+class Evenement(models.Model):
+    """Événement d'engagement brut (ouverture, clic), inséré par lots depuis le tampon en mémoire"""
+    TYPES = [
+        ('ouverture', 'Ouverture'),
+        ('clic', 'Clic'),
+    ]
+
+    type = models.CharField(max_length=20, choices=TYPES)
+    newsletter = models.ForeignKey(Newsletter, on_delete=models.CASCADE, related_name='evenements')
+    subscriber = models.ForeignKey(Subscriber, on_delete=models.CASCADE, null=True, blank=True)
+    lien = models.ForeignKey(Lien, on_delete=models.CASCADE, null=True, blank=True)
+    date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['newsletter', 'type', 'subscriber'], name='evenement_newsletter_type'),
+            models.Index(fields=['date'], name='evenement_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.type} - {self.newsletter_id} - {self.subscriber_id}"
+
+class EngagementJour(models.Model):
+    """Agrégat quotidien des événements d'une newsletter, conservé après la purge des événements bruts"""
+    newsletter = models.ForeignKey(Newsletter, on_delete=models.CASCADE, related_name='engagement')
+    jour = models.DateField()
+    ouvertures = models.IntegerField(default=0)
+    ouvreurs = models.IntegerField(default=0)
+    clics = models.IntegerField(default=0)
+    cliqueurs = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('newsletter', 'jour')
+        ordering = ['jour']
+
+    def __str__(self):
+        return f"{self.newsletter_id} - {self.jour:%d/%m/%Y}"
+
+class RepriseAgregation(models.Model):
+    """Point de reprise de l'agrégation des événements (ligne unique, pk=1)"""
+    dernier_evenement = models.BigIntegerField(default=0)
+    date_maj = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"Envoi de {self.newsletter.titre} à {self.subscriber.email}" 
\ No newline at end of file
+        return f"Agrégation jusqu'à l'événement {self.dernier_evenement}"
@@ -0,0 +1,35 @@
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import cached_property
+from .models import Newsletter
+
+# Le total n'est recompté qu'à l'expiration ou après une création / suppression
+DUREE_CACHE_COMPTE = 300
+
+def _cle_compte(modele):
+    return f"compte:{modele._meta.label_lower}"
+
+class PaginatorCompteEnCache(Paginator):
+    """Paginator dont le nombre total d'éléments (COUNT(*) non filtré) est lu dans le cache"""
+
+    @cached_property
+    def count(self):
+        cle = _cle_compte(self.object_list.model)
+        total = cache.get(cle)
+        if total is None:
+            total = super().count
+            cache.set(cle, total, DUREE_CACHE_COMPTE)
+        return total
+
+@receiver(post_save, sender=Newsletter)
+def newsletter_enregistree(sender, instance, created, **kwargs):
+    """Invalide le total en cache à la création d'une newsletter"""
+    if created:
+        cache.delete(_cle_compte(sender))
+
+@receiver(post_delete, sender=Newsletter)
+def newsletter_supprimee(sender, instance, **kwargs):
+    """Invalide le total en cache à la suppression d'une newsletter"""
+    cache.delete(_cle_compte(sender))
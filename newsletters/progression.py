@@ -0,0 +1,139 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from .telemetrie import DEBIT
+import asyncio
+import json
+import time
+
+# Un envoi sans nouvelle depuis ce délai est considéré comme interrompu (processus arrêté)
+DUREE_PROGRESSION = 3600
+
+# Délai de reconnexion suggéré au client EventSource, en ms
+RECONNEXION_MS = 2000
+
+# Commentaire SSE envoyé en l'absence de changement, pour que les proxys gardent la connexion
+INTERVALLE_MAINTIEN = 15
+
+ETATS_TERMINES = ('envoye', 'envoye_partiel', 'erreur')
+
+def _cle(newsletter_id):
+    return f"progression:{newsletter_id}"
+
+class Progression:
+    """Avancement d'un envoi, publié dans le cache partagé à chaque lot.
+
+    Un seul processus envoie une campagne donnée : l'état complet est réécrit à chaque
+    publication, sans compteur partagé à incrémenter.
+    """
+
+    def __init__(self, newsletter_id, total, taille_lot=None, statut='en_cours'):
+        self.newsletter_id = newsletter_id
+        # statut en_attente : envoi confié au scheduler, pas encore démarré
+        self.etat = {
+            'total': total, 'envoyes': 0, 'erreurs': 0, 'lots': 0,
+            'debut': time.time(), 'maj': time.time(), 'statut': statut,
+        }
+        self.taille_lot = taille_lot or getattr(settings, 'NEWSLETTER_PROGRESS_BATCH_SIZE', 100)
+        self._en_attente = 0
+        self._publier()
+
+    def _publier(self):
+        self.etat['maj'] = time.time()
+        cache.set(_cle(self.newsletter_id), dict(self.etat), DUREE_PROGRESSION)
+        if self.etat['statut'] == 'en_cours':
+            traites = self.etat['envoyes'] + self.etat['erreurs']
+            DEBIT.set(traites / max(self.etat['maj'] - self.etat['debut'], 1e-6))
+        else:
+            DEBIT.set(0)
+
+    def avancer(self, envoyes=0, erreurs=0):
+        """Compte des messages traités ; publie une fois par lot de taille_lot messages"""
+        self.etat['envoyes'] += envoyes
+        self.etat['erreurs'] += erreurs
+        self._en_attente += envoyes + erreurs
+        if self._en_attente >= self.taille_lot:
+            self.etat['lots'] += 1
+            self._en_attente = 0
+            self._publier()
+
+    def terminer(self, statut, message=None):
+        self.etat['statut'] = statut
+        if self._en_attente:
+            self.etat['lots'] += 1
+            self._en_attente = 0
+        if message:
+            self.etat['message'] = message
+        self._publier()
+
+def lire_progression(newsletter_id):
+    """Dernier état publié, complété du débit (messages/s) et du temps restant estimé ; None si aucun envoi"""
+    etat = cache.get(_cle(newsletter_id))
+    if etat is None:
+        return None
+    traites = etat['envoyes'] + etat['erreurs']
+    fin = etat['maj'] if etat['statut'] in ETATS_TERMINES else time.time()
+    duree = max(fin - etat['debut'], 1e-6)
+    etat['debit'] = round(traites / duree, 1)
+    restants = max(etat['total'] - traites, 0)
+    if etat['statut'] in ETATS_TERMINES:
+        etat['eta'] = 0
+    else:
+        etat['eta'] = round(restants / etat['debit']) if etat['debit'] else None
+    return etat
+
+def _evenement(nom, donnees):
+    return f"event: {nom}\ndata: {json.dumps(donnees)}\n\n"
+
+class FluxProgression:
+    """Évènements Server-Sent Events de l'avancement d'un envoi.
+
+    Relit le cache toutes les NEWSLETTER_PROGRESS_POLL_MS ms (jamais la table Envoi) et n'émet
+    que les changements. Le flux se ferme à la fin de l'envoi, ou après
+    NEWSLETTER_PROGRESS_STREAM_SECONDS : le navigateur se reconnecte alors de lui-même.
+    """
+
+    def __init__(self, newsletter_id, duree_max=None):
+        self.newsletter_id = newsletter_id
+        self.intervalle = getattr(settings, 'NEWSLETTER_PROGRESS_POLL_MS', 500) / 1000
+        self.duree_max = duree_max or getattr(settings, 'NEWSLETTER_PROGRESS_STREAM_SECONDS', 300)
+        self.dernier = None
+        self.dernier_envoi = time.monotonic()
+        self.fin = time.monotonic() + self.duree_max
+        self.termine = False
+
+    def _etape(self, etat):
+        """Évènements à émettre pour l'état lu ; marque le flux terminé si l'envoi l'est"""
+        if etat is None:
+            self.termine = True
+            return [f"retry: {RECONNEXION_MS}\n\n" + _evenement('inactif', {})]
+        morceaux = []
+        if self.dernier is None:
+            morceaux.append(f"retry: {RECONNEXION_MS}\n\n")
+        if etat['maj'] != (self.dernier or {}).get('maj'):
+            morceaux.append(_evenement('progression', etat))
+            self.dernier = etat
+        if etat['statut'] in ETATS_TERMINES:
+            morceaux.append(_evenement('fin', etat))
+            self.termine = True
+        elif not morceaux and time.monotonic() - self.dernier_envoi >= INTERVALLE_MAINTIEN:
+            morceaux.append(': maintien\n\n')
+        if morceaux:
+            self.dernier_envoi = time.monotonic()
+        return morceaux
+
+    def __iter__(self):
+        """Flux synchrone (serveur WSGI : occupe un worker tant que la connexion est ouverte)"""
+        while not self.termine and time.monotonic() < self.fin:
+            yield from self._etape(lire_progression(self.newsletter_id))
+            if not self.termine:
+                time.sleep(self.intervalle)
+
+    async def __aiter__(self):
+        """Flux asynchrone (serveur ASGI : aucune ressource bloquée entre deux lectures)"""
+        lire = sync_to_async(lire_progression)
+        while not self.termine and time.monotonic() < self.fin:
+            for morceau in self._etape(await lire(self.newsletter_id)):
+                yield morceau
+            if not self.termine:
+                await asyncio.sleep(self.intervalle)
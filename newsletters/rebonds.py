@@ -0,0 +1,207 @@
+from django.db import transaction
+from email import message_from_bytes, message_from_string
+from email.utils import parseaddr
+from new import ENTETE_NEWSLETTER
+from .models import Subscriber, Envoi, RepriseRebonds
+from .caches import invalider
+from .stats import enregistrer_envois_en_masse, enregistrer_rebond
+from .suppression import ajouter_suppressions
+from collections import Counter, defaultdict
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal d'éléments par requête IN
+TAILLE_IN = 500
+
+def _newsletter_origine(message):
+    """Retrouve l'id de newsletter dans les en-têtes du message d'origine joint au rapport"""
+    for partie in message.walk():
+        type_contenu = partie.get_content_type()
+        if type_contenu == 'message/rfc822':
+            origine = partie.get_payload()
+            entetes = origine[0] if isinstance(origine, list) and origine else None
+        elif type_contenu == 'text/rfc822-headers':
+            entetes = message_from_string(partie.get_payload(decode=True).decode('utf-8', 'replace'))
+        else:
+            continue
+        valeur = entetes.get(ENTETE_NEWSLETTER, '') if entetes is not None else ''
+        if valeur.strip().isdigit():
+            return int(valeur)
+    return None
+
+def analyser_dsn(message):
+    """Extrait [(email, 'dur' | 'temporaire', newsletter_id ou None)] d'un rapport DSN (RFC 3464)"""
+    if message.get_content_type() != 'multipart/report':
+        return []
+    rebonds = []
+    for partie in message.walk():
+        if partie.get_content_type() != 'message/delivery-status':
+            continue
+        # Premier bloc : champs du message ; les suivants : un bloc par destinataire
+        for bloc in partie.get_payload():
+            destinataire = bloc.get('Final-Recipient') or bloc.get('Original-Recipient')
+            if not destinataire:
+                continue
+            email = parseaddr(destinataire.split(';', 1)[-1].strip())[1].lower()
+            action = (bloc.get('Action') or '').strip().lower()
+            statut = (bloc.get('Status') or '').strip()
+            if action not in ('failed', 'delayed') or not email:
+                continue
+            # 5.x.x : échec permanent ; 4.x.x ou livraison retardée : échec temporaire
+            gravite = 'temporaire' if action == 'delayed' or statut.startswith('4') else 'dur'
+            rebonds.append((email, gravite))
+    if not rebonds:
+        return []
+    newsletter_id = _newsletter_origine(message)
+    return [(email, gravite, newsletter_id) for email, gravite in rebonds]
+
+def iter_mbox(chemin, position=0):
+    """Génère (contenu, position suivante) pour chaque message d'un mbox, à partir d'un octet donné"""
+    with open(chemin, 'rb') as f:
+        f.seek(position)
+        lignes = []
+        while True:
+            ligne = f.readline()
+            if not ligne or ligne.startswith(b'From '):
+                if lignes:
+                    yield b''.join(lignes), f.tell() - len(ligne)
+                    lignes = []
+                if not ligne:
+                    return
+                continue
+            lignes.append(ligne)
+
+def _cle_fichier(entree):
+    # Maildir renomme new/x en cur/x:2,S : seule la partie avant ':' identifie le message
+    return f"{entree.stat().st_mtime_ns:020d}:{entree.name.split(':', 1)[0]}"
+
+def iter_dossier(chemin, marque=''):
+    """Génère (contenu, clé) pour les fichiers d'un Maildir (new/ et cur/) ou d'un dossier de dépôt
+    postérieurs à la marque, du plus ancien au plus récent"""
+    if os.path.isdir(os.path.join(chemin, 'cur')):
+        dossiers = [os.path.join(chemin, 'new'), os.path.join(chemin, 'cur')]
+    else:
+        dossiers = [chemin]
+    fichiers = []
+    for dossier in dossiers:
+        if not os.path.isdir(dossier):
+            continue
+        with os.scandir(dossier) as entrees:
+            for entree in entrees:
+                if entree.is_file() and not entree.name.startswith('.'):
+                    cle = _cle_fichier(entree)
+                    if cle > marque:
+                        fichiers.append((cle, entree.path))
+    fichiers.sort()
+    for cle, fichier in fichiers:
+        with open(fichier, 'rb') as f:
+            yield f.read(), cle
+
+def _derniers_envois(subscriber_ids):
+    """Dernier Envoi 'envoye' de chaque abonné : {subscriber_id: newsletter_id}"""
+    derniers = {}
+    for debut in range(0, len(subscriber_ids), TAILLE_IN):
+        derniers.update(Envoi.objects.filter(
+            subscriber_id__in=subscriber_ids[debut:debut + TAILLE_IN], statut='envoye'
+        ).order_by('date_envoi').values_list('subscriber_id', 'newsletter_id'))
+    return derniers
+
+def appliquer_rebonds(rebonds):
+    """Applique un lot de rebonds : abonnés et Envois en échec permanent passent au statut 'rebond'"""
+    durs = {}
+    temporaires = Counter()
+    for email, gravite, newsletter_id in rebonds:
+        if gravite == 'dur':
+            durs[email] = newsletter_id or durs.get(email)
+        else:
+            temporaires[newsletter_id] += 1
+
+    emails = list(durs)
+    ids_par_email = {}
+    for debut in range(0, len(emails), TAILLE_IN):
+        ids_par_email.update(Subscriber.objects.filter(
+            email__in=emails[debut:debut + TAILLE_IN]
+        ).values_list('email', 'id'))
+    abonnes = 0
+    for debut in range(0, len(emails), TAILLE_IN):
+        abonnes += Subscriber.objects.filter(
+            email__in=emails[debut:debut + TAILLE_IN], statut='actif'
+        ).update(statut='rebond')
+    if abonnes:
+        invalider('abonnes')
+    # Exclus de tous les envois suivants, y compris s'ils se réabonnent
+    ajouter_suppressions(emails, 'rebond')
+
+    # Newsletter d'origine : en-tête du message joint, sinon dernier envoi reçu
+    sans_origine = [ids_par_email[email] for email, n in durs.items() if n is None and email in ids_par_email]
+    derniers = _derniers_envois(sans_origine)
+    par_newsletter = defaultdict(list)
+    for email, newsletter_id in durs.items():
+        subscriber_id = ids_par_email.get(email)
+        newsletter_id = newsletter_id or derniers.get(subscriber_id)
+        if subscriber_id and newsletter_id:
+            par_newsletter[newsletter_id].append(subscriber_id)
+
+    envois = 0
+    for newsletter_id, subscriber_ids in par_newsletter.items():
+        nombre = Envoi.objects.filter(
+            newsletter_id=newsletter_id, subscriber_id__in=subscriber_ids, statut='envoye'
+        ).update(statut='rebond')
+        enregistrer_envois_en_masse(newsletter_id, 'envoye', 'rebond', nombre)
+        enregistrer_rebond(newsletter_id, len(subscriber_ids))
+        envois += nombre
+    for newsletter_id, nombre in temporaires.items():
+        if newsletter_id is not None:
+            enregistrer_rebond(newsletter_id, nombre)
+    return {'durs': len(durs), 'temporaires': sum(temporaires.values()), 'abonnes': abonnes, 'envois': envois}
+
+def traiter_source(chemin, taille_lot=500, simulation=False):
+    """Traite les nouveaux messages d'un mbox ou d'un dossier, par lots, avec point de reprise.
+
+    Chaque lot et l'avancée du point de reprise sont enregistrés dans la même transaction :
+    un message n'est jamais appliqué deux fois, même après une interruption.
+    """
+    chemin = os.path.abspath(chemin)
+    reprise, _ = RepriseRebonds.objects.get_or_create(source=chemin)
+    if os.path.isdir(chemin):
+        messages = iter_dossier(chemin, reprise.marque)
+    else:
+        stat = os.stat(chemin)
+        # mbox tronqué ou remplacé (rotation) : reprendre au début du nouveau fichier
+        if stat.st_size < reprise.position or reprise.marque not in ('', str(stat.st_ino)):
+            logger.info(f"{chemin} a changé depuis le dernier passage, reprise au début")
+            reprise.position = 0
+        reprise.marque = str(stat.st_ino)
+        messages = iter_mbox(chemin, reprise.position)
+
+    resume = Counter()
+    lot = []
+
+    def valider(avancee):
+        rebonds = [rebond for rebonds_message in lot for rebond in rebonds_message]
+        resume['messages'] += len(lot)
+        resume['rapports'] += sum(1 for rebonds_message in lot if rebonds_message)
+        if simulation:
+            resume['durs'] += sum(1 for rebond in rebonds if rebond[1] == 'dur')
+            resume['temporaires'] += sum(1 for rebond in rebonds if rebond[1] == 'temporaire')
+            return
+        with transaction.atomic():
+            resume.update(appliquer_rebonds(rebonds))
+            if os.path.isdir(chemin):
+                reprise.marque = avancee
+            else:
+                reprise.position = avancee
+            reprise.messages_traites += len(lot)
+            reprise.save()
+
+    avancee = None
+    for contenu, avancee in messages:
+        lot.append(analyser_dsn(message_from_bytes(contenu)))
+        if len(lot) >= taille_lot:
+            valider(avancee)
+            lot.clear()
+    if lot:
+        valider(avancee)
+    return dict(resume)
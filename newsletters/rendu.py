@@ -0,0 +1,73 @@
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.middleware.csrf import get_token
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from .caches import lire_generation, incrementer_generation
+from .models import Newsletter
+import hashlib
+
+# Durée de conservation d'une page rendue (les versions périmées ne sont plus jamais lues)
+DUREE_CACHE_RENDU = 3600
+
+def _cle_generation(newsletter_id):
+    return f"rendu:generation:{newsletter_id}"
+
+def invalider_rendu(newsletter_id):
+    """Rend obsolètes toutes les pages en cache de la newsletter (appelé par newsletters.invalidation)"""
+    incrementer_generation(_cle_generation(newsletter_id))
+
+def _variante(request):
+    # La page contient le nom de l'utilisateur et un jeton CSRF dérivé du secret de sa session :
+    # une entrée de cache par couple (utilisateur, secret CSRF)
+    get_token(request)
+    return hashlib.sha1(f"{request.user.pk}:{request.META.get('CSRF_COOKIE', '')}".encode()).hexdigest()[:16]
+
+def _non_modifie(request, etag, modifiee):
+    """Vrai si la copie du navigateur est à jour (If-None-Match prioritaire sur If-Modified-Since)"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(modifiee.timestamp()) <= if_modified_since
+
+def rendu_newsletter(request, newsletter_id, template):
+    """Page d'une newsletter servie depuis le cache, avec ETag / Last-Modified et réponses 304.
+
+    Seule la date de modification est lue en base, une fois par génération ; la page n'est
+    rendue qu'à la première consultation de chaque version.
+    """
+    generation = lire_generation(_cle_generation(newsletter_id))
+    cle_modifiee = f"rendu:modifiee:{newsletter_id}:{generation}"
+    modifiee = cache.get(cle_modifiee)
+    if modifiee is None:
+        modifiee = Newsletter.objects.filter(pk=newsletter_id).values_list('date_modification', flat=True).first()
+        if modifiee is None:
+            raise Http404("Newsletter introuvable")
+        cache.set(cle_modifiee, modifiee, DUREE_CACHE_RENDU)
+    if len(get_messages(request)):
+        # Des messages en attente : page ponctuelle, ni mise en cache ni réponse 304
+        return render(request, template, {'newsletter': Newsletter.objects.get(pk=newsletter_id)})
+
+    version = f"{generation}.{modifiee.timestamp():.6f}"
+    cle = f"rendu:{template}:{newsletter_id}:{version}:{_variante(request)}"
+    entree = cache.get(cle)
+    if entree is None:
+        contenu = render_to_string(template, {'newsletter': Newsletter.objects.get(pk=newsletter_id)}, request)
+        etag = '"' + hashlib.sha1(contenu.encode('utf-8')).hexdigest()[:20] + '"'
+        entree = (etag, contenu)
+        cache.set(cle, entree, DUREE_CACHE_RENDU)
+    etag, contenu = entree
+
+    if _non_modifie(request, etag, modifiee):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(contenu)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modifiee.timestamp())
+    # Le navigateur garde la page mais la revalide à chaque affichage
+    response['Cache-Control'] = 'private, no-cache'
+    return response
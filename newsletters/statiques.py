@@ -0,0 +1,158 @@
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+import gzip
+import logging
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Types de fichiers qui gagnent à être compressés (les images et polices woff2 le sont déjà)
+EXTENSIONS_COMPRESSIBLES = {
+    '.css', '.js', '.map', '.svg', '.html', '.txt', '.json', '.xml', '.ico', '.eot', '.ttf', '.otf',
+}
+
+# En deçà, l'en-tête Content-Encoding coûte plus que le gain
+TAILLE_MIN_COMPRESSION = 512
+
+# Variantes précompressées, par ordre de préférence
+ENCODAGES = (('br', '.br'), ('gzip', '.gz'))
+
+# Fichiers dont le nom contient l'empreinte du contenu : ils ne changent jamais
+CACHE_IMMUABLE = 'public, max-age=31536000, immutable'
+# Fichiers sous leur nom d'origine : courte durée, revalidés ensuite par ETag
+CACHE_COURT = 'public, max-age=60'
+
+def _compresser(chemin):
+    """Écrit les variantes .gz (et .br si le module brotli est installé) d'un fichier, si elles sont plus petites"""
+    with open(chemin, 'rb') as f:
+        donnees = f.read()
+    variantes = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variantes.append(('.br', lambda d: brotli.compress(d, quality=11)))
+    ecrites = []
+    for extension, compresser in variantes:
+        compresse = compresser(donnees)
+        if len(compresse) < len(donnees) * 0.95:
+            with open(chemin + extension, 'wb') as f:
+                f.write(compresse)
+            ecrites.append(chemin + extension)
+    return ecrites
+
+class StockageStatiquesCompresses(ManifestStaticFilesStorage):
+    """Fichiers statiques nommés par empreinte (manifest), précompressés à collectstatic"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        noms = set(paths) | set(self.hashed_files.values())
+        for nom in sorted(noms):
+            if os.path.splitext(nom)[1].lower() not in EXTENSIONS_COMPRESSIBLES or not self.exists(nom):
+                continue
+            if self.size(nom) < TAILLE_MIN_COMPRESSION:
+                continue
+            for chemin in _compresser(self.path(nom)):
+                yield nom, os.path.relpath(chemin, self.location), True
+
+def _encodages_acceptes(accept_encoding):
+    """Encodages acceptés par le client (q > 0) d'après l'en-tête Accept-Encoding"""
+    acceptes = set()
+    for element in accept_encoding.split(','):
+        nom, _, parametres = element.strip().partition(';')
+        parametres = parametres.replace(' ', '')
+        if parametres.startswith('q='):
+            try:
+                if float(parametres[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if nom:
+            acceptes.add(nom.lower())
+    return acceptes
+
+class FichierStatique:
+    """Fichier de STATIC_ROOT et ses variantes précompressées, indexés une fois au démarrage"""
+
+    def __init__(self, chemin, immuable):
+        self.chemin = chemin
+        self.type_mime = mimetypes.guess_type(chemin)[0] or 'application/octet-stream'
+        self.cache_control = CACHE_IMMUABLE if immuable else CACHE_COURT
+        self.variantes = {None: self._decrire(chemin)}
+        for encodage, extension in ENCODAGES:
+            if os.path.exists(chemin + extension):
+                self.variantes[encodage] = self._decrire(chemin + extension)
+
+    @staticmethod
+    def _decrire(chemin):
+        stat = os.stat(chemin)
+        return chemin, stat.st_size, f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+    def choisir(self, accept_encoding):
+        if len(self.variantes) > 1 and accept_encoding:
+            acceptes = _encodages_acceptes(accept_encoding)
+            for encodage, _ in ENCODAGES:
+                if encodage in self.variantes and (encodage in acceptes or '*' in acceptes):
+                    return encodage, self.variantes[encodage]
+        return None, self.variantes[None]
+
+class MiddlewareStatiques:
+    """Sert STATIC_ROOT depuis le processus applicatif, avant le reste de la pile de middlewares.
+
+    La variante précompressée est choisie selon Accept-Encoding ; les fichiers nommés par
+    empreinte sont servis avec un cache d'un an (immutable). Activé hors DEBUG, ou si
+    settings.NEWSLETTER_SERVE_STATIC le demande.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not getattr(settings, 'NEWSLETTER_SERVE_STATIC', not settings.DEBUG) or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.prefixe = '/' + settings.STATIC_URL.strip('/') + '/'
+        self.fichiers = self._indexer(settings.STATIC_ROOT)
+        logger.info(f"{len(self.fichiers)} fichiers statiques indexés dans {settings.STATIC_ROOT}")
+
+    @staticmethod
+    def _indexer(racine):
+        immuables = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        fichiers = {}
+        for dossier, _, noms in os.walk(racine):
+            for nom in noms:
+                if nom.endswith(('.gz', '.br')) or nom == 'staticfiles.json':
+                    continue
+                chemin = os.path.join(dossier, nom)
+                relatif = os.path.relpath(chemin, racine).replace(os.sep, '/')
+                fichiers[relatif] = FichierStatique(chemin, relatif in immuables)
+        return fichiers
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefixe):
+            fichier = self.fichiers.get(request.path_info[len(self.prefixe):])
+            if fichier is not None:
+                return self._servir(request, fichier)
+        return self.get_response(request)
+
+    def _servir(self, request, fichier):
+        encodage, (chemin, _, etag) = fichier.choisir(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            # Le serveur WSGI transmet le fichier (sendfile) ; le corps est omis pour HEAD
+            response = FileResponse(open(chemin, 'rb'), content_type=fichier.type_mime)
+            # Sans quoi le nom de la variante (.gz, .br) apparaîtrait dans Content-Disposition
+            del response['Content-Disposition']
+        if encodage:
+            response['Content-Encoding'] = encodage
+        if len(fichier.variantes) > 1:
+            response['Vary'] = 'Accept-Encoding'
+        response['ETag'] = etag
+        response['Cache-Control'] = fichier.cache_control
+        return response
@@ -0,0 +1,251 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import Newsletter, Subscriber, Envoi, StatistiquesNewsletter, StatistiquesGlobales, MetriqueEnvoi
+from .caches import invalider, generation
+from datetime import timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Taille des listes d'ids passées dans une clause IN
+TAILLE_IN = 500
+
+# Compteur incrémenté pour chaque statut d'Envoi (les autres statuts ne comptent que comme destinataires)
+COMPTEURS_PAR_STATUT = {
+    'envoye': 'envoyes',
+    'erreur': 'erreurs',
+}
+
+def _deltas_transition(ancien_statut, nouveau_statut):
+    """Calcule les variations de compteurs pour un changement de statut d'Envoi"""
+    deltas = {}
+    if ancien_statut is None:
+        deltas['destinataires'] = 1
+    if nouveau_statut is None:
+        deltas['destinataires'] = -1
+    ancien = COMPTEURS_PAR_STATUT.get(ancien_statut)
+    nouveau = COMPTEURS_PAR_STATUT.get(nouveau_statut)
+    if ancien != nouveau:
+        if ancien:
+            deltas[ancien] = deltas.get(ancien, 0) - 1
+        if nouveau:
+            deltas[nouveau] = deltas.get(nouveau, 0) + 1
+    return {champ: delta for champ, delta in deltas.items() if delta}
+
+def _appliquer(newsletter_id, deltas):
+    """Applique les variations aux compteurs de la newsletter et aux compteurs globaux"""
+    if not deltas:
+        return
+    compteurs = {champ: F(champ) + delta for champ, delta in deltas.items()}
+    with transaction.atomic():
+        if not StatistiquesGlobales.objects.filter(pk=1).update(**compteurs):
+            StatistiquesGlobales.objects.get_or_create(pk=1)
+            StatistiquesGlobales.objects.filter(pk=1).update(**compteurs)
+        if newsletter_id is None:
+            return
+        # Une ligne absente n'est créée que pour une augmentation : lors de la suppression
+        # en cascade d'une newsletter, ses statistiques peuvent déjà avoir disparu
+        if (not StatistiquesNewsletter.objects.filter(newsletter_id=newsletter_id).update(**compteurs)
+                and any(delta > 0 for delta in deltas.values())):
+            StatistiquesNewsletter.objects.get_or_create(newsletter_id=newsletter_id)
+            StatistiquesNewsletter.objects.filter(newsletter_id=newsletter_id).update(**compteurs)
+    # Compteurs affichés dans la liste des newsletters
+    invalider('newsletters')
+
+def enregistrer_transition(newsletter_id, ancien_statut, nouveau_statut):
+    """Met à jour les compteurs lorsqu'un Envoi est créé, change de statut ou est supprimé"""
+    _appliquer(newsletter_id, _deltas_transition(ancien_statut, nouveau_statut))
+    champ = COMPTEURS_PAR_STATUT.get(nouveau_statut)
+    if champ and champ != COMPTEURS_PAR_STATUT.get(ancien_statut):
+        enregistrer_metrique(newsletter_id, champ)
+
+def enregistrer_envois_en_masse(newsletter_id, ancien_statut, nouveau_statut, nombre):
+    """Variante de enregistrer_transition pour un UPDATE/INSERT groupé de plusieurs Envois"""
+    if nombre:
+        deltas = _deltas_transition(ancien_statut, nouveau_statut)
+        _appliquer(newsletter_id, {champ: delta * nombre for champ, delta in deltas.items()})
+        champ = COMPTEURS_PAR_STATUT.get(nouveau_statut)
+        if champ and champ != COMPTEURS_PAR_STATUT.get(ancien_statut):
+            enregistrer_metrique(newsletter_id, champ, nombre)
+
+def creer_envois(newsletter_id, subscriber_ids, statut):
+    """Crée les Envois d'un lot (bulk_create) et met à jour les compteurs en une fois"""
+    with transaction.atomic():
+        Envoi.objects.bulk_create([
+            Envoi(newsletter_id=newsletter_id, subscriber_id=subscriber_id, statut=statut)
+            for subscriber_id in subscriber_ids
+        ], batch_size=TAILLE_IN)
+        enregistrer_envois_en_masse(newsletter_id, None, statut, len(subscriber_ids))
+
+def changer_statut_envois(newsletter_id, ancien_statut, nouveau_statut, subscriber_ids=None):
+    """Passe les Envois d'un lot (tous ceux de la newsletter sans subscriber_ids) de ancien_statut
+    à nouveau_statut par UPDATE groupé ; retourne le nombre d'Envois modifiés"""
+    envois = Envoi.objects.filter(newsletter_id=newsletter_id, statut=ancien_statut)
+    nombre = 0
+    with transaction.atomic():
+        if subscriber_ids is None:
+            nombre = envois.update(statut=nouveau_statut)
+        else:
+            subscriber_ids = list(subscriber_ids)
+            for debut in range(0, len(subscriber_ids), TAILLE_IN):
+                nombre += envois.filter(
+                    subscriber_id__in=subscriber_ids[debut:debut + TAILLE_IN]
+                ).update(statut=nouveau_statut)
+        enregistrer_envois_en_masse(newsletter_id, ancien_statut, nouveau_statut, nombre)
+    return nombre
+
+def retirer_envois(envois):
+    """Décompte des compteurs les Envois d'un queryset sur le point d'être supprimés"""
+    lignes = envois.order_by().values('newsletter_id', 'statut').annotate(nombre=Count('id'))
+    for ligne in lignes:
+        enregistrer_envois_en_masse(ligne['newsletter_id'], ligne['statut'], None, ligne['nombre'])
+
+def enregistrer_desabonnement(newsletter_id=None, nombre=1):
+    """Compte un (ou plusieurs) désabonnement(s), attribué(s) à la newsletter d'origine lorsqu'elle est connue"""
+    _appliquer(newsletter_id, {'desabonnes': nombre})
+    if newsletter_id is not None:
+        enregistrer_metrique(newsletter_id, 'desabonnes', nombre)
+
+def enregistrer_ouverture(newsletter_id, nombre=1):
+    """Compte une (ou plusieurs) première(s) ouverture(s) de la newsletter"""
+    _appliquer(newsletter_id, {'ouverts': nombre})
+
+# Durée d'une tranche pour chaque granularité
+DUREES_TRANCHES = {
+    'minute': timedelta(minutes=1),
+    'heure': timedelta(hours=1),
+}
+
+def debut_tranche(instant, granularite):
+    """Retourne le début de la tranche (minute ou heure) contenant l'instant"""
+    instant = instant.replace(second=0, microsecond=0)
+    if granularite == 'heure':
+        instant = instant.replace(minute=0)
+    return instant
+
+def enregistrer_metrique(newsletter_id, champ, nombre=1, instant=None):
+    """Incrémente un compteur (envoyes, erreurs, rebonds, desabonnes) dans les tranches minute et heure"""
+    instant = instant or timezone.now()
+    with transaction.atomic():
+        for granularite, _ in MetriqueEnvoi.GRANULARITES:
+            tranche = MetriqueEnvoi.objects.filter(
+                newsletter_id=newsletter_id,
+                granularite=granularite,
+                debut=debut_tranche(instant, granularite),
+            )
+            if not tranche.update(**{champ: F(champ) + nombre}):
+                MetriqueEnvoi.objects.get_or_create(
+                    newsletter_id=newsletter_id,
+                    granularite=granularite,
+                    debut=debut_tranche(instant, granularite),
+                )
+                tranche.update(**{champ: F(champ) + nombre})
+
+def enregistrer_rebond(newsletter_id, nombre=1):
+    """Compte un ou plusieurs rebonds (bounces) pour la newsletter"""
+    enregistrer_metrique(newsletter_id, 'rebonds', nombre)
+
+def get_metriques(newsletter_id, granularite, duree):
+    """Retourne les tranches de la période demandée, la tranche en cours étant lue en direct.
+
+    Les tranches closes ne changent plus : elles sont mises en cache sous une clé
+    qui inclut le début de la tranche courante, ce qui les invalide à la clôture.
+    """
+    tranche_courante = debut_tranche(timezone.now(), granularite)
+    valeurs = ('debut', 'envoyes', 'erreurs', 'rebonds', 'desabonnes')
+    cle = f"metriques:{newsletter_id}:{granularite}:{tranche_courante.timestamp():.0f}"
+    tranches_closes = cache.get(cle)
+    if tranches_closes is None:
+        tranches_closes = list(MetriqueEnvoi.objects.filter(
+            newsletter_id=newsletter_id,
+            granularite=granularite,
+            debut__gte=tranche_courante - duree,
+            debut__lt=tranche_courante,
+        ).values(*valeurs))
+        cache.set(cle, tranches_closes, timeout=int(DUREES_TRANCHES[granularite].total_seconds()))
+    en_cours = list(MetriqueEnvoi.objects.filter(
+        newsletter_id=newsletter_id,
+        granularite=granularite,
+        debut=tranche_courante,
+    ).values(*valeurs))
+    return tranches_closes + en_cours
+
+def get_statistiques_globales():
+    """Retourne la ligne des compteurs globaux (sans balayer les Envois)"""
+    statistiques, _ = StatistiquesGlobales.objects.get_or_create(pk=1)
+    return statistiques
+
+# Les totaux ci-dessous sont gardés jusqu'à la prochaine modification de leur groupe de cache
+DUREE_CACHE_TOTAUX = 24 * 3600
+
+def _total_en_cache(groupe, calculer):
+    cle = f"totaux:{groupe}:{generation(groupe)}"
+    totaux = cache.get(cle)
+    if totaux is None:
+        totaux = calculer()
+        cache.set(cle, totaux, DUREE_CACHE_TOTAUX)
+    return totaux
+
+def get_totaux():
+    """Totaux du tableau de bord : compteurs globaux des Envois et nombres d'abonnés / de newsletters.
+
+    Les Envois ne sont pas balayés (StatistiquesGlobales) ; les agrégats sur les abonnés et les
+    newsletters ne sont recalculés qu'après une modification (groupes 'abonnes' et 'newsletters').
+    """
+    from django.db.models import Q
+    abonnes = _total_en_cache('abonnes', lambda: Subscriber.objects.aggregate(
+        total=Count('id'),
+        actifs=Count('id', filter=Q(statut='actif')),
+    ))
+    def calculer_newsletters():
+        envoyees = Newsletter.objects.filter(statut='envoye')
+        return {
+            'envoyees': envoyees.count(),
+            'derniere': envoyees.order_by('-date_envoi').values_list('titre', 'date_envoi').first(),
+        }
+    newsletters = _total_en_cache('newsletters', calculer_newsletters)
+    globales = get_statistiques_globales()
+    return {
+        'abonnes_actifs': abonnes['actifs'],
+        'total_abonnes': abonnes['total'],
+        'newsletters_envoyees': newsletters['envoyees'],
+        'derniere_newsletter': newsletters['derniere'],
+        'emails_envoyes': globales.envoyes,
+        'erreurs': globales.erreurs,
+    }
+
+def recalculer_statistiques():
+    """Reconstruit tous les compteurs à partir des Envois (rattrapage ou vérification)"""
+    from django.db.models import Q
+    agregats = Envoi.objects.values('newsletter_id').annotate(
+        destinataires=Count('id'),
+        envoyes=Count('id', filter=Q(statut='envoye')),
+        erreurs=Count('id', filter=Q(statut='erreur')),
+    )
+    totaux = {'destinataires': 0, 'envoyes': 0, 'erreurs': 0}
+    with transaction.atomic():
+        StatistiquesNewsletter.objects.update(destinataires=0, envoyes=0, erreurs=0)
+        for ligne in agregats:
+            valeurs = {champ: ligne[champ] for champ in totaux}
+            StatistiquesNewsletter.objects.update_or_create(
+                newsletter_id=ligne['newsletter_id'], defaults=valeurs
+            )
+            for champ in totaux:
+                totaux[champ] += ligne[champ]
+        StatistiquesGlobales.objects.update_or_create(pk=1, defaults=totaux)
+    logger.info(f"Statistiques recalculées : {totaux}")
+    return totaux
+
+# Les Envois supprimés en cascade le sont par un DELETE groupé, sans signal :
+# ils sont décomptés avant la suppression de leur newsletter ou de leur abonné
+@receiver(pre_delete, sender=Newsletter)
+def newsletter_supprimee(sender, instance, **kwargs):
+    retirer_envois(Envoi.objects.filter(newsletter_id=instance.pk))
+
+@receiver(pre_delete, sender=Subscriber)
+def abonne_supprime(sender, instance, **kwargs):
+    retirer_envois(Envoi.objects.filter(subscriber_id=instance.pk))
@@ -0,0 +1,201 @@
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.urls import reverse
+from django.utils import timezone
+from .models import Newsletter, Subscriber, Lien, Evenement, signataire_suivi
+from .stats import enregistrer_ouverture
+from .telemetrie import FILE_ATTENTE
+from collections import Counter, defaultdict
+from functools import lru_cache
+import atexit
+import base64
+import hashlib
+import html
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# GIF transparent de 1x1 pixel, servi tel quel depuis la mémoire
+PIXEL_GIF = base64.b64decode('R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7')
+
+# Balise du pixel ; {{pixel_url}} est fusionné par destinataire à l'envoi
+BALISE_PIXEL = (
+    '<img src="{{pixel_url}}" width="1" height="1" alt="" '
+    'style="display:block;border:0;width:1px;height:1px">'
+)
+
+# Nombre maximal d'éléments par requête IN
+TAILLE_IN = 500
+
+# Liens <a href="..."> suivis : seules les URLs http(s) absolues sont réécrites
+LIEN_RE = re.compile(r'''(<a\b[^>]*?\bhref\s*=\s*)(["'])(https?://.*?)\2''', re.IGNORECASE | re.DOTALL)
+
+# Jeton remplacé dans l'URL de redirection par la balise de fusion du destinataire
+JETON = '__jeton__'
+
+BASE36 = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+def code_lien(lien_id):
+    """Identifiant court (base 36) d'un lien"""
+    code = ''
+    while True:
+        lien_id, reste = divmod(lien_id, 36)
+        code = BASE36[reste] + code
+        if not lien_id:
+            return code
+
+def ajouter_pixel(contenu_html):
+    """Insère le pixel de suivi juste avant </body> (à la fin du contenu à défaut)"""
+    position = contenu_html.lower().rfind('</body>')
+    if position == -1:
+        return contenu_html + BALISE_PIXEL
+    return contenu_html[:position] + BALISE_PIXEL + contenu_html[position:]
+
+def _existants(modele, ids):
+    """Ids réellement présents en base : un id disparu ferait échouer tout le lot"""
+    ids = list(ids)
+    existants = set()
+    for debut in range(0, len(ids), TAILLE_IN):
+        existants.update(modele.objects.filter(pk__in=ids[debut:debut + TAILLE_IN]).values_list('pk', flat=True))
+    return existants
+
+def _premieres_ouvertures(evenements):
+    """Couples (newsletter, abonné) ouverts pour la première fois dans ce lot"""
+    par_newsletter = defaultdict(set)
+    for type_evenement, newsletter_id, subscriber_id, _, _ in evenements:
+        if type_evenement == 'ouverture' and subscriber_id is not None:
+            par_newsletter[newsletter_id].add(subscriber_id)
+    premieres = []
+    for newsletter_id, subscriber_ids in par_newsletter.items():
+        ids = list(subscriber_ids)
+        deja_ouverts = set()
+        for debut in range(0, len(ids), TAILLE_IN):
+            deja_ouverts.update(Evenement.objects.filter(
+                type='ouverture', newsletter_id=newsletter_id, subscriber_id__in=ids[debut:debut + TAILLE_IN]
+            ).values_list('subscriber_id', flat=True))
+        premieres.extend((newsletter_id, subscriber_id) for subscriber_id in subscriber_ids - deja_ouverts)
+    return premieres
+
+class TamponEvenements:
+    """Accumule les événements en mémoire et les insère par lots, toutes les
+    settings.NEWSLETTER_EVENTS_FLUSH_MS ms ou dès NEWSLETTER_EVENTS_FLUSH_SIZE événements"""
+
+    def __init__(self):
+        self._evenements = []
+        self._lock = threading.Lock()
+        self._vidage = threading.Lock()
+        self._plein = threading.Event()
+        self._thread = None
+
+    @property
+    def intervalle(self):
+        return getattr(settings, 'NEWSLETTER_EVENTS_FLUSH_MS', 500) / 1000
+
+    @property
+    def taille(self):
+        return getattr(settings, 'NEWSLETTER_EVENTS_FLUSH_SIZE', 1000)
+
+    def __len__(self):
+        return len(self._evenements)
+
+    def ajouter(self, type_evenement, newsletter_id, subscriber_id=None, lien_id=None):
+        with self._lock:
+            self._evenements.append((type_evenement, newsletter_id, subscriber_id, lien_id, timezone.now()))
+            if len(self._evenements) >= self.taille:
+                self._plein.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._boucle, daemon=True)
+                self._thread.start()
+
+    def _boucle(self):
+        while True:
+            self._plein.wait(self.intervalle)
+            self._plein.clear()
+            try:
+                close_old_connections()
+                self.vider()
+            except Exception as e:
+                logger.error(f"Erreur lors de l'enregistrement des événements: {e}")
+
+    def vider(self):
+        """Insère les événements en attente, retourne le nombre d'événements enregistrés"""
+        with self._vidage:
+            with self._lock:
+                evenements, self._evenements = self._evenements, []
+            if not evenements:
+                return 0
+            newsletters = _existants(Newsletter, {e[1] for e in evenements})
+            abonnes = _existants(Subscriber, {e[2] for e in evenements if e[2] is not None})
+            evenements = [e for e in evenements if e[1] in newsletters and (e[2] is None or e[2] in abonnes)]
+            premieres = _premieres_ouvertures(evenements)
+            with transaction.atomic():
+                Evenement.objects.bulk_create([
+                    Evenement(
+                        type=type_evenement, newsletter_id=newsletter_id,
+                        subscriber_id=subscriber_id, lien_id=lien_id, date=date,
+                    )
+                    for type_evenement, newsletter_id, subscriber_id, lien_id, date in evenements
+                ], batch_size=TAILLE_IN)
+                for newsletter_id, nombre in Counter(newsletter_id for newsletter_id, _ in premieres).items():
+                    enregistrer_ouverture(newsletter_id, nombre)
+            logger.debug(f"{len(evenements)} événements enregistrés ({len(premieres)} premières ouvertures)")
+            return len(evenements)
+
+tampon_evenements = TamponEvenements()
+atexit.register(tampon_evenements.vider)
+FILE_ATTENTE.suivre(tampon_evenements.__len__, file='evenements')
+
+def signaler_ouverture(newsletter_id, token):
+    """Met en tampon l'ouverture signalée par le pixel ; un token non signé est ignoré (aucune requête)"""
+    subscriber_id = signataire_suivi().verifier(token)
+    if subscriber_id is not None:
+        tampon_evenements.ajouter('ouverture', newsletter_id, subscriber_id)
+
+def reecrire_liens(newsletter, contenu_html, base_url):
+    """Remplace chaque lien http(s) par sa redirection de suivi, avec la balise {{suivi_token}}.
+
+    Les liens sont enregistrés une seule fois par version du contenu ; un nouvel envoi
+    de la même version réutilise les identifiants existants.
+    """
+    version = hashlib.sha1(contenu_html.encode('utf-8')).hexdigest()[:16]
+    # Une URL contenant déjà une balise de fusion est propre à chaque destinataire : non suivie
+    urls = {html.unescape(correspondance.group(3)) for correspondance in LIEN_RE.finditer(contenu_html)}
+    urls = {url for url in urls if '{{' not in url}
+    if not urls:
+        return contenu_html
+    codes = dict(Lien.objects.filter(newsletter=newsletter, version=version).values_list('url', 'id'))
+    nouveaux = [Lien(newsletter=newsletter, version=version, url=url) for url in urls if url not in codes]
+    if nouveaux:
+        Lien.objects.bulk_create(nouveaux, batch_size=TAILLE_IN)
+        codes = dict(Lien.objects.filter(newsletter=newsletter, version=version).values_list('url', 'id'))
+        logger.info(f"{len(nouveaux)} liens suivis enregistrés pour la newsletter {newsletter.pk} (version {version})")
+    for url, lien_id in codes.items():
+        chemin = reverse('click_redirect', args=[code_lien(lien_id), JETON])
+        codes[url] = base_url + chemin.replace(JETON, '{{suivi_token}}')
+
+    def remplacer(correspondance):
+        cible = codes.get(html.unescape(correspondance.group(3)))
+        if cible is None:
+            return correspondance.group(0)
+        return correspondance.group(1) + correspondance.group(2) + cible + correspondance.group(2)
+
+    return LIEN_RE.sub(remplacer, contenu_html)
+
+@lru_cache(maxsize=100000)
+def _resoudre(code):
+    # Une exception n'est pas mise en cache : un code inconnu est revérifié à chaque fois
+    return Lien.objects.values_list('id', 'newsletter_id', 'url').get(pk=int(code, 36))
+
+def resoudre_lien(code):
+    """(lien_id, newsletter_id, url) d'un identifiant court, depuis le cache en mémoire ; None si inconnu"""
+    try:
+        return _resoudre(code)
+    except (ValueError, Lien.DoesNotExist):
+        return None
+
+def signaler_clic(lien_id, newsletter_id, token):
+    """Met en tampon le clic ; un token invalide n'empêche pas la redirection mais n'est pas compté"""
+    subscriber_id = signataire_suivi().verifier(token)
+    tampon_evenements.ajouter('clic', newsletter_id, subscriber_id, lien_id)
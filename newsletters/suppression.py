@@ -0,0 +1,103 @@
+from django.db.models import Count, Max
+from .models import Suppression
+import hashlib
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Parties locales d'adresses de rôle, jamais destinataires d'une newsletter
+ROLES = frozenset({
+    'abuse', 'admin', 'administrator', 'hostmaster', 'mailer-daemon', 'no-reply', 'noc',
+    'noreply', 'postmaster', 'root', 'security', 'webmaster',
+})
+
+# Nombre maximal d'éléments par requête IN
+TAILLE_IN = 500
+
+class FiltreBloom:
+    """Filtre de Bloom : appartenance approximative (faux positifs possibles, jamais de faux négatifs)"""
+
+    def __init__(self, capacite, taux_erreur=0.001):
+        capacite = max(capacite, 1024)
+        self.taille = int(-capacite * math.log(taux_erreur) / math.log(2) ** 2)
+        self.nb_hachages = max(1, round(self.taille / capacite * math.log(2)))
+        self.bits = bytearray((self.taille + 7) // 8)
+
+    def _positions(self, valeur):
+        # Double hachage : k positions dérivées de deux entiers de 64 bits
+        empreinte = hashlib.blake2b(valeur.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(empreinte[:8], 'little')
+        h2 = int.from_bytes(empreinte[8:], 'little') | 1
+        return ((h1 + i * h2) % self.taille for i in range(self.nb_hachages))
+
+    def ajouter(self, valeur):
+        for position in self._positions(valeur):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, valeur):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(valeur))
+
+class CacheSuppressions:
+    """Filtre construit une fois et réutilisé d'un envoi à l'autre tant que la table ne change pas"""
+
+    def __init__(self):
+        self._filtre = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def filtre(self):
+        # Une seule requête d'agrégat par envoi pour vérifier que le filtre est à jour
+        version = tuple(Suppression.objects.aggregate(nombre=Count('id'), dernier=Max('id')).values())
+        with self._lock:
+            if self._filtre is None or version != self._version:
+                filtre = FiltreBloom(version[0] * 2)
+                for email in Suppression.objects.values_list('email', flat=True).iterator(chunk_size=5000):
+                    filtre.ajouter(email.lower())
+                self._filtre, self._version = filtre, version
+                logger.info(f"Filtre de suppression construit : {version[0]} adresses, {len(filtre.bits) // 1024} Kio")
+            return self._filtre
+
+cache_suppressions = CacheSuppressions()
+
+def est_adresse_de_role(email):
+    return email.split('@', 1)[0] in ROLES
+
+def filtrer_destinataires(abonnes):
+    """Écarte les abonnés supprimés avant l'envoi ; retourne (à envoyer, écartés).
+
+    Le filtre de Bloom élimine en mémoire l'immense majorité des adresses ; seules les
+    correspondances positives (vraies ou faux positifs) sont confirmées en base, en une requête.
+    """
+    abonnes = list(abonnes)
+    filtre = cache_suppressions.filtre()
+    candidats = {}
+    ecartes = []
+    for abonne in abonnes:
+        email = abonne.email.lower()
+        if est_adresse_de_role(email):
+            ecartes.append(abonne)
+        elif email in filtre:
+            candidats[email] = abonne
+    emails = list(candidats)
+    confirmes = set()
+    for debut in range(0, len(emails), TAILLE_IN):
+        confirmes.update(Suppression.objects.filter(
+            email__in=emails[debut:debut + TAILLE_IN]
+        ).values_list('email', flat=True))
+    ecartes.extend(candidats[email] for email in confirmes)
+    if not ecartes:
+        return abonnes, []
+    exclus = {abonne.pk for abonne in ecartes}
+    a_envoyer = [abonne for abonne in abonnes if abonne.pk not in exclus]
+    logger.info(f"Liste de suppression : {len(ecartes)} destinataires écartés sur {len(a_envoyer) + len(ecartes)}")
+    return a_envoyer, ecartes
+
+def ajouter_suppressions(emails, motif):
+    """Ajoute des adresses à la liste de suppression (les adresses déjà présentes sont ignorées)"""
+    Suppression.objects.bulk_create(
+        [Suppression(email=email.strip().lower(), motif=motif) for email in emails],
+        batch_size=TAILLE_IN, ignore_conflicts=True,
+    )
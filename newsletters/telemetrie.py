@@ -0,0 +1,306 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from bisect import bisect_left
+from contextlib import contextmanager
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Limites des histogrammes (valeurs cumulées jusqu'à chaque limite, puis +Inf)
+LIMITES_DUREE = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+LIMITES_TAILLE = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+def _echapper(valeur):
+    return str(valeur).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _etiquettes_texte(noms, valeurs, extra=()):
+    paires = [f'{nom}="{_echapper(valeur)}"' for nom, valeur in list(zip(noms, valeurs)) + list(extra)]
+    return '{' + ','.join(paires) + '}' if paires else ''
+
+def _nombre(valeur):
+    if valeur == float('inf'):
+        return '+Inf'
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+class Metrique:
+    """Métrique nommée, avec une valeur par combinaison d'étiquettes"""
+
+    type = None
+
+    def __init__(self, registre, nom, aide, etiquettes=()):
+        self.registre = registre
+        self.nom = nom
+        self.aide = aide
+        self.etiquettes = tuple(etiquettes)
+        self._valeurs = {}
+        self._lock = threading.Lock()
+
+    def _cle(self, etiquettes):
+        return tuple(str(etiquettes[nom]) for nom in self.etiquettes)
+
+    def instantane(self):
+        """Valeurs courantes, sérialisables en JSON : [[valeurs des étiquettes], valeur]"""
+        with self._lock:
+            return [[list(cle), valeur] for cle, valeur in self._valeurs.items()]
+
+class Compteur(Metrique):
+    """Valeur qui ne fait que croître (cumulée entre processus)"""
+
+    type = 'counter'
+
+    def inc(self, montant=1, **etiquettes):
+        cle = self._cle(etiquettes)
+        with self._lock:
+            self._valeurs[cle] = self._valeurs.get(cle, 0) + montant
+        self.registre.modifie()
+
+class Jauge(Metrique):
+    """Valeur instantanée ; entre processus, additionnée (agregation='somme') ou maximale ('max')"""
+
+    type = 'gauge'
+
+    def __init__(self, registre, nom, aide, etiquettes=(), agregation='somme'):
+        super().__init__(registre, nom, aide, etiquettes)
+        self.agregation = agregation
+        self._fonctions = {}
+
+    def set(self, valeur, **etiquettes):
+        cle = self._cle(etiquettes)
+        with self._lock:
+            self._valeurs[cle] = valeur
+        self.registre.modifie()
+
+    def suivre(self, fonction, **etiquettes):
+        """Valeur lue par fonction() à chaque instantané (taille d'une file en mémoire...)"""
+        with self._lock:
+            self._fonctions[self._cle(etiquettes)] = fonction
+
+    def instantane(self):
+        with self._lock:
+            fonctions = list(self._fonctions.items())
+        for cle, fonction in fonctions:
+            try:
+                valeur = fonction()
+            except Exception as e:
+                logger.error(f"Erreur lors de la mesure de {self.nom}: {e}")
+                continue
+            with self._lock:
+                self._valeurs[cle] = valeur
+        return super().instantane()
+
+class Histogramme(Metrique):
+    """Répartition des observations par tranches, avec leur somme et leur nombre"""
+
+    type = 'histogram'
+
+    def __init__(self, registre, nom, aide, etiquettes=(), limites=LIMITES_DUREE):
+        super().__init__(registre, nom, aide, etiquettes)
+        self.limites = tuple(limites)
+
+    def observe(self, valeur, **etiquettes):
+        cle = self._cle(etiquettes)
+        tranche = bisect_left(self.limites, valeur)
+        with self._lock:
+            serie = self._valeurs.get(cle)
+            if serie is None:
+                # Nombre par tranche (la dernière pour +Inf), somme, nombre total
+                serie = self._valeurs[cle] = [[0] * (len(self.limites) + 1), 0, 0]
+            serie[0][tranche] += 1
+            serie[1] += valeur
+            serie[2] += 1
+        self.registre.modifie()
+
+    @contextmanager
+    def chronometrer(self, **etiquettes):
+        debut = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - debut, **etiquettes)
+
+    def instantane(self):
+        with self._lock:
+            return [[list(cle), [list(serie[0]), serie[1], serie[2]]] for cle, serie in self._valeurs.items()]
+
+def _processus_actif(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Registre:
+    """Métriques du processus, exposées au format texte de Prometheus.
+
+    Avec settings.NEWSLETTER_METRICS_DIR, chaque processus (workers gunicorn, scheduler)
+    écrit ses valeurs dans <pid>.json toutes les NEWSLETTER_METRICS_FLUSH_SECONDS secondes ;
+    l'exposition agrège les fichiers de tous les processus.
+    """
+
+    def __init__(self):
+        self.metriques = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ajouter(self, metrique):
+        self.metriques[metrique.nom] = metrique
+        return metrique
+
+    def compteur(self, nom, aide, etiquettes=()):
+        return self._ajouter(Compteur(self, nom, aide, etiquettes))
+
+    def jauge(self, nom, aide, etiquettes=(), agregation='somme'):
+        return self._ajouter(Jauge(self, nom, aide, etiquettes, agregation))
+
+    def histogramme(self, nom, aide, etiquettes=(), limites=LIMITES_DUREE):
+        return self._ajouter(Histogramme(self, nom, aide, etiquettes, limites))
+
+    @property
+    def repertoire(self):
+        return getattr(settings, 'NEWSLETTER_METRICS_DIR', None)
+
+    def modifie(self):
+        """Démarre l'écriture périodique du fichier du processus à la première mesure"""
+        if self._thread is None and self.repertoire:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._boucle, daemon=True)
+                    self._thread.start()
+
+    def _boucle(self):
+        while True:
+            time.sleep(getattr(settings, 'NEWSLETTER_METRICS_FLUSH_SECONDS', 5))
+            try:
+                self.ecrire()
+            except Exception as e:
+                logger.error(f"Erreur lors de l'écriture des métriques: {e}")
+
+    def instantane(self):
+        return {nom: metrique.instantane() for nom, metrique in self.metriques.items()}
+
+    def ecrire(self):
+        """Écrit les valeurs du processus (remplacement atomique du fichier)"""
+        if not self.repertoire:
+            return
+        os.makedirs(self.repertoire, exist_ok=True)
+        chemin = os.path.join(self.repertoire, f"{os.getpid()}.json")
+        with open(chemin + '.tmp', 'w') as f:
+            json.dump(self.instantane(), f)
+        os.replace(chemin + '.tmp', chemin)
+
+    def _instantanes(self):
+        """(pid, valeurs) de chaque processus ; le processus courant est relu à l'instant"""
+        if not self.repertoire:
+            return [(os.getpid(), self.instantane())]
+        self.ecrire()
+        resultats = []
+        for chemin in glob.glob(os.path.join(self.repertoire, '*.json')):
+            try:
+                with open(chemin) as f:
+                    resultats.append((int(os.path.basename(chemin)[:-5]), json.load(f)))
+            except (ValueError, OSError):
+                continue
+        return resultats
+
+    def _agreger(self, metrique, instantanes):
+        valeurs = {}
+        for pid, instantane in instantanes:
+            # Les compteurs d'un processus arrêté restent acquis, pas ses jauges
+            if metrique.type == 'gauge' and pid != os.getpid() and not _processus_actif(pid):
+                continue
+            for cle, valeur in instantane.get(metrique.nom, []):
+                cle = tuple(cle)
+                if cle not in valeurs:
+                    valeurs[cle] = valeur
+                elif metrique.type == 'histogram':
+                    tranches, somme, nombre = valeurs[cle]
+                    valeurs[cle] = [[a + b for a, b in zip(tranches, valeur[0])], somme + valeur[1], nombre + valeur[2]]
+                elif metrique.type == 'gauge' and metrique.agregation == 'max':
+                    valeurs[cle] = max(valeurs[cle], valeur)
+                else:
+                    valeurs[cle] = valeurs[cle] + valeur
+        return valeurs
+
+    def exposition(self):
+        """Toutes les métriques, agrégées entre processus, au format texte de Prometheus (0.0.4)"""
+        instantanes = self._instantanes()
+        lignes = []
+        for nom, metrique in self.metriques.items():
+            lignes.append(f"# HELP {nom} {metrique.aide}")
+            lignes.append(f"# TYPE {nom} {metrique.type}")
+            for cle, valeur in sorted(self._agreger(metrique, instantanes).items()):
+                if metrique.type != 'histogram':
+                    lignes.append(f"{nom}{_etiquettes_texte(metrique.etiquettes, cle)} {_nombre(valeur)}")
+                    continue
+                tranches, somme, nombre = valeur
+                cumul = 0
+                for limite, compte in zip(metrique.limites + (float('inf'),), tranches):
+                    cumul += compte
+                    le = (('le', _nombre(limite)),)
+                    lignes.append(f"{nom}_bucket{_etiquettes_texte(metrique.etiquettes, cle, le)} {cumul}")
+                lignes.append(f"{nom}_sum{_etiquettes_texte(metrique.etiquettes, cle)} {_nombre(float(somme))}")
+                lignes.append(f"{nom}_count{_etiquettes_texte(metrique.etiquettes, cle)} {nombre}")
+        return '\n'.join(lignes) + '\n'
+
+registre = Registre()
+atexit.register(registre.ecrire)
+
+# Pipeline d'envoi
+SMTP_CONNEXION = registre.histogramme(
+    'newsletter_smtp_connect_seconds', "Durée d'ouverture de session SMTP (connexion, STARTTLS, authentification)")
+SMTP_ENVOI = registre.histogramme(
+    'newsletter_smtp_send_seconds', "Durée d'une transaction SMTP (un message)", ('mode',))
+MESSAGES = registre.compteur(
+    'newsletter_messages_total', "Messages traités ; rate() donne le débit en messages/s", ('statut',))
+DEBIT = registre.jauge(
+    'newsletter_send_messages_per_second', "Débit des envois en cours (0 hors envoi)")
+TAILLE_LOT = registre.histogramme(
+    'newsletter_batch_size', "Destinataires par transaction SMTP (1 en envoi personnalisé, tous en CCI)",
+    ('mode',), LIMITES_TAILLE)
+FILE_ATTENTE = registre.jauge(
+    'newsletter_queue_depth', "Éléments en mémoire en attente d'écriture en base", ('file',))
+ENVOIS_DUS = registre.jauge(
+    'newsletter_scheduler_due', "Newsletters planifiées arrivées à échéance au dernier passage du scheduler",
+    agregation='max')
+RETARD_PLANIFICATEUR = registre.histogramme(
+    'newsletter_scheduler_lag_seconds', "Retard au départ d'un envoi planifié (maintenant - date_envoi_planifie)")
+DERNIER_RETARD = registre.jauge(
+    'newsletter_scheduler_last_lag_seconds', "Retard du dernier envoi planifié", agregation='max')
+
+# Import d'abonnés
+IMPORT_LIGNES = registre.compteur(
+    'newsletter_import_rows_total', "Lignes de fichiers d'abonnés importées", ('resultat',))
+IMPORT_DUREE = registre.histogramme(
+    'newsletter_import_seconds', "Durée d'un import d'abonnés")
+IMPORT_DEBIT = registre.jauge(
+    'newsletter_import_rows_per_second', "Débit du dernier import (lignes/s, maximum entre processus)",
+    agregation='max')
+
+# Base de données
+REQUETES_BD = registre.histogramme(
+    'newsletter_db_query_seconds', "Durée des requêtes SQL", ('operation',))
+
+OPERATIONS_SQL = {'SELECT', 'INSERT', 'UPDATE', 'DELETE'}
+
+def _mesurer_requete(execute, sql, params, many, context):
+    debut = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        operation = sql.lstrip()[:6].upper()
+        REQUETES_BD.observe(time.perf_counter() - debut, operation=operation if operation in OPERATIONS_SQL else 'AUTRE')
+
+@receiver(connection_created)
+def mesurer_connexion(sender, connection, **kwargs):
+    """Chronomètre toutes les requêtes des connexions ouvertes par ce processus"""
+    if getattr(settings, 'NEWSLETTER_METRICS_DB', True) and _mesurer_requete not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_mesurer_requete)
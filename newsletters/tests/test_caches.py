@@ -0,0 +1,28 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from newsletters.caches import generation, invalider
+
+class GenerationTests(SimpleTestCase):
+    """Une génération évincée du cache ne revient jamais à une valeur déjà servie"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidation(self):
+        avant = generation('groupe')
+        invalider('groupe')
+        self.assertNotEqual(generation('groupe'), avant)
+        self.assertEqual(generation('groupe'), generation('groupe'))
+
+    def test_eviction(self):
+        servies = {generation('groupe')}
+        for _ in range(3):
+            invalider('groupe')
+            servies.add(generation('groupe'))
+        # Clé évincée (MAX_ENTRIES, culling) : lecture puis invalidation
+        cache.delete('generation:groupe')
+        apres_eviction = generation('groupe')
+        self.assertNotIn(apres_eviction, servies)
+        cache.delete('generation:groupe')
+        invalider('groupe')
+        self.assertNotIn(generation('groupe'), servies | {apres_eviction})
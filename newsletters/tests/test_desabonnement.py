@@ -0,0 +1,119 @@
+from django.core.cache import cache
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.urls import reverse
+from new import SignataireDesabonnement
+from newsletters.desabonnement import tampon
+from newsletters.models import Subscriber
+
+class SignataireDesabonnementTests(SimpleTestCase):
+    """Tokens '<id>.<version>.<hmac>' : vérification et rotation des clés"""
+
+    def test_token_signe_verifie(self):
+        signataire = SignataireDesabonnement({1: 'secret'})
+        token = signataire.signer(42)
+        self.assertTrue(token.startswith('42.1.'))
+        self.assertEqual(signataire.verifier(token), 42)
+
+    def test_token_altere_refuse(self):
+        signataire = SignataireDesabonnement({1: 'secret'})
+        token = signataire.signer(42)
+        _, version, signature = token.split('.')
+        self.assertIsNone(signataire.verifier(f"43.{version}.{signature}"))
+        self.assertIsNone(signataire.verifier(token[:-1] + ('A' if token[-1] != 'A' else 'B')))
+        self.assertIsNone(SignataireDesabonnement({1: 'autre secret'}).verifier(token))
+
+    def test_token_mal_forme_ou_historique(self):
+        signataire = SignataireDesabonnement({1: 'secret'})
+        for token in ('', 'abc', '1.2', 'x.1.sig', '1.x.sig', 'a3f9c2e1b7d64e0f8a9b1c2d3e4f5a6b'):
+            self.assertIsNone(signataire.verifier(token))
+
+    def test_rotation(self):
+        ancien = SignataireDesabonnement({1: 'cle-1'})
+        token_v1 = ancien.signer(7)
+        # Nouvelle version : elle signe, l'ancienne reste vérifiable
+        rotation = SignataireDesabonnement({1: 'cle-1', 2: 'cle-2'})
+        token_v2 = rotation.signer(7)
+        self.assertTrue(token_v2.startswith('7.2.'))
+        self.assertEqual(rotation.verifier(token_v1), 7)
+        self.assertEqual(rotation.verifier(token_v2), 7)
+        # Ancienne version retirée : ses liens ne sont plus acceptés
+        retrait = SignataireDesabonnement({2: 'cle-2'})
+        self.assertIsNone(retrait.verifier(token_v1))
+        self.assertEqual(retrait.verifier(token_v2), 7)
+
+    def test_usages_separes(self):
+        desabonnement = SignataireDesabonnement({1: 'secret'})
+        suivi = SignataireDesabonnement({1: 'secret'}, usage='suivi')
+        self.assertIsNone(desabonnement.verifier(suivi.signer(42)))
+        self.assertIsNone(suivi.verifier(desabonnement.signer(42)))
+        self.assertEqual(suivi.verifier(suivi.signer(42)), 42)
+
+class VueDesabonnementTests(TestCase):
+    """Le lien (GET) demande une confirmation ; seul un POST désabonne"""
+
+    def setUp(self):
+        cache.clear()
+        self.abonne = Subscriber.objects.create(email='lecteur@example.com')
+        self.url = reverse('unsubscribe', args=[self.abonne.token_signe])
+
+    def statut(self):
+        self.abonne.refresh_from_db()
+        return self.abonne.statut
+
+    def test_get_ne_desabonne_pas(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<form method="post">')
+        self.assertEqual(self.statut(), 'actif')
+
+    def test_post_de_confirmation(self):
+        response = self.client.post(self.url)
+        self.assertContains(response, 'Désabonnement réussi')
+        self.assertEqual(self.statut(), 'desabonne')
+
+    def test_post_en_un_clic(self):
+        response = self.client.post(self.url, {'List-Unsubscribe': 'One-Click'})
+        self.assertEqual(response.content, b'OK')
+        self.assertEqual(self.statut(), 'desabonne')
+
+    def test_token_historique(self):
+        abonne = Subscriber.objects.create(email='ancien@example.com', token_desabonnement='a3f9c2e1b7d64e0f')
+        self.client.post(reverse('unsubscribe', args=['a3f9c2e1b7d64e0f']))
+        abonne.refresh_from_db()
+        self.assertEqual(abonne.statut, 'desabonne')
+
+    def test_token_de_suivi_refuse(self):
+        response = self.client.post(reverse('unsubscribe', args=[self.abonne.token_suivi]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.statut(), 'actif')
+
+    def test_token_invalide(self):
+        token = self.abonne.token_signe.rsplit('.', 1)[0] + '.invalide'
+        self.assertEqual(self.client.get(reverse('unsubscribe', args=[token])).status_code, 404)
+        self.assertEqual(self.client.post(reverse('unsubscribe', args=[token])).status_code, 404)
+        self.assertEqual(self.statut(), 'actif')
+
+@override_settings(UNSUBSCRIBE_COALESCE_SECONDS=60)
+class DesabonnementRegroupeTests(TestCase):
+    """Avec regroupement, les désabonnements sont différés mais répondent comme en mode immédiat"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(tampon.vider)
+        self.abonne = Subscriber.objects.create(email='lecteur@example.com')
+
+    def test_ecriture_differee(self):
+        self.client.post(reverse('unsubscribe', args=[self.abonne.token_signe]))
+        self.abonne.refresh_from_db()
+        self.assertEqual(self.abonne.statut, 'actif')
+        self.assertEqual(tampon.vider(), 1)
+        self.abonne.refresh_from_db()
+        self.assertEqual(self.abonne.statut, 'desabonne')
+
+    def test_abonne_supprime(self):
+        url = reverse('unsubscribe', args=[self.abonne.token_signe])
+        self.abonne.delete()
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertEqual(len(tampon), 0)
+        # La réponse négative n'est pas mise en cache
+        self.assertEqual(self.client.post(url).status_code, 404)
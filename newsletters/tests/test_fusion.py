@@ -0,0 +1,56 @@
+from email import message_from_bytes
+from email.policy import default
+from django.test import SimpleTestCase
+from new import GabaritFusion, ModeleMessage
+import base64
+
+class GabaritFusionTests(SimpleTestCase):
+
+    def test_balises_remplacees(self):
+        gabarit = GabaritFusion("Bonjour {{prenom}} {{ nom }}, {{email}} - {{inconnu}}")
+        self.assertTrue(gabarit.personnalise)
+        self.assertEqual(
+            gabarit.rendre({'prenom': 'Zoé', 'nom': None, 'email': 'zoe@example.com'}),
+            "Bonjour Zoé , zoe@example.com - {{inconnu}}".encode('utf-8'),
+        )
+
+    def test_echappement_html(self):
+        gabarit = GabaritFusion("<p>{{prenom}}</p>", echapper=True)
+        self.assertEqual(gabarit.rendre({'prenom': '<b>A&B</b>'}), b"<p>&lt;b&gt;A&amp;B&lt;/b&gt;</p>")
+        self.assertEqual(GabaritFusion("{{prenom}}").rendre({'prenom': '<b>'}), b"<b>")
+
+    def test_sans_balise(self):
+        gabarit = GabaritFusion("Texte fixe")
+        self.assertFalse(gabarit.personnalise)
+        self.assertEqual(gabarit.rendre({'prenom': 'x'}), b"Texte fixe")
+
+    def test_base64_identique_a_un_encodage_complet(self):
+        # Les raccords entre segments pré-encodés et valeurs dépendent de la longueur de chaque morceau
+        contenu = "A{{prenom}}BC{{nom}}" + "é" * 100 + "{{email}}{{prenom}}D"
+        gabarit = GabaritFusion(contenu)
+        for prenom in ('', 'x', 'xy', 'xyz', 'Ève'):
+            for nom in ('', 'n', 'no', 'nom'):
+                valeurs = {'prenom': prenom, 'nom': nom, 'email': 'a@example.com'}
+                encode = gabarit.rendre_base64(valeurs)
+                self.assertTrue(all(len(ligne) <= 76 for ligne in encode.split(b'\r\n')))
+                self.assertEqual(base64.b64decode(encode.replace(b'\r\n', b'')), gabarit.rendre(valeurs))
+
+class ModeleMessageTests(SimpleTestCase):
+
+    def test_message_personnalise(self):
+        modele = ModeleMessage(
+            "Bonjour {{prenom}}\n{{unsubscribe_url}}",
+            "<p>Bonjour {{prenom}}</p>",
+            {'Subject': 'Édition de mars', 'From': 'news@example.com'},
+        )
+        brut = modele.rendre(
+            {'prenom': 'Zoé', 'unsubscribe_url': 'https://example.com/u/1.1.abc/'}, 'zoe@example.com'
+        )
+        message = message_from_bytes(brut, policy=default)
+        self.assertEqual(message['To'], 'zoe@example.com')
+        self.assertEqual(message['Subject'], 'Édition de mars')
+        self.assertEqual(message['List-Unsubscribe'], '<https://example.com/u/1.1.abc/>')
+        self.assertEqual(message['List-Unsubscribe-Post'], 'List-Unsubscribe=One-Click')
+        texte, html = (partie.get_content() for partie in message.iter_parts())
+        self.assertEqual(texte, "Bonjour Zoé\nhttps://example.com/u/1.1.abc/")
+        self.assertEqual(html, "<p>Bonjour Zoé</p>")
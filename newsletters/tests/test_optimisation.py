@@ -0,0 +1,49 @@
+from django.test import SimpleTestCase
+from new import _parse_declarations, optimiser_html_email
+from html.parser import HTMLParser
+
+class StylesTd(HTMLParser):
+    """Relève l'attribut style (décodé) de chaque <td>"""
+
+    def __init__(self):
+        super().__init__()
+        self.styles = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'td':
+            self.styles.append(dict(attrs).get('style'))
+
+def styles_td(contenu_html):
+    analyseur = StylesTd()
+    analyseur.feed(contenu_html)
+    return analyseur.styles
+
+class DeclarationsTests(SimpleTestCase):
+
+    def test_point_virgule_protege(self):
+        self.assertEqual(list(_parse_declarations(
+            'color: red; background: url(data:image/png;base64,iVBORw0KGgo=) no-repeat;'
+            "content: ';'; font-family: \"A;B\", serif"
+        ).items()), [
+            ('color', 'red'),
+            ('background', 'url(data:image/png;base64,iVBORw0KGgo=) no-repeat'),
+            ('content', "';'"),
+            ('font-family', '"A;B", serif'),
+        ])
+
+    def test_derniere_declaration_l_emporte(self):
+        self.assertEqual(dict(_parse_declarations('COLOR: red; color:  blue ;;')), {'color': 'blue'})
+
+class OptimisationHtmlTests(SimpleTestCase):
+
+    def test_fond_en_data_uri(self):
+        contenu = (
+            '<html><head><style>td { background-image: url("data:image/png;base64,AAAA"); color: red }</style>'
+            '</head><body><table><tr>'
+            '<td style="background: url(data:image/gif;base64,R0lGOD==) center; padding: 0">x</td>'
+            '</tr></table></body></html>'
+        )
+        self.assertEqual(styles_td(optimiser_html_email(contenu)), [
+            'background-image:url("data:image/png;base64,AAAA");color:red;'
+            'background:url(data:image/gif;base64,R0lGOD==) center;padding:0'
+        ])
@@ -0,0 +1,23 @@
+from django.core.cache import cache
+from django.test import TestCase
+from newsletters.models import Newsletter
+from newsletters.pagination import PaginatorCompteEnCache
+
+class CompteEnCacheTests(TestCase):
+    """Le total en cache est invalidé à chaque création ou suppression, quel que soit le processus"""
+
+    def setUp(self):
+        cache.clear()
+
+    def total(self):
+        return PaginatorCompteEnCache(Newsletter.objects.all(), 10).count
+
+    def test_creation_et_suppression(self):
+        self.assertEqual(self.total(), 0)
+        newsletter = Newsletter.objects.create(titre='N', objet='o', contenu_html='<p>n</p>')
+        self.assertEqual(self.total(), 1)
+        Newsletter.objects.create(titre='M', objet='o', contenu_html='<p>m</p>')
+        newsletter.delete()
+        self.assertEqual(self.total(), 1)
+        Newsletter.objects.all().delete()
+        self.assertEqual(self.total(), 0)
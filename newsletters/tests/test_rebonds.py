@@ -0,0 +1,124 @@
+from email import message_from_bytes
+from django.test import TestCase, SimpleTestCase
+from newsletters.models import Newsletter, Subscriber, Envoi, RepriseRebonds, Suppression
+from newsletters.rebonds import analyser_dsn, traiter_source
+from newsletters.stats import creer_envois
+import os
+import shutil
+import tempfile
+
+def rapport_dsn(destinataires, newsletter_id=None):
+    """Rapport de non-remise (RFC 3464) : destinataires = [(email, action, status)]"""
+    blocs = ''.join(
+        f"Final-Recipient: rfc822; {email}\r\nAction: {action}\r\nStatus: {statut}\r\n\r\n"
+        for email, action, statut in destinataires
+    )
+    origine = f"X-Newsletter-ID: {newsletter_id}\r\n" if newsletter_id is not None else ''
+    return (
+        "From: MAILER-DAEMON@example.com\r\n"
+        "Subject: Undelivered Mail Returned to Sender\r\n"
+        "MIME-Version: 1.0\r\n"
+        'Content-Type: multipart/report; report-type=delivery-status; boundary="FRONTIERE"\r\n'
+        "\r\n"
+        "--FRONTIERE\r\n"
+        "Content-Type: text/plain\r\n"
+        "\r\n"
+        "Le message n'a pas pu être remis.\r\n"
+        "--FRONTIERE\r\n"
+        "Content-Type: message/delivery-status\r\n"
+        "\r\n"
+        "Reporting-MTA: dns; mx.example.com\r\n"
+        "\r\n"
+        f"{blocs}"
+        "--FRONTIERE\r\n"
+        "Content-Type: message/rfc822\r\n"
+        "\r\n"
+        f"{origine}"
+        "Subject: Newsletter\r\n"
+        "\r\n"
+        "Bonjour\r\n"
+        "--FRONTIERE--\r\n"
+    ).encode('utf-8')
+
+class AnalyseDsnTests(SimpleTestCase):
+
+    def test_echecs_permanents_et_temporaires(self):
+        message = message_from_bytes(rapport_dsn([
+            ('Perdu@Example.com', 'failed', '5.1.1'),
+            ('plein@example.com', 'failed', '4.2.2'),
+            ('lent@example.com', 'delayed', '4.4.7'),
+            ('recu@example.com', 'delivered', '2.0.0'),
+        ], newsletter_id=12))
+        self.assertEqual(analyser_dsn(message), [
+            ('perdu@example.com', 'dur', 12),
+            ('plein@example.com', 'temporaire', 12),
+            ('lent@example.com', 'temporaire', 12),
+        ])
+
+    def test_newsletter_d_origine_inconnue(self):
+        message = message_from_bytes(rapport_dsn([('perdu@example.com', 'failed', '5.1.1')]))
+        self.assertEqual(analyser_dsn(message), [('perdu@example.com', 'dur', None)])
+
+    def test_message_ordinaire_ignore(self):
+        message = message_from_bytes(b"From: a@example.com\r\nSubject: Bonjour\r\n\r\nTexte\r\n")
+        self.assertEqual(analyser_dsn(message), [])
+
+class TraitementSourceTests(TestCase):
+    """Les rebonds sont appliqués une seule fois : le point de reprise avance avec chaque lot"""
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dossier)
+        self.mbox = os.path.join(self.dossier, 'rebonds.mbox')
+        self.newsletter = Newsletter.objects.create(titre='N', objet='o', contenu_html='<p>n</p>')
+        self.abonnes = {
+            email: Subscriber.objects.create(email=email)
+            for email in ('un@example.com', 'deux@example.com', 'trois@example.com')
+        }
+        creer_envois(self.newsletter.pk, [abonne.pk for abonne in self.abonnes.values()], 'envoye')
+
+    def ajouter(self, email):
+        with open(self.mbox, 'ab') as f:
+            f.write(b"From MAILER-DAEMON Mon Jan  1 00:00:00 2024\n")
+            f.write(rapport_dsn([(email, 'failed', '5.1.1')], self.newsletter.pk).replace(b'\r\n', b'\n'))
+            f.write(b"\n")
+
+    def test_point_de_reprise(self):
+        self.ajouter('un@example.com')
+        self.ajouter('deux@example.com')
+        resume = traiter_source(self.mbox, taille_lot=1)
+        self.assertEqual((resume['messages'], resume['durs'], resume['envois']), (2, 2, 2))
+        self.assertEqual(
+            set(Subscriber.objects.filter(statut='rebond').values_list('email', flat=True)),
+            {'un@example.com', 'deux@example.com'},
+        )
+        self.assertEqual(Suppression.objects.filter(motif='rebond').count(), 2)
+
+        # Deuxième passage : rien de nouveau
+        self.assertEqual(traiter_source(self.mbox), {})
+        # Seul le message ajouté depuis est traité
+        self.ajouter('trois@example.com')
+        resume = traiter_source(self.mbox)
+        self.assertEqual((resume['messages'], resume['durs']), (1, 1))
+        self.assertEqual(Envoi.objects.filter(newsletter=self.newsletter, statut='rebond').count(), 3)
+        self.assertEqual(RepriseRebonds.objects.get().messages_traites, 3)
+
+    def test_simulation_sans_effet(self):
+        self.ajouter('un@example.com')
+        resume = traiter_source(self.mbox, simulation=True)
+        self.assertEqual((resume['messages'], resume['durs']), (1, 1))
+        self.assertFalse(Subscriber.objects.filter(statut='rebond').exists())
+        self.assertEqual(RepriseRebonds.objects.get().position, 0)
+        # Le traitement réel reprend donc depuis le début
+        self.assertEqual(traiter_source(self.mbox)['durs'], 1)
+
+    def test_mbox_remplace(self):
+        self.ajouter('un@example.com')
+        self.ajouter('trois@example.com')
+        traiter_source(self.mbox)
+        # Rotation : nouveau fichier, plus court que la position enregistrée
+        os.remove(self.mbox)
+        self.ajouter('deux@example.com')
+        resume = traiter_source(self.mbox)
+        self.assertEqual((resume['messages'], resume['durs']), (1, 1))
+        self.assertEqual(Subscriber.objects.get(email='deux@example.com').statut, 'rebond')
@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from newsletters.invalidation import invalider_newsletter
+from newsletters.models import Newsletter
+
+class RenduNewsletterTests(TestCase):
+    """Pages de newsletter servies depuis le cache avec ETag / Last-Modified, invalidées à chaque modification"""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('redacteur', password='x'))
+        self.newsletter = Newsletter.objects.create(titre='Édition 1', objet='o', contenu_html='<p>un</p>')
+        self.url = reverse('newsletter_preview', args=[self.newsletter.pk])
+
+    def test_etag_et_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"autre"').status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_modification_invalide_la_page(self):
+        etag = self.client.get(self.url)['ETag']
+        self.newsletter.contenu_html = '<p>deux</p>'
+        self.newsletter.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'deux')
+
+    def test_mise_a_jour_groupee_invalidee_explicitement(self):
+        etag = self.client.get(self.url)['ETag']
+        # update() n'émet pas de signal : l'appelant invalide lui-même
+        Newsletter.objects.filter(pk=self.newsletter.pk).update(titre='Titre modifié')
+        invalider_newsletter(self.newsletter.pk)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Titre modifié')
+
+    def test_newsletter_inconnue(self):
+        self.assertEqual(self.client.get(reverse('newsletter_preview', args=[self.newsletter.pk + 1])).status_code, 404)
@@ -0,0 +1,66 @@
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from newsletters.statiques import FichierStatique, MiddlewareStatiques, CACHE_COURT
+import os
+import shutil
+import tempfile
+
+class VariantesStatiquesTests(SimpleTestCase):
+    """Choix de la variante précompressée d'après Accept-Encoding"""
+
+    def setUp(self):
+        self.racine = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.racine)
+        os.makedirs(os.path.join(self.racine, 'css'))
+        for nom in ('css/site.css', 'css/site.css.gz', 'css/site.css.br', 'logo.png'):
+            with open(os.path.join(self.racine, nom), 'wb') as f:
+                f.write(nom.encode('ascii'))
+
+    def test_choix_de_l_encodage(self):
+        fichier = FichierStatique(os.path.join(self.racine, 'css/site.css'), immuable=False)
+        cas = {
+            'gzip, deflate, br': 'br',
+            'gzip': 'gzip',
+            'br;q=0, gzip': 'gzip',
+            'BR; q=0.5': 'br',
+            '*': 'br',
+            'identity': None,
+            'gzip;q=0': None,
+            '': None,
+        }
+        for accept_encoding, attendu in cas.items():
+            encodage, (chemin, _, _) = fichier.choisir(accept_encoding)
+            self.assertEqual(encodage, attendu, accept_encoding)
+            extension = {'br': '.br', 'gzip': '.gz', None: ''}[attendu]
+            self.assertEqual(chemin, os.path.join(self.racine, 'css/site.css') + extension)
+
+    def test_sans_variante(self):
+        fichier = FichierStatique(os.path.join(self.racine, 'logo.png'), immuable=False)
+        self.assertEqual(fichier.choisir('gzip, br')[0], None)
+
+    def test_middleware(self):
+        with override_settings(STATIC_ROOT=self.racine, STATIC_URL='/static/', NEWSLETTER_SERVE_STATIC=True):
+            middleware = MiddlewareStatiques(lambda request: HttpResponse('application'))
+        requetes = RequestFactory()
+
+        response = middleware(requetes.get('/static/css/site.css', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Cache-Control'], CACHE_COURT)
+        self.assertEqual(b''.join(response.streaming_content), b'css/site.css.gz')
+        self.assertNotIn('Content-Disposition', response)
+        response.close()
+
+        response = middleware(requetes.get('/static/css/site.css', HTTP_IF_NONE_MATCH=response['ETag'],
+                                           HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(response.status_code, 304)
+
+        response = middleware(requetes.get('/static/logo.png', HTTP_ACCEPT_ENCODING='gzip, br'))
+        self.assertNotIn('Content-Encoding', response)
+        self.assertNotIn('Vary', response)
+        response.close()
+
+        # Hors STATIC_ROOT, ou pour une autre méthode : la requête suit son cours
+        self.assertEqual(middleware(requetes.get('/static/inconnu.css')).content, b'application')
+        self.assertEqual(middleware(requetes.post('/static/css/site.css')).content, b'application')
@@ -0,0 +1,81 @@
+from django.test import TestCase
+from newsletters.models import Newsletter, Subscriber, Envoi, StatistiquesNewsletter, StatistiquesGlobales
+from newsletters.stats import creer_envois, changer_statut_envois, recalculer_statistiques
+
+class CompteursEnvoisTests(TestCase):
+    """Les compteurs pré-agrégés suivent chaque création, transition et suppression d'Envoi"""
+
+    def setUp(self):
+        self.newsletter = Newsletter.objects.create(titre='N', objet='o', contenu_html='<p>n</p>')
+        self.abonnes = [Subscriber.objects.create(email=f"abonne{i}@example.com") for i in range(4)]
+
+    def compteurs(self, newsletter=None):
+        newsletter = newsletter or self.newsletter
+        ligne = StatistiquesNewsletter.objects.filter(newsletter=newsletter).values(
+            'destinataires', 'envoyes', 'erreurs'
+        ).first()
+        return ligne or {'destinataires': 0, 'envoyes': 0, 'erreurs': 0}
+
+    def globales(self):
+        return StatistiquesGlobales.objects.filter(pk=1).values('destinataires', 'envoyes', 'erreurs').first()
+
+    def assertCoherents(self):
+        """Les compteurs maintenus sont ceux que donnerait un recalcul complet"""
+        maintenus = self.globales()
+        self.assertEqual(recalculer_statistiques(), maintenus)
+
+    def test_transitions_unitaires(self):
+        envoi = Envoi.objects.create(newsletter=self.newsletter, subscriber=self.abonnes[0], statut='en_attente')
+        self.assertEqual(self.compteurs(), {'destinataires': 1, 'envoyes': 0, 'erreurs': 0})
+        envoi = Envoi.objects.get(pk=envoi.pk)
+        envoi.statut = 'envoye'
+        envoi.save()
+        self.assertEqual(self.compteurs(), {'destinataires': 1, 'envoyes': 1, 'erreurs': 0})
+        envoi.statut = 'erreur'
+        envoi.save()
+        self.assertEqual(self.compteurs(), {'destinataires': 1, 'envoyes': 0, 'erreurs': 1})
+        # Un enregistrement sans changement de statut ne compte rien
+        envoi.save()
+        self.assertEqual(self.compteurs(), {'destinataires': 1, 'envoyes': 0, 'erreurs': 1})
+        self.assertCoherents()
+
+    def test_suppression_unitaire(self):
+        Envoi.objects.create(newsletter=self.newsletter, subscriber=self.abonnes[0], statut='envoye')
+        Envoi.objects.get(subscriber=self.abonnes[0]).delete()
+        self.assertEqual(self.compteurs(), {'destinataires': 0, 'envoyes': 0, 'erreurs': 0})
+        self.assertCoherents()
+
+    def test_lots(self):
+        ids = [abonne.pk for abonne in self.abonnes]
+        creer_envois(self.newsletter.pk, ids, 'en_attente')
+        self.assertEqual(self.compteurs(), {'destinataires': 4, 'envoyes': 0, 'erreurs': 0})
+        self.assertEqual(changer_statut_envois(self.newsletter.pk, 'en_attente', 'envoye', ids[:3]), 3)
+        self.assertEqual(changer_statut_envois(self.newsletter.pk, 'en_attente', 'erreur'), 1)
+        # Les Envois déjà passés à un autre statut ne sont pas recomptés
+        self.assertEqual(changer_statut_envois(self.newsletter.pk, 'en_attente', 'envoye', ids), 0)
+        self.assertEqual(self.compteurs(), {'destinataires': 4, 'envoyes': 3, 'erreurs': 1})
+        self.assertCoherents()
+
+    def test_suppression_groupee(self):
+        creer_envois(self.newsletter.pk, [abonne.pk for abonne in self.abonnes], 'envoye')
+        Envoi.objects.filter(subscriber__in=self.abonnes[:2]).delete()
+        self.assertEqual(self.compteurs(), {'destinataires': 2, 'envoyes': 2, 'erreurs': 0})
+        self.assertCoherents()
+
+    def test_suppression_en_cascade_d_un_abonne(self):
+        autre = Newsletter.objects.create(titre='A', objet='o', contenu_html='<p>a</p>')
+        creer_envois(self.newsletter.pk, [self.abonnes[0].pk, self.abonnes[1].pk], 'envoye')
+        creer_envois(autre.pk, [self.abonnes[0].pk], 'erreur')
+        self.abonnes[0].delete()
+        self.assertEqual(self.compteurs(), {'destinataires': 1, 'envoyes': 1, 'erreurs': 0})
+        self.assertEqual(self.compteurs(autre), {'destinataires': 0, 'envoyes': 0, 'erreurs': 0})
+        self.assertCoherents()
+
+    def test_suppression_en_cascade_d_une_newsletter(self):
+        autre = Newsletter.objects.create(titre='A', objet='o', contenu_html='<p>a</p>')
+        creer_envois(self.newsletter.pk, [abonne.pk for abonne in self.abonnes], 'envoye')
+        creer_envois(autre.pk, [self.abonnes[0].pk], 'envoye')
+        self.newsletter.delete()
+        self.assertFalse(StatistiquesNewsletter.objects.filter(newsletter_id=self.newsletter.pk).exists())
+        self.assertEqual(self.globales(), {'destinataires': 1, 'envoyes': 1, 'erreurs': 0})
+        self.assertCoherents()
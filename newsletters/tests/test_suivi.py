@@ -0,0 +1,51 @@
+from django.test import TestCase
+from django.urls import reverse
+from newsletters.models import Newsletter, Subscriber, Evenement
+from newsletters.suivi import tampon_evenements, reecrire_liens
+
+class PixelOuvertureTests(TestCase):
+    """Le pixel n'accepte que les tokens de suivi, jamais le token de désabonnement"""
+
+    def setUp(self):
+        tampon_evenements.vider()
+        self.newsletter = Newsletter.objects.create(titre='N', objet='o', contenu_html='<p>n</p>')
+        self.abonne = Subscriber.objects.create(email='lecteur@example.com')
+
+    def ouvrir(self, token):
+        response = self.client.get(reverse('open_pixel', args=[self.newsletter.pk, token]))
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        tampon_evenements.vider()
+
+    def test_token_de_suivi(self):
+        self.ouvrir(self.abonne.token_suivi)
+        self.assertEqual(
+            list(Evenement.objects.values_list('type', 'subscriber_id')), [('ouverture', self.abonne.pk)]
+        )
+
+    def test_token_de_desabonnement_ignore(self):
+        self.ouvrir(self.abonne.token_signe)
+        self.assertFalse(Evenement.objects.exists())
+
+class RedirectionClicTests(TestCase):
+    """Les liens réécrits portent le token de suivi ; le clic redirige dans tous les cas"""
+
+    def setUp(self):
+        tampon_evenements.vider()
+        self.newsletter = Newsletter.objects.create(titre='N', objet='o', contenu_html='<p>n</p>')
+        self.abonne = Subscriber.objects.create(email='lecteur@example.com')
+        html = reecrire_liens(self.newsletter, '<a href="https://example.com/article">Lire</a>', 'https://site')
+        self.chemin = html.split('"')[1].replace('https://site', '')
+        self.assertIn('{{suivi_token}}', self.chemin)
+
+    def cliquer(self, token):
+        response = self.client.get(self.chemin.replace('{{suivi_token}}', token))
+        self.assertRedirects(response, 'https://example.com/article', fetch_redirect_response=False)
+        tampon_evenements.vider()
+
+    def test_token_de_suivi(self):
+        self.cliquer(self.abonne.token_suivi)
+        self.assertEqual(list(Evenement.objects.values_list('type', 'subscriber_id')), [('clic', self.abonne.pk)])
+
+    def test_token_de_desabonnement_non_attribue(self):
+        self.cliquer(self.abonne.token_signe)
+        self.assertEqual(list(Evenement.objects.values_list('type', 'subscriber_id')), [('clic', None)])
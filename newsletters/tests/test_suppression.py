@@ -0,0 +1,46 @@
+from django.test import TestCase, SimpleTestCase
+from newsletters.models import Subscriber, Suppression
+from newsletters.suppression import FiltreBloom, cache_suppressions, filtrer_destinataires, ajouter_suppressions
+
+class FiltreBloomTests(SimpleTestCase):
+
+    def test_aucun_faux_negatif(self):
+        filtre = FiltreBloom(5000)
+        emails = [f"adresse{i}@example.com" for i in range(5000)]
+        for email in emails:
+            filtre.ajouter(email)
+        self.assertTrue(all(email in filtre for email in emails))
+
+    def test_faux_positifs_rares(self):
+        filtre = FiltreBloom(5000, taux_erreur=0.001)
+        for i in range(5000):
+            filtre.ajouter(f"adresse{i}@example.com")
+        faux_positifs = sum(f"autre{i}@example.org" in filtre for i in range(20000))
+        self.assertLess(faux_positifs, 100)
+
+class FiltrerDestinatairesTests(TestCase):
+    """Les adresses supprimées et les adresses de rôle sont écartées avant l'envoi"""
+
+    def setUp(self):
+        # Le filtre est partagé par processus : le reconstruire pour chaque test
+        cache_suppressions._filtre = None
+
+    def test_adresses_ecartees(self):
+        abonnes = [Subscriber.objects.create(email=email) for email in (
+            'lecteur@example.com', 'Bloque@Example.com', 'postmaster@example.com', 'autre@example.com',
+        )]
+        ajouter_suppressions(['bloque@example.com'], 'plainte')
+        a_envoyer, ecartes = filtrer_destinataires(abonnes)
+        self.assertEqual([abonne.email for abonne in a_envoyer], ['lecteur@example.com', 'autre@example.com'])
+        self.assertEqual({abonne.email for abonne in ecartes}, {'Bloque@Example.com', 'postmaster@example.com'})
+
+    def test_filtre_reconstruit_apres_ajout(self):
+        abonne = Subscriber.objects.create(email='lecteur@example.com')
+        self.assertEqual(filtrer_destinataires([abonne]), ([abonne], []))
+        ajouter_suppressions(['lecteur@example.com'], 'manuel')
+        self.assertEqual(filtrer_destinataires([abonne]), ([], [abonne]))
+
+    def test_ajout_idempotent(self):
+        ajouter_suppressions([' Un@Example.com ', 'un@example.com'], 'rebond')
+        ajouter_suppressions(['un@example.com'], 'plainte')
+        self.assertEqual(list(Suppression.objects.values_list('email', 'motif')), [('un@example.com', 'rebond')])
@@ -0,0 +1,27 @@
+from django.test import SimpleTestCase
+from newsletters.traces import resumer_traces
+
+def span(trace, identifiant, parent, nom, duree_ms, **extra):
+    return {'trace': trace, 'span': identifiant, 'parent': parent, 'nom': nom, 'duree_ms': duree_ms, **extra}
+
+class ResumerTracesTests(SimpleTestCase):
+
+    def test_repartition_par_etape(self):
+        spans = [
+            span('t1', 'a', None, 'envoi', 100.0),
+            span('t1', 'b', 'a', 'destinataires', 20.0),
+            span('t1', 'c', 'a', 'lot', 70.0),
+            # Span de détail échantillonné : compte pour 10 exécutions
+            span('t1', 'd', 'c', 'smtp_data', 5.0, poids=10),
+            span('t2', 'e', None, 'import_abonnes', 8.0),
+            # Trace incomplète (racine absente) : ignorée
+            span('t3', 'f', 'z', 'lot', 50.0),
+        ]
+        envoi, import_abonnes = resumer_traces(spans)
+        self.assertEqual((envoi['operation'], envoi['traces'], envoi['total_ms']), ('envoi', 1, 100.0))
+        self.assertEqual([etape['etape'] for etape in envoi['etapes']], ['lot', 'lot/smtp_data', 'destinataires'])
+        smtp = envoi['etapes'][1]
+        self.assertEqual((smtp['appels'], smtp['total_ms'], smtp['part']), (10, 50.0, 50.0))
+        self.assertTrue(smtp['echantillonne'])
+        self.assertEqual((import_abonnes['operation'], import_abonnes['etapes']), ('import_abonnes', []))
+        self.assertEqual([resume['operation'] for resume in resumer_traces(spans, 'envoi')], ['envoi'])
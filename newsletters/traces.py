@@ -0,0 +1,208 @@
+from django.conf import settings
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Spans terminés gardés en mémoire avant écriture (une trace de campagne peut en compter beaucoup)
+TAILLE_TAMPON = 1000
+
+_trace_courante = ContextVar('trace_courante', default=None)
+_span_courant = ContextVar('span_courant', default=None)
+_lock_fichier = threading.Lock()
+
+def _identifiant():
+    return os.urandom(8).hex()
+
+class _Trace:
+    """Trace échantillonnée : ses spans sont accumulés puis écrits par paquets"""
+
+    def __init__(self, chemin, taux_detail):
+        self.id = _identifiant()
+        self.chemin = chemin
+        self.taux_detail = taux_detail
+        self.spans = []
+
+    def ajouter(self, span):
+        self.spans.append(span)
+        if len(self.spans) >= TAILLE_TAMPON:
+            self.ecrire()
+
+    def ecrire(self):
+        if not self.spans:
+            return
+        lignes = ''.join(json.dumps(span, ensure_ascii=False) + '\n' for span in self.spans)
+        self.spans = []
+        try:
+            with _lock_fichier, open(self.chemin, 'a', encoding='utf-8') as f:
+                f.write(lignes)
+        except OSError as e:
+            logger.error(f"Erreur lors de l'écriture des traces dans {self.chemin}: {e}")
+
+class Span:
+    """Étape chronométrée ; les attributs (tailles, nombres) sont ajoutés pendant l'exécution"""
+
+    def __init__(self, nom, attributs):
+        self.nom = nom
+        self.attributs = attributs
+
+    def ajouter(self, **attributs):
+        self.attributs.update(attributs)
+
+class _SpanInactif:
+    """Span d'une trace non échantillonnée : ne mesure ni n'écrit rien"""
+
+    def ajouter(self, **attributs):
+        pass
+
+SPAN_INACTIF = _SpanInactif()
+
+@contextmanager
+def _chronometrer(trace, nom, attributs, poids=1):
+    span = Span(nom, attributs)
+    parent = _span_courant.get()
+    identifiant = _identifiant()
+    jeton = _span_courant.set(identifiant)
+    debut = time.time()
+    debut_precis = time.perf_counter()
+    erreur = None
+    try:
+        yield span
+    except BaseException as e:
+        erreur = type(e).__name__
+        raise
+    finally:
+        duree = time.perf_counter() - debut_precis
+        _span_courant.reset(jeton)
+        enregistrement = {
+            'trace': trace.id, 'span': identifiant, 'parent': parent, 'nom': nom,
+            'debut': round(debut, 6), 'duree_ms': round(duree * 1000, 3),
+        }
+        if poids != 1:
+            # Span de détail échantillonné : représente `poids` exécutions
+            enregistrement['poids'] = poids
+        if erreur:
+            enregistrement['erreur'] = erreur
+        if span.attributs:
+            enregistrement['attributs'] = span.attributs
+        trace.ajouter(enregistrement)
+
+@contextmanager
+def trace(nom, **attributs):
+    """Span racine d'une opération (envoi, passage du scheduler, import).
+
+    La trace est retenue avec la probabilité settings.NEWSLETTER_TRACE_SAMPLE_RATE et écrite,
+    une ligne JSON par span, dans settings.NEWSLETTER_TRACE_FILE ; sans fichier configuré,
+    rien n'est mesuré.
+    """
+    chemin = getattr(settings, 'NEWSLETTER_TRACE_FILE', None)
+    if not chemin or _trace_courante.get() is not None or random.random() >= getattr(settings, 'NEWSLETTER_TRACE_SAMPLE_RATE', 1.0):
+        # Déjà dans une trace : l'opération devient une étape de celle-ci
+        if _trace_courante.get() is not None:
+            with span(nom, **attributs) as s:
+                yield s
+        else:
+            yield SPAN_INACTIF
+        return
+    courante = _Trace(chemin, getattr(settings, 'NEWSLETTER_TRACE_DETAIL_SAMPLE_RATE', 0.01))
+    jeton = _trace_courante.set(courante)
+    try:
+        with _chronometrer(courante, nom, attributs) as s:
+            yield s
+    finally:
+        _trace_courante.reset(jeton)
+        courante.ecrire()
+
+@contextmanager
+def span(nom, detail=False, **attributs):
+    """Étape de la trace en cours (no-op hors trace échantillonnée).
+
+    Les étapes répétées par destinataire (detail=True) ne sont enregistrées qu'avec la
+    probabilité NEWSLETTER_TRACE_DETAIL_SAMPLE_RATE, avec le poids correspondant.
+    """
+    courante = _trace_courante.get()
+    if courante is None:
+        yield SPAN_INACTIF
+        return
+    poids = 1
+    if detail:
+        if random.random() >= courante.taux_detail:
+            yield SPAN_INACTIF
+            return
+        poids = round(1 / courante.taux_detail, 3)
+    with _chronometrer(courante, nom, attributs, poids) as s:
+        yield s
+
+# --- Lecture et résumé des traces (manage.py resumer_traces) ---------------------
+
+def centile(valeurs, fraction):
+    """Centile (au rang le plus proche) d'une liste non vide"""
+    valeurs = sorted(valeurs)
+    return valeurs[min(int(len(valeurs) * fraction), len(valeurs) - 1)]
+
+def lire_spans(chemin):
+    """Spans d'un fichier de traces ; retourne (spans, numéros des lignes illisibles)"""
+    spans = []
+    illisibles = []
+    with open(chemin, encoding='utf-8') as f:
+        for numero, ligne in enumerate(f, 1):
+            try:
+                spans.append(json.loads(ligne))
+            except ValueError:
+                illisibles.append(numero)
+    return spans, illisibles
+
+def resumer_traces(spans, operation=None):
+    """Répartition du temps par étape pour chaque opération racine (envoi, envoi_planifie...).
+
+    Retourne une liste de {'operation', 'traces', 'total_ms', 'etapes'} ; chaque étape est
+    désignée par son chemin depuis la racine ('destinataires', 'lot/smtp_data'...) et triée par
+    temps total décroissant. Les spans de détail échantillonnés comptent pour leur poids.
+    """
+    # Span racine de chaque trace : l'opération à laquelle appartiennent les étapes
+    racines = {span['trace']: span for span in spans if span['parent'] is None}
+    par_id = {span['span']: span for span in spans}
+    etapes = defaultdict(lambda: defaultdict(list))
+    for span in spans:
+        racine = racines.get(span['trace'])
+        if racine is None or span is racine:
+            continue
+        # Chemin complet depuis la racine : les étapes imbriquées restent distinctes
+        noms, parent = [span['nom']], par_id.get(span['parent'])
+        while parent is not None and parent is not racine:
+            noms.append(parent['nom'])
+            parent = par_id.get(parent['parent'])
+        etapes[racine['nom']]['/'.join(reversed(noms))].append(span)
+
+    resume = []
+    for nom in sorted({racine['nom'] for racine in racines.values()}):
+        if operation and nom != operation:
+            continue
+        racines_operation = [racine for racine in racines.values() if racine['nom'] == nom]
+        total = sum(racine['duree_ms'] for racine in racines_operation)
+        lignes = []
+        for etape, spans_etape in etapes[nom].items():
+            appels = sum(span.get('poids', 1) for span in spans_etape)
+            total_etape = sum(span['duree_ms'] * span.get('poids', 1) for span in spans_etape)
+            durees = [span['duree_ms'] for span in spans_etape]
+            lignes.append({
+                'etape': etape,
+                'appels': appels,
+                'total_ms': total_etape,
+                'part': 100 * total_etape / total if total else 0,
+                'moyenne_ms': total_etape / appels,
+                'p50_ms': centile(durees, 0.5),
+                'p95_ms': centile(durees, 0.95),
+                'max_ms': max(durees),
+                'echantillonne': any('poids' in span for span in spans_etape),
+            })
+        lignes.sort(key=lambda ligne: -ligne['total_ms'])
+        resume.append({'operation': nom, 'traces': len(racines_operation), 'total_ms': total, 'etapes': lignes})
+    return resume
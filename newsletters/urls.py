@@ -10,6 +10,8 @@ urlpatterns = [
     path('<int:newsletter_id>/delete/', views.newsletter_delete, name='newsletter_delete'),
     path('<int:newsletter_id>/duplicate/', views.newsletter_duplicate, name='newsletter_duplicate'),
     path('<int:newsletter_id>/preview/', views.newsletter_preview, name='newsletter_preview'),
+    path('<int:newsletter_id>/stats/', views.newsletter_stats, name='newsletter_stats'),
+    path('<int:newsletter_id>/progress/', views.newsletter_progress, name='newsletter_progress'),
     
     path('subscribers/', views.subscriber_list, name='subscriber_list'),
     path('subscribers/create/', views.subscriber_create, name='subscriber_create'),
@@ -18,4 +20,8 @@ urlpatterns = [
     path('subscribers/<int:subscriber_id>/delete/', views.subscriber_delete, name='subscriber_delete'),
     
     path('unsubscribe/<str:token>/', views.unsubscribe, name='unsubscribe'),
+    path('o/<int:newsletter_id>/<str:token>.gif', views.open_pixel, name='open_pixel'),
+    path('c/<str:code>/<str:token>/', views.click_redirect, name='click_redirect'),
+    path('cache/stats/', views.cache_stats, name='cache_stats'),
+    path('metrics/', views.metrics, name='metrics'),
 ] 
\ No newline at end of file
@@ -1,4 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib import messages
 from django.core.mail import EmailMessage, send_mail
 from django.conf import settings
@@ -6,28 +7,52 @@ from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 from .models import Newsletter, Subscriber, Envoi
 from .forms import NewsletterForm, SubscriberForm, ImportSubscribersForm, CustomLoginForm
+from .stats import get_metriques, creer_envois, changer_statut_envois
+from .desabonnement import desabonner, token_valide, page_desabonnement, page_confirmation_desabonnement
+from .suppression import filtrer_destinataires
+from .engagement import abonnes_engages, get_engagement
+from .rendu import rendu_newsletter
+from .invalidation import invalider_newsletter
+from .caches import generation, statistiques as statistiques_cache
+from .pagination import PaginatorCompteEnCache
+from .progression import Progression, FluxProgression
+from .traces import trace, span
+from .telemetrie import (
+    registre, SMTP_CONNEXION, SMTP_ENVOI, MESSAGES, TAILLE_LOT, ENVOIS_DUS,
+    RETARD_PLANIFICATEUR, DERNIER_RETARD, IMPORT_LIGNES, IMPORT_DUREE, IMPORT_DEBIT,
+)
+from .suivi import (
+    PIXEL_GIF, ajouter_pixel, signaler_ouverture, reecrire_liens, resoudre_lien, signaler_clic,
+)
 import pandas as pd
 import json
-from datetime import datetime
-import re
+from datetime import datetime, timedelta
 import logging
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseRedirect, Http404, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.views.decorators.csrf import csrf_exempt
 import csv
 from django.contrib.auth.views import LoginView
-import hashlib
+import hmac
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.contrib.auth import logout
-from new import NewsletterManager
+from django.contrib.staticfiles import finders
+from django.db import close_old_connections
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from new import (
+    NewsletterManager, DjangoStorage, text_to_html, optimiser_html_email,
+    integrer_images_cid, construire_message, ModeleMessage, ENTETE_NEWSLETTER, JournalLot,
+)
 import threading
 import time
 import os
 
 logger = logging.getLogger(__name__)
-newsletter_manager = NewsletterManager()
+# Le gestionnaire partage les tables Django ; les envois planifiés sont gérés par check_scheduled_newsletters
+newsletter_manager = NewsletterManager(storage=DjangoStorage(), service_mode=True)
 
 def home(request):
     return render(request, 'newsletters/home.html')
@@ -35,35 +60,164 @@ def home(request):
 @login_required
 def newsletter_list(request):
     """Vue pour lister les newsletters"""
-    newsletters = Newsletter.objects.all().order_by('-date_creation')
+    # Les compteurs sont lus dans la table pré-agrégée, sans balayer les envois ;
+    # seules les colonnes affichées sont chargées (pas les corps HTML / texte)
+    newsletters = Newsletter.objects.only(
+        'id', 'titre', 'objet', 'statut', 'date_creation'
+    ).annotate(
+        nb_destinataires=Coalesce(F('statistiques__destinataires'), Value(0)),
+        nb_envoyes=Coalesce(F('statistiques__envoyes'), Value(0)),
+        nb_erreurs=Coalesce(F('statistiques__erreurs'), Value(0)),
+        nb_desabonnes=Coalesce(F('statistiques__desabonnes'), Value(0)),
+        nb_ouverts=Coalesce(F('statistiques__ouverts'), Value(0)),
+    ).order_by('-date_creation', '-id')
+    paginator = PaginatorCompteEnCache(newsletters, getattr(settings, 'NEWSLETTER_LIST_PAGE_SIZE', 25))
+    page_obj = paginator.get_page(request.GET.get('page'))
+    # Les lignes sont un fragment en cache : la page n'est évaluée qu'en cas d'échec
     return render(request, 'newsletters/newsletter_list.html', {
-        'newsletters': newsletters
+        'newsletters': page_obj,
+        'page_obj': page_obj,
+        'generation': generation('newsletters'),
+        'duree_cache': getattr(settings, 'NEWSLETTER_FRAGMENT_CACHE_SECONDS', 300),
     })
 
+def preparer_images(contenu_html):
+    """Intègre les images {% static %} en pièces CID (settings.NEWSLETTER_EMBED_IMAGES)"""
+    if not getattr(settings, 'NEWSLETTER_EMBED_IMAGES', True):
+        return contenu_html, []
+    return integrer_images_cid(contenu_html, finders.find)
+
+def journal_lot(libelle):
+    """Résumé par lot d'une boucle d'envoi ou d'import (settings.NEWSLETTER_LOG_BATCH_SIZE / _SAMPLE_RATE)"""
+    return JournalLot(
+        logger, libelle,
+        getattr(settings, 'NEWSLETTER_LOG_BATCH_SIZE', 1000),
+        getattr(settings, 'NEWSLETTER_LOG_SAMPLE_RATE', 0.0),
+    )
+
+def enregistreur_envois(newsletter_id):
+    """Écriture groupée des statuts d'un lot d'Envois en attente ; signe de vie de l'envoi en cours"""
+    def enregistrer(envoyes, erreurs):
+        with span('ecriture_envois', nombre=len(envoyes) + len(erreurs)):
+            for ids, statut in ((envoyes, 'envoye'), (erreurs, 'erreur')):
+                if ids:
+                    changer_statut_envois(newsletter_id, 'en_attente', statut, ids)
+            Newsletter.objects.filter(pk=newsletter_id).update(derniere_activite=timezone.now())
+    return enregistrer
+
+class ConnexionSMTP:
+    """Connexion SMTP authentifiée ; rouverte par envoyer_personnalise si le serveur la coupe en cours d'envoi"""
+
+    def __init__(self):
+        self.server = None
+        self.ouvrir()
+
+    def ouvrir(self):
+        with SMTP_CONNEXION.chronometrer(), span('smtp_connexion'):
+            server = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT)
+            server.starttls()
+            server.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
+        self.server = server
+
+    def fermer(self):
+        try:
+            self.server.quit()
+        except Exception:
+            pass
+
+def connexion_perdue(erreur):
+    """Erreur de la connexion elle-même (coupure, socket, délai) plutôt que refus d'un destinataire"""
+    if isinstance(erreur, smtplib.SMTPServerDisconnected):
+        return True
+    # SMTPException hérite d'OSError : seules les autres OSError sont des erreurs réseau
+    return isinstance(erreur, OSError) and not isinstance(erreur, smtplib.SMTPException)
+
+def envoyer_personnalise(smtp, newsletter, contenu_html, images, abonnes, base_url, enregistrer, progression=None):
+    """Envoie un message par abonné ({{prenom}}, {{nom}}, {{unsubscribe_url}}...).
+
+    Le message est compilé une fois. Les statuts sont transmis à enregistrer(envoyes, erreurs)
+    par lots de NEWSLETTER_SEND_BATCH_SIZE abonnés (une écriture groupée par lot) ; retourne
+    les nombres d'envoyés et d'erreurs. L'avancement est compté dans progression si elle est fournie.
+
+    Une erreur de fusion ou un refus du serveur ne concerne que son destinataire. Sur une
+    coupure de connexion, smtp est rouvert et le message renvoyé une fois ; si l'erreur persiste,
+    les statuts déjà connus sont enregistrés avant de la relever : les abonnés restants sont
+    les seuls à ne pas avoir été traités.
+    """
+    taille_lot = getattr(settings, 'NEWSLETTER_SEND_BATCH_SIZE', 500)
+    with span('compilation_mime'):
+        modele = ModeleMessage(newsletter.contenu_text, contenu_html, {
+            'Subject': newsletter.objet,
+            'From': settings.EMAIL_HOST_USER,
+            ENTETE_NEWSLETTER: str(newsletter.pk),
+        }, images)
+    envoyes, erreurs = [], []
+    sent_count = error_count = 0
+    journal = journal_lot(f"Envoi de la newsletter {newsletter.pk}")
+
+    def echec(abonne, message):
+        logger.error(message)
+        erreurs.append(abonne.pk)
+        journal.compter('erreur')
+        MESSAGES.inc(statut='erreur')
+        if progression:
+            progression.avancer(erreurs=1)
+
+    try:
+        for abonne in abonnes:
+            if len(envoyes) + len(erreurs) >= taille_lot:
+                enregistrer(envoyes, erreurs)
+                sent_count, error_count = sent_count + len(envoyes), error_count + len(erreurs)
+                envoyes, erreurs = [], []
+            TAILLE_LOT.observe(1, mode='personnalise')
+            try:
+                # Le token de suivi (pixel, liens) ne permet pas de désabonner : il peut fuiter sans risque
+                token_suivi = abonne.token_suivi
+                valeurs = {
+                    'prenom': abonne.prenom,
+                    'nom': abonne.nom,
+                    'email': abonne.email,
+                    'unsubscribe_url': base_url + reverse('unsubscribe', args=[abonne.token_signe]),
+                    'suivi_token': token_suivi,
+                }
+                if newsletter.suivi_ouvertures:
+                    valeurs['pixel_url'] = base_url + reverse('open_pixel', args=[newsletter.pk, token_suivi])
+                # Étapes répétées par destinataire : spans échantillonnés (detail=True)
+                with span('fusion', detail=True) as etape:
+                    message = modele.rendre(valeurs, abonne.email)
+                    etape.ajouter(octets=len(message))
+            except Exception as e:
+                echec(abonne, f"Erreur de fusion pour {abonne.email}: {e}")
+                continue
+            for tentative in range(2):
+                try:
+                    with SMTP_ENVOI.chronometrer(mode='personnalise'), span('smtp_data', detail=True, octets=len(message)):
+                        smtp.server.sendmail(settings.EMAIL_HOST_USER, [abonne.email], message)
+                except Exception as e:
+                    if not connexion_perdue(e):
+                        echec(abonne, f"Erreur d'envoi à {abonne.email}: {e}")
+                        break
+                    if tentative:
+                        raise
+                    logger.warning(f"Connexion SMTP perdue ({e}), reconnexion")
+                    smtp.fermer()
+                    smtp.ouvrir()
+                else:
+                    envoyes.append(abonne.pk)
+                    journal.compter('envoye', "Email envoyé avec succès à %s", abonne.email)
+                    MESSAGES.inc(statut='envoye')
+                    if progression:
+                        progression.avancer(envoyes=1)
+                    break
+    finally:
+        # Y compris sur erreur : ces messages sont partis (ou ont échoué), ils ne seront pas renvoyés
+        enregistrer(envoyes, erreurs)
+        journal.terminer()
+    return sent_count + len(envoyes), error_count + len(erreurs)
+
 def convert_text_to_html(text):
-    """Convertit le texte en HTML"""
-    if not text:
-        return ""
-    
-    # Remplacer les sauts de ligne par des paragraphes
-    paragraphs = text.split('\n\n')
-    html_content = []
-    
-    for paragraph in paragraphs:
-        if paragraph.strip():
-            # Convertir les liens
-            paragraph = re.sub(
-                r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+',
-                r'<a href="\g<0>">\g<0></a>',
-                paragraph
-            )
-            # Convertir le texte en gras
-            paragraph = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', paragraph)
-            # Convertir le texte en italique
-            paragraph = re.sub(r'\*(.*?)\*', r'<em>\1</em>', paragraph)
-            html_content.append(f'<p>{paragraph}</p>')
-    
-    return '\n'.join(html_content)
+    """Convertit le texte en HTML (rendu partagé avec new.py, mis en cache par contenu)"""
+    return text_to_html(text)
 
 @login_required
 def newsletter_create(request):
@@ -79,6 +233,12 @@ def newsletter_create(request):
             couleur_texte = request.POST.get('couleur_texte', '#000000')
             ajouter_signature = request.POST.get('ajouter_signature') == 'on'
             ajouter_social = request.POST.get('ajouter_social') == 'on'
+            suivi_ouvertures = request.POST.get('suivi_ouvertures') == 'on'
+            suivi_clics = request.POST.get('suivi_clics') == 'on'
+
+            # Sans contenu HTML saisi, générer le HTML à partir de la version texte
+            if not contenu_html and contenu_text:
+                contenu_html = convert_text_to_html(contenu_text)
 
             # Créer la newsletter
             newsletter = Newsletter.objects.create(
@@ -89,11 +249,13 @@ def newsletter_create(request):
                 police=police,
                 couleur_texte=couleur_texte,
                 ajouter_signature=ajouter_signature,
-                ajouter_social=ajouter_social
+                ajouter_social=ajouter_social,
+                suivi_ouvertures=suivi_ouvertures,
+                suivi_clics=suivi_clics
             )
 
             messages.success(request, 'Newsletter créée avec succès')
-            return redirect('newsletter_detail', pk=newsletter.pk)
+            return redirect('newsletter_detail', newsletter_id=newsletter.pk)
         except Exception as e:
             messages.error(request, f'Erreur lors de la création de la newsletter: {str(e)}')
             return redirect('newsletter_create')
@@ -101,157 +263,223 @@ def newsletter_create(request):
     return render(request, 'newsletters/newsletter_form.html')
 
 @login_required
-def newsletter_detail(request, pk):
-    """Vue pour voir les détails d'une newsletter"""
-    newsletter = get_object_or_404(Newsletter, pk=pk)
-    return render(request, 'newsletters/newsletter_detail.html', {
-        'newsletter': newsletter
-    })
+def newsletter_detail(request, newsletter_id):
+    """Vue pour voir les détails d'une newsletter (rendu en cache, 304 si inchangée)"""
+    return rendu_newsletter(request, newsletter_id, 'newsletters/newsletter_detail.html')
+
+def check_scheduled_newsletters_standalone():
+    """Envoie les newsletters arrivées à échéance (un seul passage).
+
+    Sont dues les newsletters planifiées (y compris les envois immédiats, que newsletter_send
+    planifie à l'instant même) et les envois en cours sans signe de vie depuis
+    NEWSLETTER_SEND_STALE_SECONDS, interrompus par l'arrêt de leur processus : ceux-ci reprennent
+    aux Envois encore en attente.
+    """
+    current_time = timezone.now()
+    limite = current_time - timedelta(seconds=getattr(settings, 'NEWSLETTER_SEND_STALE_SECONDS', 600))
+    newsletters = list(Newsletter.objects.filter(
+        Q(statut='planifie', date_envoi_planifie__lte=current_time)
+        | Q(statut='en_cours', derniere_activite__lt=limite)
+        | Q(statut='en_cours', derniere_activite__isnull=True)
+    ))
+    ENVOIS_DUS.set(len(newsletters))
+    base_url = getattr(settings, 'SITE_URL', '') or (
+        f"http://{settings.ALLOWED_HOSTS[0]}" if settings.ALLOWED_HOSTS else 'http://localhost:8000'
+    )
+    logo_absolute_url = f"{base_url}{os.path.join(settings.STATIC_URL, 'images/logo.png')}"
+    for newsletter in newsletters:
+        # Réservation : un seul processus (scheduler, thread d'un worker) envoie une campagne donnée
+        if not Newsletter.objects.filter(
+            pk=newsletter.pk, statut=newsletter.statut, derniere_activite=newsletter.derniere_activite
+        ).update(statut='en_cours', derniere_activite=timezone.now()):
+            continue
+        invalider_newsletter(newsletter.pk)
+        if newsletter.statut == 'en_cours':
+            logger.warning(f"Reprise de l'envoi interrompu de la newsletter {newsletter.pk}")
+            nom = 'reprise_envoi'
+            attributs = {}
+        else:
+            logger.info(f"Envoi de la newsletter planifiée {newsletter.pk}")
+            retard = (timezone.now() - newsletter.date_envoi_planifie).total_seconds()
+            RETARD_PLANIFICATEUR.observe(retard)
+            DERNIER_RETARD.set(retard)
+            nom = 'envoi_planifie'
+            attributs = {'retard_s': round(retard, 3)}
+        with trace(nom, newsletter=newsletter.pk, **attributs):
+            try:
+                if newsletter.statut == 'planifie' and not Envoi.objects.filter(
+                    newsletter=newsletter, statut='en_attente'
+                ).exists():
+                    # Envoi planifié sans destinataires choisis : tous les abonnés actifs, hors liste
+                    # de suppression et abonnés ayant déjà un Envoi pour cette newsletter
+                    with span('destinataires') as etape:
+                        abonnes = Subscriber.objects.filter(statut='actif').exclude(envoi__newsletter=newsletter)
+                        abonnes, _ = filtrer_destinataires(abonnes)
+                        etape.ajouter(nombre=len(abonnes))
+                    if not abonnes:
+                        logger.warning(f"Aucun abonné actif pour la newsletter {newsletter.pk}")
+                        Newsletter.objects.filter(pk=newsletter.pk).update(statut='planifie')
+                        invalider_newsletter(newsletter.pk)
+                        continue
+                    creer_envois(newsletter.pk, [abonne.pk for abonne in abonnes], 'en_attente')
+                envoyer_campagne(newsletter.pk, base_url, logo_absolute_url)
+            except Exception as e:
+                logger.error(f"Erreur lors de l'envoi de la newsletter {newsletter.pk}: {str(e)}")
+                Newsletter.objects.filter(pk=newsletter.pk).update(statut='erreur')
+                invalider_newsletter(newsletter.pk)
 
 def check_scheduled_newsletters():
     """Vérifie périodiquement les newsletters planifiées"""
     while True:
         try:
-            current_time = timezone.now()
-            newsletters = Newsletter.objects.filter(
-                statut='planifie',
-                date_envoi_planifie__lte=current_time
-            )
-            
-            for newsletter in newsletters:
-                logger.info(f"Envoi de la newsletter planifiée {newsletter.pk}")
-                try:
-                    # Récupérer tous les abonnés actifs
-                    abonnes = Subscriber.objects.filter(statut='actif')
-                    
-                    if not abonnes.exists():
-                        logger.warning(f"Aucun abonné actif pour la newsletter {newsletter.pk}")
-                        continue
-                    
-                    # Configuration SMTP
-                    try:
-                        server = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT)
-                        server.starttls()
-                        server.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
-                        logger.info("Connexion SMTP réussie")
-                    except Exception as e:
-                        logger.error(f"Erreur de connexion SMTP: {e}")
-                        newsletter.statut = 'erreur'
-                        newsletter.save()
-                        continue
-                    
-                    sent_count = 0
-                    error_count = 0
-                    
-                    # Adresse par défaut en CCI
-                    default_bcc = settings.DEFAULT_BCC_EMAIL if hasattr(settings, 'DEFAULT_BCC_EMAIL') else None
-                    
-                    # Liste des destinataires en CCI
-                    bcc_list = [abonne.email for abonne in abonnes]
-                    if default_bcc:
-                        bcc_list.append(default_bcc)
-                    
-                    # Construire l'URL absolue du logo pour les envois planifiés
-                    # Nous devons construire la base_url manuellement car il n'y a pas de request
-                    # Idéalement, settings.SITE_URL devrait être configuré pour la prod
-                    base_url = f"http://{settings.ALLOWED_HOSTS[0]}" if settings.ALLOWED_HOSTS else 'http://localhost:8000'
-                    logo_relative_path = os.path.join(settings.STATIC_URL, 'images/logo.png')
-                    logo_absolute_url = f"{base_url}{logo_relative_path}"
+            # Recycler les connexions expirées (CONN_MAX_AGE) : hors requête, Django ne le fait pas
+            close_old_connections()
+            check_scheduled_newsletters_standalone()
+        except Exception as e:
+            logger.error(f"Erreur dans le thread de vérification : {str(e)}")
+        
+        # Attendre avant la prochaine vérification
+        time.sleep(getattr(settings, 'NEWSLETTER_SCHEDULER_INTERVAL', 30))
+
+# Démarrer le thread de vérification au démarrage de l'application (sauf si un processus
+# dédié, manage.py run_scheduler, s'en charge : NEWSLETTER_SCHEDULER_THREAD = False)
+if getattr(settings, 'NEWSLETTER_SCHEDULER_THREAD', True):
+    check_thread = threading.Thread(target=check_scheduled_newsletters, daemon=True)
+    check_thread.start()
+
+def envoyer_campagne(newsletter_id, base_url, logo_absolute_url):
+    """Envoie la newsletter aux abonnés dont l'Envoi est en attente ; l'avancement est publié par lot.
+
+    Appelée par le scheduler (newsletter réservée, statut en_cours) : un envoi interrompu
+    reprend ainsi aux seuls Envois encore en attente.
+    """
+    with trace('envoi', newsletter=newsletter_id):
+        newsletter = Newsletter.objects.get(pk=newsletter_id)
+        with span('destinataires') as etape:
+            abonnes_a_envoyer = list(Subscriber.objects.filter(
+                envoi__newsletter=newsletter, envoi__statut='en_attente'
+            ).order_by('email'))
+            etape.ajouter(nombre=len(abonnes_a_envoyer))
+        progression = Progression(newsletter_id, len(abonnes_a_envoyer))
+        try:
+            # Configuration SMTP
+            try:
+                logger.info("Tentative de connexion au serveur SMTP")
+                smtp = ConnexionSMTP()
+                logger.info("Connexion SMTP réussie")
+            except Exception as e:
+                logger.error(f"Erreur de connexion SMTP: {e}")
+                newsletter.statut = 'erreur'
+                newsletter.save()
+                progression.terminer('erreur', "Erreur de connexion au serveur mail")
+                return
+
+            sent_count = 0
+            error_count = 0
+
+            # Adresse par défaut en CCI
+            default_bcc = settings.DEFAULT_BCC_EMAIL if hasattr(settings, 'DEFAULT_BCC_EMAIL') else None
+
+            # Liste des destinataires en CCI
+            bcc_list = [abonne.email for abonne in abonnes_a_envoyer]
+            if default_bcc:
+                bcc_list.append(default_bcc)
 
+            try:
+                with span('preparation_html') as etape:
                     # Remplacer le placeholder du logo dans le contenu HTML de la newsletter
-                    final_html_content = newsletter.contenu_html.replace(
+                    # Attention: Le contenu HTML stocké dans la DB ne doit pas contenir la balise {% static ... %}
+                    # car cette balise n'est pas interprétée par le backend Python.
+                    # Le HTML des templates prédéfinis dans le JS est une chose, le HTML final pour l'email en est une autre.
+                    final_html_content, images = preparer_images(newsletter.contenu_html)
+                    final_html_content = final_html_content.replace(
                         '{%' + ' static "images/logo.png" %}',
                         logo_absolute_url
                     )
-
-                    # Envoyer un seul email avec tous les destinataires en CCI
-                    try:
-                        # Personnaliser le contenu
-                        html_content = newsletter.contenu_html
-                        text_content = newsletter.contenu_text
-                        
-                        # Créer le message
-                        msg = MIMEMultipart('alternative')
+                    # CSS inliné et HTML minifié (mis en cache par version du contenu)
+                    final_html_content = optimiser_html_email(final_html_content)
+                    # Pixel de suivi des ouvertures et liens suivis : imposent un message par abonné
+                    if newsletter.suivi_ouvertures:
+                        final_html_content = ajouter_pixel(final_html_content)
+                    if newsletter.suivi_clics:
+                        final_html_content = reecrire_liens(newsletter, final_html_content, base_url)
+                    etape.ajouter(octets=len(final_html_content), images=len(images))
+
+                # Contenu avec balises de fusion : un message personnalisé par abonné
+                if ModeleMessage.contient_balises(newsletter.contenu_text, final_html_content):
+                    sent_count, error_count = envoyer_personnalise(
+                        smtp, newsletter, final_html_content, images, abonnes_a_envoyer, base_url,
+                        enregistreur_envois(newsletter.pk), progression
+                    )
+                else:
+                    with span('construction_mime'):
+                        # Créer le message (versions texte et HTML, images intégrées)
+                        msg = construire_message(newsletter.contenu_text, final_html_content, images)
                         msg['Subject'] = newsletter.objet
                         msg['From'] = f"{settings.EMAIL_HOST_USER}"
                         msg['To'] = settings.EMAIL_HOST_USER  # L'expéditeur comme destinataire principal
                         msg['Bcc'] = ', '.join(bcc_list)  # Tous les destinataires en CCI
-                        
-                        # Ajouter les versions texte et HTML
-                        part1 = MIMEText(newsletter.contenu_text, 'plain', 'utf-8')
-                        part2 = MIMEText(final_html_content, 'html', 'utf-8')
-                        
-                        msg.attach(part1)
-                        msg.attach(part2)
-                        
-                        # Envoyer
-                        server.send_message(msg)
-                        
-                        # Enregistrer les envois
-                        for abonne in abonnes:
-                            Envoi.objects.create(
-                                newsletter=newsletter,
-                                subscriber=abonne,
-                                statut='envoye'
-                            )
-                            sent_count += 1
-                            logger.info(f"Email envoyé avec succès à {abonne.email}")
-                        
-                    except Exception as e:
-                        error_count = len(abonnes)
-                        logger.error(f"Erreur lors de l'envoi en masse: {str(e)}")
-                        for abonne in abonnes:
-                            Envoi.objects.create(
-                                newsletter=newsletter,
-                                subscriber=abonne,
-                                statut='erreur'
-                            )
-                    
-                    try:
-                        server.quit()
-                    except:
-                        pass
-                    
-                    # Mettre à jour le statut de la newsletter
-                    if error_count > 0:
-                        if sent_count == 0:
-                            newsletter.statut = 'erreur'
-                        else:
-                            newsletter.statut = 'envoye_partiel'
-                    else:
-                        newsletter.statut = 'envoye'
-                    
-                    newsletter.date_envoi = current_time
-                    newsletter.save()
-                    
-                    logger.info(f"Newsletter {newsletter.pk} envoyée : {sent_count} succès, {error_count} erreurs")
-                    
-                except Exception as e:
-                    logger.error(f"Erreur lors de l'envoi de la newsletter {newsletter.pk}: {str(e)}")
+                        msg[ENTETE_NEWSLETTER] = str(newsletter.pk)  # Attribution des rebonds
+
+                    # Envoyer
+                    with SMTP_ENVOI.chronometrer(mode='groupe'), span('smtp_data', destinataires=len(bcc_list)):
+                        smtp.server.send_message(msg)
+                    TAILLE_LOT.observe(len(bcc_list), mode='groupe')
+                    MESSAGES.inc(len(abonnes_a_envoyer), statut='envoye')
+                    progression.avancer(envoyes=len(abonnes_a_envoyer))
+
+                    with span('ecriture_envois', nombre=len(abonnes_a_envoyer)):
+                        # Mettre à jour les statuts des envois (UPDATE groupé)
+                        sent_count = changer_statut_envois(newsletter.pk, 'en_attente', 'envoye')
+                    journal = journal_lot(f"Envoi de la newsletter {newsletter.pk}")
+                    for abonne in abonnes_a_envoyer:
+                        journal.compter('envoye', "Email envoyé avec succès à %s", abonne.email)
+                    journal.terminer()
+
+            except Exception as e:
+                logger.error(f"Erreur lors de l'envoi en masse: {str(e)}")
+                # Les statuts déjà déterminés sont enregistrés : seuls les Envois encore en attente échouent
+                restants = changer_statut_envois(newsletter.pk, 'en_attente', 'erreur')
+                MESSAGES.inc(restants, statut='erreur')
+                sent_count = progression.etat['envoyes']
+                error_count = progression.etat['erreurs'] + restants
+
+            smtp.fermer()
+
+            # Mettre à jour le statut final de la newsletter
+            logger.info(f"Résumé de l'envoi : {sent_count} envoyés, {error_count} erreurs")
+            if error_count > 0:
+                if sent_count == 0:
                     newsletter.statut = 'erreur'
-                    newsletter.save()
-            
+                    logger.info("Statut mis à jour en 'erreur' (aucun envoi réussi)")
+                else:
+                    newsletter.statut = 'envoye_partiel'
+                    logger.info("Statut mis à jour en 'envoye_partiel'")
+            else:
+                newsletter.statut = 'envoye'
+                logger.info("Statut mis à jour en 'envoye'")
+            newsletter.date_envoi = timezone.now()
+            newsletter.save()
+            # Compteurs définitifs (les erreurs d'un envoi groupé ne sont connues qu'à la fin)
+            progression.etat.update(envoyes=sent_count, erreurs=error_count)
+            progression.terminer(newsletter.statut)
         except Exception as e:
-            logger.error(f"Erreur dans le thread de vérification : {str(e)}")
-        
-        # Attendre 30 secondes avant la prochaine vérification
-        time.sleep(30)
-
-# Démarrer le thread de vérification au démarrage de l'application
-check_thread = threading.Thread(target=check_scheduled_newsletters, daemon=True)
-check_thread.start()
+            logger.error(f"Erreur générale lors de l'envoi : {str(e)}")
+            newsletter.statut = 'erreur'
+            newsletter.save()
+            progression.terminer('erreur', f"Erreur lors de l'envoi : {e}")
 
 @login_required
-def newsletter_send(request, pk):
+def newsletter_send(request, newsletter_id):
     """Vue pour envoyer une newsletter"""
-    newsletter = get_object_or_404(Newsletter, pk=pk)
+    newsletter = get_object_or_404(Newsletter, pk=newsletter_id)
     
     # Récupérer tous les abonnés actifs
     abonnes = Subscriber.objects.filter(statut='actif').order_by('email')
     
     if request.method == 'POST':
         try:
-            logger.info(f"Début de l'envoi de la newsletter {pk}")
+            logger.info(f"Début de l'envoi de la newsletter {newsletter_id}")
             
             # Vérifier si c'est une planification
             if request.POST.get('planifier'):
@@ -269,165 +497,85 @@ def newsletter_send(request, pk):
                         messages.error(request, 'Format de date invalide')
                 else:
                     messages.error(request, 'Date d\'envoi requise')
+            elif newsletter.statut == 'en_cours':
+                messages.error(request, 'Un envoi de cette newsletter est déjà en cours')
             else:
                 # Envoi immédiat
                 logger.info("Début de l'envoi immédiat")
                 
-                # Récupérer les destinataires sélectionnés
-                destinataires = request.POST.getlist('destinataires')
-                if not destinataires:
-                    messages.error(request, 'Veuillez sélectionner au moins un destinataire')
-                    return render(request, 'newsletters/newsletter_send.html', {
-                        'newsletter': newsletter,
-                        'abonnes': abonnes
-                    })
+                # Préparation de l'envoi dans la requête ; l'envoi lui-même est tracé par envoyer_campagne
+                with trace('newsletter_send', newsletter=newsletter.pk):
+                    # Récupérer les destinataires sélectionnés
+                    destinataires = request.POST.getlist('destinataires')
+                    if not destinataires:
+                        messages.error(request, 'Veuillez sélectionner au moins un destinataire')
+                        return render(request, 'newsletters/newsletter_send.html', {
+                            'newsletter': newsletter,
+                            'abonnes': abonnes
+                        })
                 
-                # Récupérer les abonnés sélectionnés
-                if 'tous' in destinataires:
-                    abonnes_a_envoyer = abonnes
-                else:
-                    abonnes_a_envoyer = Subscriber.objects.filter(id__in=destinataires, statut='actif')
+                    # Récupérer les abonnés sélectionnés
+                    if 'tous' in destinataires:
+                        abonnes_a_envoyer = abonnes
+                    elif 'engages' in destinataires:
+                        abonnes_a_envoyer = abonnes_engages(abonnes)
+                    else:
+                        abonnes_a_envoyer = Subscriber.objects.filter(id__in=destinataires, statut='actif')
                 
-                logger.info(f"Nombre d'abonnés sélectionnés : {abonnes_a_envoyer.count()}")
+                    logger.info(f"Nombre d'abonnés sélectionnés : {abonnes_a_envoyer.count()}")
                 
-                if not abonnes_a_envoyer.exists():
-                    messages.error(request, 'Aucun abonné actif sélectionné')
-                    return render(request, 'newsletters/newsletter_send.html', {
-                        'newsletter': newsletter,
-                        'abonnes': abonnes
-                    })
-
-                # Supprimer les anciens envois en attente ou en erreur
-                Envoi.objects.filter(newsletter=newsletter, statut__in=['en_attente', 'erreur']).delete()
-                logger.info("Anciens envois supprimés")
+                    # Écarter la liste de suppression (filtre en mémoire, confirmation groupée)
+                    with span('destinataires') as etape:
+                        abonnes_a_envoyer, supprimes = filtrer_destinataires(abonnes_a_envoyer)
+                        etape.ajouter(nombre=len(abonnes_a_envoyer), supprimes=len(supprimes))
+                    if supprimes:
+                        messages.warning(request, f'{len(supprimes)} destinataire(s) écarté(s) par la liste de suppression')
+                    if not abonnes_a_envoyer:
+                        messages.error(request, 'Aucun abonné actif sélectionné')
+                        return render(request, 'newsletters/newsletter_send.html', {
+                            'newsletter': newsletter,
+                            'abonnes': abonnes
+                        })
+
+                    # Supprimer les anciens envois en attente ou en erreur (DELETE groupé, compteurs décomptés)
+                    Envoi.objects.filter(newsletter=newsletter, statut__in=['en_attente', 'erreur']).delete()
+                    logger.info("Anciens envois supprimés")
                 
-                # Créer les entrées d'envoi pour chaque abonné
-                for abonne in abonnes_a_envoyer:
-                    Envoi.objects.create(
-                        newsletter=newsletter,
-                        subscriber=abonne,
-                        statut='en_attente'
-                    )
-                logger.info("Nouvelles entrées d'envoi créées")
+                    # Créer les entrées d'envoi pour chaque abonné (insertion groupée)
+                    with span('ecriture_envois', nombre=len(abonnes_a_envoyer)):
+                        creer_envois(newsletter.pk, [abonne.pk for abonne in abonnes_a_envoyer], 'en_attente')
+                    logger.info("Nouvelles entrées d'envoi créées")
                 
-                # Mettre à jour le statut de la newsletter
-                newsletter.statut = 'en_cours'
+                # L'envoi est confié au scheduler (manage.py run_scheduler), planifié à l'instant :
+                # un redémarrage des workers web ne peut pas l'interrompre. La page de la newsletter
+                # en suit la progression (Server-Sent Events)
+                newsletter.statut = 'planifie'
+                newsletter.date_envoi_planifie = timezone.now()
                 newsletter.save()
-                logger.info("Statut de la newsletter mis à jour en 'en_cours'")
-
-                # Configuration SMTP
-                try:
-                    logger.info("Tentative de connexion au serveur SMTP")
-                    server = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT)
-                    server.starttls()
-                    server.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
-                    logger.info("Connexion SMTP réussie")
-                except Exception as e:
-                    logger.error(f"Erreur de connexion SMTP: {e}")
-                    messages.error(request, "Erreur de connexion au serveur mail")
-                    newsletter.statut = 'erreur'
-                    newsletter.save()
-                    return redirect('newsletter_detail', pk=newsletter.pk)
-
-                sent_count = 0
-                error_count = 0
-
-                # Adresse par défaut en CCI
-                default_bcc = settings.DEFAULT_BCC_EMAIL if hasattr(settings, 'DEFAULT_BCC_EMAIL') else None
-                
-                # Liste des destinataires en CCI
-                bcc_list = [abonne.email for abonne in abonnes_a_envoyer]
-                if default_bcc:
-                    bcc_list.append(default_bcc)
-
-                try:
-                    # Construire l'URL absolue du logo
-                    logo_relative_path = os.path.join(settings.STATIC_URL, 'images/logo.png')
-                    # Pour les emails, nous avons besoin d'une URL absolue
-                    logo_absolute_url = request.build_absolute_uri(logo_relative_path)
-                    
-                    # Remplacer le placeholder du logo dans le contenu HTML de la newsletter
-                    # Attention: Le contenu HTML stocké dans la DB ne doit pas contenir la balise {% static ... %}
-                    # car cette balise n'est pas interprétée par le backend Python.
-                    # Le HTML des templates prédéfinis dans le JS est une chose, le HTML final pour l'email en est une autre.
-                    final_html_content = newsletter.contenu_html.replace(
-                        '{%' + ' static "images/logo.png" %}',
-                        logo_absolute_url
-                    )
-
-                    # Créer le message
-                    msg = MIMEMultipart('alternative')
-                    msg['Subject'] = newsletter.objet
-                    msg['From'] = f"{settings.EMAIL_HOST_USER}"
-                    msg['To'] = settings.EMAIL_HOST_USER  # L'expéditeur comme destinataire principal
-                    msg['Bcc'] = ', '.join(bcc_list)  # Tous les destinataires en CCI
-                    
-                    # Ajouter les versions texte et HTML
-                    part1 = MIMEText(newsletter.contenu_text, 'plain', 'utf-8')
-                    part2 = MIMEText(final_html_content, 'html', 'utf-8') # Utiliser le HTML avec l'URL absolue
-                    
-                    msg.attach(part1)
-                    msg.attach(part2)
-                    
-                    # Envoyer
-                    server.send_message(msg)
-                    
-                    # Mettre à jour les statuts des envois
-                    for envoi in Envoi.objects.filter(newsletter=newsletter, statut='en_attente'):
-                        envoi.statut = 'envoye'
-                        envoi.save()
-                        sent_count += 1
-                        logger.info(f"Email envoyé avec succès à {envoi.subscriber.email}")
-                    
-                except Exception as e:
-                    error_count = len(abonnes_a_envoyer)
-                    logger.error(f"Erreur lors de l'envoi en masse: {str(e)}")
-                    for envoi in Envoi.objects.filter(newsletter=newsletter, statut='en_attente'):
-                        envoi.statut = 'erreur'
-                        envoi.save()
-
-                try:
-                    server.quit()
-                except:
-                    pass
-                
-                # Mettre à jour le statut final de la newsletter
-                logger.info(f"Résumé de l'envoi : {sent_count} envoyés, {error_count} erreurs")
-                if error_count > 0:
-                    if sent_count == 0:
-                        newsletter.statut = 'erreur'
-                        logger.info("Statut mis à jour en 'erreur' (aucun envoi réussi)")
-                    else:
-                        newsletter.statut = 'envoye_partiel'
-                        logger.info("Statut mis à jour en 'envoye_partiel'")
-                else:
-                    newsletter.statut = 'envoye'
-                    logger.info("Statut mis à jour en 'envoye'")
-                newsletter.save()
-                
-                if error_count > 0:
-                    messages.warning(request, f'Newsletter envoyée avec {error_count} erreurs ({sent_count} emails envoyés)')
-                else:
-                    messages.success(request, f'Newsletter envoyée avec succès ({sent_count} emails envoyés)')
+                Progression(newsletter.pk, len(abonnes_a_envoyer), statut='en_attente')
+                logger.info("Envoi confié au scheduler")
+                messages.info(request, f'Envoi lancé vers {len(abonnes_a_envoyer)} abonné(s)')
             
-            return redirect('newsletter_detail', pk=newsletter.pk)
+            return redirect('newsletter_detail', newsletter_id=newsletter.pk)
             
         except Exception as e:
             logger.error(f"Erreur générale lors de l'envoi : {str(e)}")
             messages.error(request, f'Erreur lors de l\'envoi : {str(e)}')
             newsletter.statut = 'erreur'
             newsletter.save()
-            return redirect('newsletter_detail', pk=newsletter.pk)
+            return redirect('newsletter_detail', newsletter_id=newsletter.pk)
     
     return render(request, 'newsletters/newsletter_send.html', {
         'newsletter': newsletter,
-        'abonnes': abonnes
+        'abonnes': abonnes,
+        'nb_engages': abonnes_engages(abonnes).count(),
+        'jours_engagement': getattr(settings, 'NEWSLETTER_ENGAGEMENT_DAYS', 90),
     })
 
 @login_required
-def newsletter_edit(request, pk):
+def newsletter_edit(request, newsletter_id):
     """Vue pour modifier une newsletter existante"""
-    newsletter = get_object_or_404(Newsletter, pk=pk)
+    newsletter = get_object_or_404(Newsletter, pk=newsletter_id)
     
     if request.method == 'POST':
         try:
@@ -440,12 +588,18 @@ def newsletter_edit(request, pk):
             newsletter.couleur_texte = request.POST.get('couleur_texte', '#000000')
             newsletter.ajouter_signature = request.POST.get('ajouter_signature') == 'on'
             newsletter.ajouter_social = request.POST.get('ajouter_social') == 'on'
+            newsletter.suivi_ouvertures = request.POST.get('suivi_ouvertures') == 'on'
+            newsletter.suivi_clics = request.POST.get('suivi_clics') == 'on'
+            
+            # Sans contenu HTML saisi, générer le HTML à partir de la version texte
+            if not newsletter.contenu_html and newsletter.contenu_text:
+                newsletter.contenu_html = convert_text_to_html(newsletter.contenu_text)
             
             # Sauvegarder les modifications
             newsletter.save()
             
             messages.success(request, 'Newsletter modifiée avec succès')
-            return redirect('newsletter_detail', pk=newsletter.pk)
+            return redirect('newsletter_detail', newsletter_id=newsletter.pk)
         except Exception as e:
             messages.error(request, f'Erreur lors de la modification de la newsletter: {str(e)}')
             return render(request, 'newsletters/newsletter_form.html', {
@@ -458,9 +612,9 @@ def newsletter_edit(request, pk):
     })
 
 @login_required
-def newsletter_delete(request, pk):
+def newsletter_delete(request, newsletter_id):
     """Vue pour supprimer une newsletter"""
-    newsletter = get_object_or_404(Newsletter, pk=pk)
+    newsletter = get_object_or_404(Newsletter, pk=newsletter_id)
     if request.method == 'POST':
         try:
             newsletter.delete()
@@ -469,7 +623,7 @@ def newsletter_delete(request, pk):
         except Exception as e:
             logger.error(f"Erreur lors de la suppression : {str(e)}")
             messages.error(request, f'Erreur lors de la suppression : {str(e)}')
-            return redirect('newsletter_detail', pk=newsletter.pk)
+            return redirect('newsletter_detail', newsletter_id=newsletter.pk)
     return render(request, 'newsletters/newsletter_confirm_delete.html', {
         'newsletter': newsletter
     })
@@ -477,15 +631,18 @@ def newsletter_delete(request, pk):
 @login_required
 def subscriber_list(request):
     """Vue pour lister les abonnés"""
+    # Queryset paresseux : il n'est exécuté que si le fragment des lignes n'est pas en cache
     subscribers = Subscriber.objects.all().order_by('-date_inscription')
     return render(request, 'newsletters/subscriber_list.html', {
-        'subscribers': subscribers
+        'subscribers': subscribers,
+        'generation': generation('abonnes'),
+        'duree_cache': getattr(settings, 'NEWSLETTER_FRAGMENT_CACHE_SECONDS', 300),
     })
 
 @login_required
-def subscriber_delete(request, pk):
+def subscriber_delete(request, subscriber_id):
     """Vue pour supprimer un abonné"""
-    subscriber = get_object_or_404(Subscriber, pk=pk)
+    subscriber = get_object_or_404(Subscriber, pk=subscriber_id)
     if request.method == 'POST':
         subscriber.delete()
         messages.success(request, 'Abonné supprimé avec succès')
@@ -531,6 +688,8 @@ def newsletter_duplicate(request, newsletter_id):
                 police=original.police,
                 destinataires_cc=original.destinataires_cc,
                 destinataires_cci=original.destinataires_cci,
+                suivi_ouvertures=original.suivi_ouvertures,
+                suivi_clics=original.suivi_clics,
                 statut='brouillon'
             )
             messages.success(request, 'Newsletter dupliquée avec succès')
@@ -542,10 +701,56 @@ def newsletter_duplicate(request, newsletter_id):
 
 @login_required
 def newsletter_preview(request, newsletter_id):
-    """Vue pour prévisualiser une newsletter"""
+    """Vue pour prévisualiser une newsletter (rendu en cache, 304 si inchangée)"""
+    return rendu_newsletter(request, newsletter_id, 'newsletters/preview.html')
+
+@login_required
+def newsletter_stats(request, newsletter_id):
+    """Vue pour suivre la progression d'un envoi dans le temps"""
     newsletter = get_object_or_404(Newsletter, id=newsletter_id)
-    return render(request, 'newsletters/preview.html', {
-        'newsletter': newsletter
+    return render(request, 'newsletters/newsletter_stats.html', {
+        'newsletter': newsletter,
+        'metriques_minute': get_metriques(newsletter.id, 'minute', timedelta(hours=1)),
+        'metriques_heure': get_metriques(newsletter.id, 'heure', timedelta(days=2)),
+        'engagement': get_engagement(newsletter.id),
+    })
+
+@login_required
+def newsletter_progress(request, newsletter_id):
+    """Avancement de l'envoi en cours (Server-Sent Events), lu dans le cache partagé"""
+    # Sous ASGI, un flux asynchrone ; sous WSGI, un flux synchrone refermé après quelques
+    # secondes (EventSource se reconnecte) pour ne pas immobiliser un worker par page ouverte
+    if isinstance(request, ASGIRequest):
+        contenu = FluxProgression(newsletter_id).__aiter__()
+    else:
+        contenu = iter(FluxProgression(newsletter_id, getattr(settings, 'NEWSLETTER_PROGRESS_WSGI_STREAM_SECONDS', 5)))
+    response = StreamingHttpResponse(contenu, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Désactive la mise en tampon des proxys (nginx) : chaque évènement part immédiatement
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def metrics(request):
+    """Métriques de tous les processus au format texte de Prometheus.
+
+    Accessible avec l'en-tête « Authorization: Bearer <NEWSLETTER_METRICS_TOKEN> » (collecteur),
+    ou à un utilisateur connecté.
+    """
+    jeton = getattr(settings, 'NEWSLETTER_METRICS_TOKEN', '')
+    autorise = request.user.is_authenticated or (
+        jeton and hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {jeton}')
+    )
+    if not autorise:
+        return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+    return HttpResponse(registre.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@login_required
+def cache_stats(request):
+    """Succès / échecs du cache par famille de clés, pour le processus qui répond"""
+    return JsonResponse({
+        'backend': settings.CACHES['default']['BACKEND'],
+        'pid': os.getpid(),
+        'familles': statistiques_cache(),
     })
 
 @login_required
@@ -569,91 +774,103 @@ def subscriber_create(request):
 def subscriber_import(request):
     """Vue pour importer des abonnés depuis un fichier CSV"""
     if request.method == 'POST':
-        form = ImportSubscribersForm(request.POST, request.FILES)
-        if form.is_valid():
-            try:
-                file = request.FILES['file']
+        with trace('import_abonnes'):
+            form = ImportSubscribersForm(request.POST, request.FILES)
+            if form.is_valid():
+                try:
+                    file = request.FILES['file']
                 
-                # Vérifier l'extension du fichier
-                if not file.name.endswith('.csv'):
-                    messages.error(request, "Le fichier doit être au format CSV (.csv). Si vous avez un fichier Excel (.xls ou .xlsx), veuillez l'exporter en CSV.")
-                    return redirect('subscriber_import')
+                    # Vérifier l'extension du fichier
+                    if not file.name.endswith('.csv'):
+                        messages.error(request, "Le fichier doit être au format CSV (.csv). Si vous avez un fichier Excel (.xls ou .xlsx), veuillez l'exporter en CSV.")
+                        return redirect('subscriber_import')
                 
-                email_column = form.cleaned_data['email_column']
-                nom_column = form.cleaned_data['nom_column']
-                prenom_column = form.cleaned_data['prenom_column']
-
-                # Essayer différents encodages
-                encodings = ['utf-8-sig', 'utf-8', 'latin1', 'cp1252', 'iso-8859-1', 'windows-1252']
-                df = None
-                used_encoding = None
+                    email_column = form.cleaned_data['email_column']
+                    nom_column = form.cleaned_data['nom_column']
+                    prenom_column = form.cleaned_data['prenom_column']
+
+                    # Essayer différents encodages
+                    encodings = ['utf-8-sig', 'utf-8', 'latin1', 'cp1252', 'iso-8859-1', 'windows-1252']
+                    df = None
+                    used_encoding = None
                 
-                for encoding in encodings:
-                    try:
-                        file.seek(0)  # Réinitialiser le pointeur du fichier
-                        df = pd.read_csv(file, encoding=encoding)
-                        used_encoding = encoding
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                    except Exception as e:
-                        logger.error(f"Erreur avec l'encodage {encoding}: {str(e)}")
-                        continue
+                    for encoding in encodings:
+                        try:
+                            file.seek(0)  # Réinitialiser le pointeur du fichier
+                            with span('lecture_csv', octets=file.size, encodage=encoding) as etape:
+                                df = pd.read_csv(file, encoding=encoding)
+                                etape.ajouter(lignes=len(df))
+                            used_encoding = encoding
+                            break
+                        except UnicodeDecodeError:
+                            continue
+                        except Exception as e:
+                            logger.error(f"Erreur avec l'encodage {encoding}: {str(e)}")
+                            continue
                 
-                if df is None:
-                    messages.error(request, "Impossible de lire le fichier. Veuillez vérifier l'encodage et le format du fichier.")
-                    return redirect('subscriber_import')
+                    if df is None:
+                        messages.error(request, "Impossible de lire le fichier. Veuillez vérifier l'encodage et le format du fichier.")
+                        return redirect('subscriber_import')
                 
-                logger.info(f"Fichier lu avec succès en utilisant l'encodage: {used_encoding}")
+                    logger.info(f"Fichier lu avec succès en utilisant l'encodage: {used_encoding}")
                 
-                # Vérifier que la colonne email existe
-                if email_column not in df.columns:
-                    messages.error(request, f"La colonne '{email_column}' n'existe pas dans le fichier. Colonnes disponibles: {', '.join(df.columns)}")
-                    return redirect('subscriber_import')
-
-                # Importer les abonnés
-                imported = 0
-                errors = 0
-                for index, row in df.iterrows():
-                    try:
-                        email = str(row[email_column]).strip().lower()
-                        if not email or pd.isna(email):
-                            logger.warning(f"Ligne {index + 2}: Email vide ou invalide")
-                            errors += 1
-                            continue
+                    # Vérifier que la colonne email existe
+                    if email_column not in df.columns:
+                        messages.error(request, f"La colonne '{email_column}' n'existe pas dans le fichier. Colonnes disponibles: {', '.join(df.columns)}")
+                        return redirect('subscriber_import')
+
+                    # Importer les abonnés
+                    imported = 0
+                    errors = 0
+                    debut_import = time.perf_counter()
+                    journal = journal_lot(f"Import de {file.name}")
+                    with span('insertion', lignes=len(df)):
+                        for index, row in df.iterrows():
+                            try:
+                                email = str(row[email_column]).strip().lower()
+                                if not email or pd.isna(email):
+                                    logger.warning(f"Ligne {index + 2}: Email vide ou invalide")
+                                    errors += 1
+                                    journal.compter('erreur')
+                                    continue
                             
-                        nom = str(row[nom_column]) if nom_column and nom_column in row and pd.notna(row[nom_column]) else None
-                        prenom = str(row[prenom_column]) if prenom_column and prenom_column in row and pd.notna(row[prenom_column]) else None
+                                nom = str(row[nom_column]) if nom_column and nom_column in row and pd.notna(row[nom_column]) else None
+                                prenom = str(row[prenom_column]) if prenom_column and prenom_column in row and pd.notna(row[prenom_column]) else None
                         
-                        # Créer le token de désabonnement
-                        token = hashlib.sha256(f"{email}_{datetime.now().isoformat()}".encode()).hexdigest()[:32]
+                                # Créer l'abonné (le token de désabonnement signé est dérivé de son id)
+                                subscriber, created = Subscriber.objects.get_or_create(
+                                    email=email,
+                                    defaults={
+                                        'nom': nom,
+                                        'prenom': prenom,
+                                        'statut': 'actif'
+                                    }
+                                )
                         
-                        # Créer l'abonné
-                        subscriber, created = Subscriber.objects.get_or_create(
-                            email=email,
-                            defaults={
-                                'nom': nom,
-                                'prenom': prenom,
-                                'token_desabonnement': token,
-                                'statut': 'actif'
-                            }
-                        )
-                        
-                        if created:
-                            imported += 1
-                            logger.info(f"Abonné importé: {email}")
-                        else:
-                            logger.info(f"Abonné déjà existant: {email}")
+                                if created:
+                                    imported += 1
+                                    journal.compter('importe', "Abonné importé: %s", email)
+                                else:
+                                    journal.compter('existant', "Abonné déjà existant: %s", email)
                             
-                    except Exception as e:
-                        errors += 1
-                        logger.error(f"Erreur lors de l'import de la ligne {index + 2}: {str(e)}")
-
-                messages.success(request, f'Import terminé : {imported} nouveaux abonnés, {errors} erreurs')
-                return redirect('subscriber_list')
-            except Exception as e:
-                logger.error(f"Erreur lors de l'import : {str(e)}")
-                messages.error(request, f'Erreur lors de l\'import : {str(e)}')
+                            except Exception as e:
+                                errors += 1
+                                journal.compter('erreur')
+                                logger.error(f"Erreur lors de l'import de la ligne {index + 2}: {str(e)}")
+                        journal.terminer()
+
+                    duree_import = time.perf_counter() - debut_import
+                    IMPORT_DUREE.observe(duree_import)
+                    IMPORT_LIGNES.inc(imported, resultat='importe')
+                    IMPORT_LIGNES.inc(len(df) - imported - errors, resultat='existant')
+                    IMPORT_LIGNES.inc(errors, resultat='erreur')
+                    IMPORT_DEBIT.set(len(df) / duree_import if duree_import else 0)
+
+                    messages.success(request, f'Import terminé : {imported} nouveaux abonnés, {errors} erreurs')
+                    return redirect('subscriber_list')
+                except Exception as e:
+                    logger.error(f"Erreur lors de l'import : {str(e)}")
+                    messages.error(request, f'Erreur lors de l\'import : {str(e)}')
     else:
         form = ImportSubscribersForm()
     
@@ -661,12 +878,40 @@ def subscriber_import(request):
         'form': form
     })
 
+@csrf_exempt
 def unsubscribe(request, token):
-    """Vue pour se désabonner"""
-    subscriber = get_object_or_404(Subscriber, token_desabonnement=token)
-    subscriber.statut = 'desabonne'
-    subscriber.save()
-    return render(request, 'newsletters/unsubscribe_success.html')
+    """Vue pour se désabonner : le lien (GET) affiche une confirmation, seul un POST désabonne.
+
+    Les scanners de liens des messageries suivent les GET : ils ne doivent pas désabonner.
+    Le POST vient du formulaire de confirmation ou du client mail (un clic, RFC 8058).
+    """
+    if request.method != 'POST':
+        if not token_valide(token):
+            raise Http404("Lien de désabonnement invalide")
+        return HttpResponse(page_confirmation_desabonnement())
+    if not desabonner(token):
+        raise Http404("Lien de désabonnement invalide")
+    if request.POST.get('List-Unsubscribe') == 'One-Click':
+        # List-Unsubscribe-Post : le client mail n'affiche pas la réponse
+        return HttpResponse('OK', content_type='text/plain')
+    return HttpResponse(page_desabonnement())
+
+def open_pixel(request, newsletter_id, token):
+    """Vue du pixel de suivi des ouvertures : GIF servi depuis la mémoire, événement mis en tampon"""
+    signaler_ouverture(newsletter_id, token)
+    response = HttpResponse(PIXEL_GIF, content_type='image/gif')
+    # Chaque ouverture doit atteindre le serveur
+    response['Cache-Control'] = 'no-store, no-cache, must-revalidate, private'
+    return response
+
+def click_redirect(request, code, token):
+    """Vue de redirection d'un lien suivi : URL lue en cache mémoire, clic mis en tampon"""
+    lien = resoudre_lien(code)
+    if lien is None:
+        raise Http404("Lien inconnu")
+    lien_id, newsletter_id, url = lien
+    signaler_clic(lien_id, newsletter_id, token)
+    return HttpResponseRedirect(url)
 
 class CustomLoginView(LoginView):
     form_class = CustomLoginForm